@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the import of run_jnb and of the analysis, parametrisation, reading / writing and execution of notebooks.
+
+The notebooks are generated by synthetic.synthetic_notebook, so the benchmarks
+run offline and are reproducible. For each benchmark and notebook size the
+minimum and median wall time over the repeats and the peak memory allocated by
+python (tracemalloc, measured in a separate run) are reported.
+
+Example
+-------
+    python benchmarks/run_benchmarks.py --cells 100,1000 --params 10 --output_size 0,100000 --json report.json
+"""
+
+import argparse
+import copy
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nbformat  # noqa: E402
+
+import run_jnb  # noqa: E402
+from run_jnb.analysis import _cell_summary, ipython_to_python  # noqa: E402
+from run_jnb.cache import AnalysisCache  # noqa: E402
+from run_jnb.core import _clean_nb, _parametrise_nb, _jupyter_kwargs  # noqa: E402
+from run_jnb.jnb_helper import _JupyterNotebookHelper  # noqa: E402
+from run_jnb.util import _read_nb, _write_nb, variable_status  # noqa: E402
+
+from synthetic import synthetic_notebook  # noqa: E402
+
+# seconds to import run_jnb (python startup excluded), reported by the import benchmark
+IMPORT_BUDGET = 0.5
+
+
+def bench_analysis(nb, tmp_dir):
+    """possible_parameter without any cached result."""
+    def run():
+        _cell_summary.cache_clear()
+        run_jnb.possible_parameter(nb, analysis_cache=AnalysisCache(maxsize=0))
+    return run
+
+
+def bench_analysis_cached(nb, tmp_dir):
+    """possible_parameter with the result in the analysis cache."""
+    cache = AnalysisCache()
+    run_jnb.possible_parameter(nb, analysis_cache=cache)
+    return lambda: run_jnb.possible_parameter(nb, analysis_cache=cache)
+
+
+def bench_variable_status(nb, tmp_dir):
+    """variable_status for all the code cells (the excluded names are accumulated)."""
+    sources = [ipython_to_python(cell['source']) for cell in nb['cells'] if cell['cell_type'] == 'code']
+
+    def run():
+        exclude_variable = set()
+        for source in sources:
+            _, exclude_variable, _ = variable_status(source, exclude_variable)
+    return run
+
+
+def bench_parametrisation(nb, tmp_dir):
+    """Cleaning and parametrising the notebook with all the possible parameters (cached analysis)."""
+    cache = AnalysisCache()
+    params = {p.name: p.value for p in run_jnb.possible_parameter(nb, analysis_cache=cache)}
+
+    def run():
+        new_nb = copy.deepcopy(nb)
+        _clean_nb(new_nb)
+        jnh = _JupyterNotebookHelper(new_nb, True, None, cache)
+        _parametrise_nb(new_nb, jnh, _jupyter_kwargs(None, params))
+    return run
+
+
+def bench_read(nb, tmp_dir):
+    """_read_nb of the notebook."""
+    path = os.path.join(tmp_dir, 'read.ipynb')
+    _write_nb(nb, path)
+    return lambda: _read_nb(path)
+
+
+def bench_read_no_outputs(nb, tmp_dir):
+    """_read_nb of the notebook dropping the outputs while parsing (as run_jnb reads its input)."""
+    path = os.path.join(tmp_dir, 'read.ipynb')
+    _write_nb(nb, path)
+    return lambda: _read_nb(path, outputs=False)
+
+
+def bench_write(nb, tmp_dir):
+    """_write_nb of the notebook."""
+    path = os.path.join(tmp_dir, 'write.ipynb')
+    return lambda: _write_nb(nb, path)
+
+
+def bench_write_gz(nb, tmp_dir):
+    """_write_nb of the notebook as compressed compact json (.ipynb.gz)."""
+    path = os.path.join(tmp_dir, 'write.ipynb.gz')
+    return lambda: _write_nb(nb, path)
+
+
+def bench_read_gz(nb, tmp_dir):
+    """_read_nb of the notebook written as .ipynb.gz."""
+    path = os.path.join(tmp_dir, 'read.ipynb.gz')
+    _write_nb(nb, path)
+    return lambda: _read_nb(path)
+
+
+def bench_execute(nb, tmp_dir):
+    """run_jnb of the notebook without writing it (starts a kernel)."""
+    path = os.path.join(tmp_dir, 'execute.ipynb')
+    _write_nb(nb, path)
+    return lambda: run_jnb.run_jnb(path, return_mode=False)
+
+
+def bench_import(nb, tmp_dir):
+    """import run_jnb in a new python process (python startup excluded, the notebook is not used)."""
+    script = ("import time\n"
+              "start = time.perf_counter()\n"
+              "import run_jnb\n"
+              "print(time.perf_counter() - start)")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), os.environ.get('PYTHONPATH')])))
+
+    def run():
+        output = subprocess.check_output([sys.executable, '-c', script], env=env, universal_newlines=True)
+        return float(output.splitlines()[-1])
+    return run
+
+
+BENCHMARKS = [('import', bench_import),
+              ('analysis', bench_analysis),
+              ('analysis_cached', bench_analysis_cached),
+              ('variable_status', bench_variable_status),
+              ('parametrisation', bench_parametrisation),
+              ('read', bench_read),
+              ('read_no_outputs', bench_read_no_outputs),
+              ('write', bench_write),
+              ('write_gz', bench_write_gz),
+              ('read_gz', bench_read_gz),
+              ('execute', bench_execute)]
+
+
+def measure(setup, nb, repeat):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        run = setup(nb, tmp_dir)
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            duration = run()
+            # a run in another process returns its own duration
+            times.append(duration if isinstance(duration, float) else time.perf_counter() - start)
+
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {'min_time': min(times), 'median_time': statistics.median(times), 'peak_memory': peak}
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--cells', type=_int_list, default=[100, 1000], help='comma separated numbers of code cells')
+    parser.add_argument('--params', type=_int_list, default=[10], help='comma separated numbers of parameters')
+    parser.add_argument('--output_size', type=_int_list, default=[0, 10000],
+                        help='comma separated sizes (in bytes) of the outputs per code cell')
+    parser.add_argument('--benchmark', action='append', choices=[name for name, _ in BENCHMARKS],
+                        help='benchmark to run (can be repeated). By default all except execute.')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed runs')
+    parser.add_argument('--json', default=None, help='path of the json report')
+    args = parser.parse_args()
+
+    names = args.benchmark or [name for name, _ in BENCHMARKS if name != 'execute']
+    results = []
+    print('{:<16} {:>6} {:>6} {:>11} {:>12} {:>12} {:>12}'.format(
+        'benchmark', 'cells', 'params', 'output_size', 'min [s]', 'median [s]', 'peak [MB]'))
+    for n_cells, n_params, output_size in itertools.product(args.cells, args.params, args.output_size):
+        nb = synthetic_notebook(n_cells, n_params, output_size)
+        for name, setup in BENCHMARKS:
+            if name not in names:
+                continue
+            if name == 'import' and any(result['benchmark'] == 'import' for result in results):
+                # independent of the notebook
+                continue
+            result = {'benchmark': name, 'cells': n_cells, 'params': n_params, 'output_size': output_size,
+                      **measure(setup, nb, args.repeat)}
+            results.append(result)
+            print('{benchmark:<16} {cells:>6} {params:>6} {output_size:>11} {min_time:>12.6f} '
+                  '{median_time:>12.6f} {peak:>12.3f}'.format(peak=result['peak_memory'] / 2**20, **result))
+            if name == 'import' and result['median_time'] > IMPORT_BUDGET:
+                print('import run_jnb takes more than {} s'.format(IMPORT_BUDGET))
+            sys.stdout.flush()
+
+    if args.json is not None:
+        report = {'python': platform.python_version(),
+                  'platform': platform.platform(),
+                  'run_jnb': run_jnb.__version__,
+                  'nbformat': nbformat.__version__,
+                  'repeat': args.repeat,
+                  'results': results}
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Generator of synthetic jupyter notebooks used by the benchmarks.
+"""
+
+import base64
+import hashlib
+
+import nbformat
+
+
+def synthetic_notebook(n_cells=100, n_params=10, output_size=0):
+    """
+    Generate a synthetic python 3 jupyter notebook.
+
+    The notebook is deterministic: the same arguments give the same notebook.
+
+    Parameters
+    ----------
+    n_cells : int, optional
+        Number of code cells. A markdown cell is inserted before each code cell.
+    n_params : int, optional
+        Number of possible parameters, defined one per cell in cells evenly spaced in the notebook.
+    output_size : int, optional
+        Approximate size (in bytes) of the outputs stored in each code cell
+        (half as a base64 png, half as stream text).
+
+    Returns
+    -------
+    nbformat.notebooknode.NotebookNode
+    """
+    if n_params > n_cells:
+        raise ValueError("n_params can not be larger than n_cells.")
+    nb = nbformat.v4.new_notebook()
+    nb['metadata'] = {'kernelspec': {'display_name': 'Python 3', 'language': 'python', 'name': 'python3'},
+                      'language_info': {'name': 'python', 'version': '3.6.5'}}
+
+    step = (n_cells - 1) // n_params if n_params else n_cells
+    param_cells = {1 + i * step: i for i in range(n_params)}
+    cells = [nbformat.v4.new_code_cell('%matplotlib inline\nimport math')]
+    for i in range(1, n_cells):
+        if i in param_cells:
+            j = param_cells[i]
+            source = '# parameter {0}\np{0} = {{"start": {0}, "values": [1, 2, 3]}}'.format(j)
+        else:
+            # use only the parameters already defined
+            defined = [j for k, j in param_cells.items() if k < i]
+            values = 'p{}["values"]'.format(defined[i % len(defined)]) if defined else '[1, 2, 3]'
+            source = '\n'.join(['x{} = len({})'.format(i, values),
+                                'y{0} = [math.sqrt(k) for k in range(x{0} + 10)]'.format(i),
+                                'def f{0}(a, b={0}):\n    return a + b'.format(i),
+                                'z{0} = f{0}(x{0})'.format(i)])
+        cells.append(nbformat.v4.new_code_cell(source))
+
+    nb['cells'] = []
+    for i, cell in enumerate(cells):
+        nb['cells'].append(nbformat.v4.new_markdown_cell('## Cell {}'.format(i)))
+        cell['execution_count'] = i + 1
+        cell['outputs'] = _outputs(i, output_size)
+        nb['cells'].append(cell)
+    return nb
+
+
+def _outputs(seed, output_size):
+    if output_size <= 0:
+        return []
+    n = output_size // 2
+    data = b''
+    block = str(seed).encode()
+    while len(data) < n * 3 // 4:
+        block = hashlib.sha256(block).digest()
+        data += block
+    png = base64.b64encode(data[:n * 3 // 4]).decode('ascii')
+    text = ('line {}\n'.format(seed) * (n // 8 + 1))[:n]
+    return [nbformat.v4.new_output('stream', name='stdout', text=text),
+            nbformat.v4.new_output('display_data', data={'image/png': png, 'text/plain': '<Figure>'})]
@@ -1,3 +1,31 @@
+import importlib
+
 from .core import possible_parameter, run_jnb
+from .cache import AnalysisCache, ResultCache
 __all__ = []
 __version__ = "0.1.16"
+
+# the other entry points are imported on first use, so importing the package does not
+# import asyncio, http.server or concurrent.futures
+_LAZY = {'run_jnb_many': 'sweep',
+         'run_jnb_async': 'aio',
+         'run_jnb_watch': 'watch',
+         'KernelPool': 'kernel_pool',
+         'BlobStore': 'blob_store',
+         'JobQueue': 'job_queue',
+         'ResourceScheduler': 'scheduler',
+         'NotebookServer': 'server',
+         'IncrementalSession': 'incremental',
+         'Pipeline': 'pipeline'}
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    value = getattr(importlib.import_module('.' + _LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import functools
+
+from .core import _DEFAULT_TIMEOUT, _DEFAULT_KERNEL_NAME, _prepare_nb, _start_run, \
+ _execution_error, _finish_run, _check_collect, _variable_collector, \
+ _check_profile, _cell_profiler, _finish_profile
+
+
+async def run_jnb_async(input_path, output_path=r"///_run_jnb/*-output",
+                        execution_path=r'///input',
+                        return_mode='except',
+                        overwrite=False,
+                        timeout=_DEFAULT_TIMEOUT,
+                        kernel_name=_DEFAULT_KERNEL_NAME,
+                        ep_kwargs=None, jsonable_parameter=True, end_cell_index=None, arg=None,
+                        kernel_pool=None, analysis_cache=None, checkpoint=None, blob_store=None,
+                        targets=None, collect=None, profile=None, profile_stats=False,
+                        param_store=None, timing=False, **kwargs):
+    """
+    Asynchronous version of run_jnb.
+
+    The notebook is executed using the asynchronous kernel client of nbclient, so
+    many notebooks can be executed concurrently by a single event loop. Reading,
+    analysing and writing the notebooks (including the checkpoints and the blobs) is
+    done in the default executor of the loop.
+    The coroutine can be cancelled (e.g. by asyncio.wait_for) and in this case the kernel is shutdown.
+
+    Parameters
+    ----------
+    The parameters are the same as for run_jnb (except result_cache and input_files).
+    ep_kwargs are the keyword arguments accepted by nbclient.NotebookClient.
+
+    Returns
+    -------
+    collections.namedtuple
+        See run_jnb.
+    """
+    loop = asyncio.get_running_loop()
+    nb, output_path, execution_path, ep_kwargs = await loop.run_in_executor(None, functools.partial(
+        _prepare_nb, input_path, output_path, execution_path, return_mode, ep_kwargs,
+        jsonable_parameter, end_cell_index, arg, kwargs, analysis_cache, targets, param_store))
+    _check_collect(collect)
+    _check_profile(profile)
+    output_path, cell_hooks, checkpointer, instrumentation = await loop.run_in_executor(
+        None, functools.partial(_start_run, nb, output_path, return_mode, overwrite, checkpoint,
+                                blob_store, timing))
+    # the checkpoints and the blobs are written without blocking the loop
+    cell_hooks = [_ExecutorHook(hook) if hook is checkpointer or hook is blob_store else hook
+                  for hook in cell_hooks]
+    collector = _variable_collector(cell_hooks, collect)
+
+    error = (None, None, None, None)
+    if return_mode == 'parametrised_only':
+        return await loop.run_in_executor(None, functools.partial(
+            _finish_run, nb, output_path, return_mode, overwrite, False, error))
+
+    profiler = _cell_profiler(cell_hooks, profile, profile_stats)
+
+    from nbconvert.preprocessors.execute import CellExecutionError
+
+    catch_except = False
+    try:
+        await _async_execute(nb, execution_path, cell_hooks, timeout, kernel_name,
+                             ep_kwargs, kernel_pool)
+    except CellExecutionError:
+        catch_except = True
+        error = _execution_error(nb)
+    except:
+        if checkpointer is not None:
+            await loop.run_in_executor(None, checkpointer.write)
+        _finish_profile(profiler, None)
+        raise
+
+    return await loop.run_in_executor(None, functools.partial(
+        _finish_run, nb, output_path, return_mode, overwrite, catch_except, error,
+        checkpointer, instrumentation, collector, profiler))
+
+
+async def _async_execute(nb, execution_path, cell_hooks, timeout, kernel_name, ep_kwargs,
+                         kernel_pool=None):
+    from .execute import _NotebookClient
+
+    resources = {'metadata': {'path': execution_path}}
+    if kernel_pool is None:
+        client = _NotebookClient(nb, cell_hooks=cell_hooks, timeout=timeout,
+                                 kernel_name=kernel_name, resources=resources, **ep_kwargs)
+        await _cancellable(client.async_execute())
+        return
+
+    loop = asyncio.get_running_loop()
+    kernel_name = kernel_name or nb['metadata'].get('kernelspec', {}).get('name', 'python3')
+    km = await loop.run_in_executor(None, kernel_pool.acquire, kernel_name, execution_path)
+    try:
+        client = _NotebookClient(nb, km=km, cell_hooks=cell_hooks, timeout=timeout,
+                                 kernel_name=kernel_name, resources=resources, **ep_kwargs)
+        try:
+            await _cancellable(client.async_execute())
+        except asyncio.CancelledError:
+            # stop the cell still running in the kernel before giving it back
+            await km.interrupt_kernel()
+            raise
+        finally:
+            # the kernel is owned by the pool, only the client is closed
+            if client.kc is not None:
+                client.kc.stop_channels()
+                client.kc = None
+    finally:
+        await loop.run_in_executor(None, kernel_pool.release, kernel_name, km)
+
+
+class _ExecutorHook:
+    """Cell hook running the blocking work of a hook after each cell in the default executor."""
+    def __init__(self, hook):
+        self.hook = hook
+
+    async def async_pre_cell(self, client, cell, cell_index):
+        await self.hook.async_pre_cell(client, cell, cell_index)
+
+    async def async_post_cell(self, client, cell, cell_index):
+        await asyncio.get_running_loop().run_in_executor(None, self.hook._post_cell, cell)
+
+
+async def _cancellable(coro):
+    # nbclient reports a cancelled cell execution as a dead kernel, so the execution
+    # runs in a separate task which is cancelled (and awaited for the cleanup of the
+    # kernel) when the caller is cancelled
+    task = asyncio.ensure_future(coro)
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        task.cancel()
+        try:
+            await task
+        except BaseException:
+            pass
+        raise
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import copy
+import functools
+import warnings
+
+from .util import sort_dict, _variable_summary, _def_use
+
+
+@functools.lru_cache(maxsize=None)
+def _transformer_manager():
+    try:
+        from IPython.core.inputtransformer2 import TransformerManager
+    except ImportError:
+        try:
+            from IPython.core.inputsplitter import IPythonInputSplitter as TransformerManager
+        except ImportError:
+            warnings.warn("IPython is needed to transform IPython syntax to pure Python."
+                          " Install ipython if you need this functionality.")
+            return None
+    return TransformerManager()
+
+
+def ipython_to_python(source: str) -> str:
+    """
+    Transform the IPython syntax (magics, shell commands, ...) of a cell source to pure python.
+
+    The transformation is the same as the one used by nbconvert.PythonExporter.
+
+    Parameters
+    ----------
+    source : str
+        Source of a code cell.
+
+    Returns
+    -------
+    str
+        Python code.
+
+    >>> ipython_to_python("%matplotlib inline\\na = 1\\n")
+    "get_ipython().run_line_magic('matplotlib', 'inline')\\na = 1\\n"
+    """
+    transformer_manager = _transformer_manager()
+    if transformer_manager is None:
+        return source
+    return transformer_manager.transform_cell(source)
+
+
+@functools.lru_cache(maxsize=4096)
+def _cell_summary(source: str, jsonable_parameter: bool) -> tuple:
+    return _variable_summary(ipython_to_python(source), jsonable_parameter)
+
+
+def _cell_index_of_possible_param(cells, jsonable_parameter=True, end_cell_index=None) -> tuple:
+    """
+    Find the possible parameters from the cells of a jupyter notebook.
+
+    The cells are analysed one by one based on their sources, without building a
+    notebook per cell, and the set of names to exclude is updated in place.
+    The summary of a cell is cached by its source, so only new or changed cells are parsed.
+
+    Parameters
+    ----------
+    cells : list
+        Cells of a jupyter notebook.
+    jsonable_parameter : bool, optional
+        Consider only jsonable parameters.
+    end_cell_index : int, optional
+        End cell index used to slice the notebook in finding the possible parameters.
+
+    Returns
+    -------
+    tuple
+        (collections.OrderedDict {parameter name: cell index} ordered by the cell index,
+        dict {parameter name: parameter value})
+
+    >>> cells = [{'cell_type': 'code', 'source': 'a = 1'}, {'cell_type': 'markdown', 'source': ''},
+    ...          {'cell_type': 'code', 'source': 'b = a'}]
+    >>> _cell_index_of_possible_param(cells)
+    (OrderedDict([('a', 0)]), {'a': 1})
+    """
+    index_of_params = {}
+    exclude_variable = set()
+    param_value = {}
+    for i, cell in enumerate(cells[:end_cell_index]):
+        if cell['cell_type'] == 'code':
+            assign_only, store_variable_name, cell_exclude_variable, dict_parameter = \
+                _cell_summary(cell['source'], jsonable_parameter)
+            exclude_variable |= cell_exclude_variable
+            if assign_only is True:
+                for param in store_variable_name - exclude_variable:
+                    if param not in index_of_params:
+                        index_of_params[param] = i
+                    if jsonable_parameter is True:
+                        param_value[param] = copy.deepcopy(dict_parameter[param])
+            exclude_variable |= store_variable_name
+
+    return sort_dict(index_of_params, by='value'), param_value
+
+
+@functools.lru_cache(maxsize=4096)
+def _cell_def_use(source: str) -> tuple:
+    return _def_use(ipython_to_python(source))
+
+
+# pseudo name (not an identifier) of the state outside the namespace: files, working
+# directory, sys.path, environment variables, random generators of the modules, ...
+_STATE = '<state>'
+
+
+def _state_access(summary, imported) -> tuple:
+    # (reads the state, writes the state) for the summary of a cell, see util._def_use
+    _, mutate, _, _, effect = summary
+    writes = effect == 'side_effect' or bool(mutate & imported)
+    return writes or effect is not None, writes
+
+
+def _required_cells(cells, targets) -> set:
+    """
+    Indices of the code cells needed to execute the target cells or to compute the target variables.
+
+    A cell depends on the cells defining or mutating the names it uses, back to the last
+    cell binding them again without using them (see util._def_use). A cell calling a
+    function or importing a module may read the state outside the namespace, so it also
+    depends on all the previous cells which may write it: the cells with side effects (shell
+    commands, safe magics, calls made for their effect like df.to_csv(path)) and the cells
+    calling or mutating an imported module (e.g. np.random.seed(0), os.chdir(path),
+    sys.path.append(path)). If an opaque cell is before a needed cell, all the code cells up
+    to the last needed one are needed.
+
+    Parameters
+    ----------
+    cells : list
+        Cells of a jupyter notebook.
+    targets : list
+        Cell indices (int) and variable names (str, whose value at the end of the notebook is needed).
+
+    Returns
+    -------
+    set
+
+    >>> cells = [{'cell_type': 'code', 'source': s} for s in ['a = 1', 'b = 2', 'c = a + 1', 'a += c']]
+    >>> sorted(_required_cells(cells, [2])), sorted(_required_cells(cells, ['a'])), sorted(_required_cells(cells, ['b']))
+    ([0, 2], [0, 2, 3], [1])
+    """
+    code_cells = [i for i, cell in enumerate(cells)
+                  if cell['cell_type'] == 'code' and cell['source'].strip() != '']
+    summaries = {i: _cell_def_use(cells[i]['source']) for i in code_cells}
+    imported = set().union(*[summary[3] for summary in summaries.values()])
+    state_access = {i: _state_access(summaries[i], imported) for i in code_cells}
+
+    def definers(name, end):
+        # cells before end giving its value to name
+        if name == _STATE:
+            return [i for i in code_cells if i < end and state_access[i][1]]
+        res = []
+        for i in reversed([i for i in code_cells if i < end]):
+            define, mutate, use, _, _ = summaries[i]
+            if name in define or (name in mutate and name not in imported):
+                res.append(i)
+                if name in define and name not in use:
+                    break
+        return res
+
+    stack = []
+    for target in targets:
+        if isinstance(target, int):
+            if target not in summaries:
+                raise ValueError('The target cell {} is not a non-empty code cell.'.format(target))
+            stack.append(target)
+        else:
+            target_cells = definers(target, len(cells))
+            if target_cells == []:
+                raise ValueError('The target variable {} is not defined by any cell.'.format(target))
+            stack.extend(target_cells)
+    if stack == []:
+        return set()
+
+    required = set()
+    while stack:
+        i = stack.pop()
+        if i in required:
+            continue
+        required.add(i)
+        define, mutate, use, _, _ = summaries[i]
+        for name in use | mutate | ({_STATE} if state_access[i][0] else set()):
+            stack.extend(definers(name, i))
+        last = max(required)
+        if any(summaries[j][4] == 'opaque' for j in code_cells if j <= last):
+            return {j for j in code_cells if j <= last}
+    return required
+
+
+def _incremental_cells(old_cells, new_cells):
+    """
+    Indices of the code cells to execute again after the cells of an executed notebook changed.
+
+    The namespace of the kernel is the one obtained by executing all the old cells. A cell
+    is executed again if it changed, if it uses or writes (defines or mutates) a name
+    written by a cell executed again before it, or if a cell executed again needs the value
+    a name had before it (e.g. the cell mutates the name) but the namespace holds a value
+    written by itself or a later cell. The state outside the namespace is handled as a name
+    read and written by the cells as described in _required_cells, e.g. all the cells calling
+    a function after a changed np.random.seed(s) are executed again.
+
+    Parameters
+    ----------
+    old_cells : list
+        Cells executed in the kernel.
+    new_cells : list
+        New version of the cells (e.g. with other parameters).
+
+    Returns
+    -------
+    set
+        None if the notebook should be executed again from a reset namespace, i.e. the
+        number or the types of the cells changed or a cell can not be analysed (see util._def_use).
+
+    >>> old_cells = [{'cell_type': 'code', 'source': s} for s in ['a = 1', 'b = 2', 'c = a + 1', 'd = b']]
+    >>> new_cells = [{'cell_type': 'code', 'source': s} for s in ['a = 5', 'b = 2', 'c = a + 1', 'd = b']]
+    >>> sorted(_incremental_cells(old_cells, new_cells))
+    [0, 2]
+    """
+    if [cell['cell_type'] for cell in old_cells] != [cell['cell_type'] for cell in new_cells]:
+        return None
+    code_cells = [i for i, cell in enumerate(new_cells)
+                  if cell['cell_type'] == 'code' and
+                  (cell['source'].strip() != '' or old_cells[i]['source'].strip() != '')]
+    changed = {i for i in code_cells if new_cells[i]['source'] != old_cells[i]['source']}
+    if changed == set():
+        return set()
+
+    summaries = {i: [_cell_def_use(cells[i]['source']) for cells in (old_cells, new_cells)]
+                 for i in code_cells}
+    if any(summary[4] == 'opaque' for i in code_cells for summary in summaries[i]):
+        return None
+    imported = set().union(*[summary[3] for i in code_cells for summary in summaries[i]])
+    state_access = {i: [_state_access(summary, imported) for summary in summaries[i]]
+                    for i in code_cells}
+    # the old and new names written by a cell are overwritten by its new execution
+    writes = {i: set().union(*[summary[0] | (summary[1] - imported) for summary in summaries[i]]) |
+              ({_STATE} if any(access[1] for access in state_access[i]) else set())
+              for i in code_cells}
+    reads = {i: summaries[i][1][2] | (summaries[i][1][1] - imported) |
+             ({_STATE} if state_access[i][1][0] else set()) for i in code_cells}
+    writers = collections.defaultdict(list)
+    for i in code_cells:
+        for name in writes[i]:
+            writers[name].append(i)
+
+    affected = set(changed)
+    while True:
+        dirty = set()
+        for i in code_cells:
+            if i in affected or (reads[i] | writes[i]) & dirty:
+                affected.add(i)
+                dirty |= writes[i]
+
+        stale = set()
+        for i in affected:
+            for name in reads[i]:
+                before = [j for j in writers[name] if j < i]
+                if before and before[-1] not in affected and writers[name][-1] >= i:
+                    stale.add(before[-1])
+        if stale == set():
+            return affected
+        affected |= stale
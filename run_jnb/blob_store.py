@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+import copy
+import hashlib
+import json
+import os
+import re
+
+from .util import _read_nb, _write_atomic
+
+_STREAM_REFERENCE = '[run_jnb blob sha256:{}]\n'
+_STREAM_REFERENCE_RE = re.compile(r'^\[run_jnb blob sha256:([0-9a-f]{64})\]\n$')
+
+
+class BlobStore:
+    """
+    Content-addressed store of the large outputs of executed notebooks.
+
+    Used as run_jnb(..., blob_store=...), the outputs of each code cell are
+    offloaded as soon as the cell is executed: every mime data of a display_data /
+    execute_result output and every stream text with a json representation larger than
+    threshold characters is written to blob_dir under its sha256 and replaced in the
+    notebook by a reference. The references of the mime data are kept in the output
+    metadata under "run_jnb" and a stream text is replaced by "[run_jnb blob sha256:<hash>]".
+    Identical outputs (e.g. the same plot in many runs) are stored once.
+
+    Used as run_jnb(..., param_store=...), the parameters larger than threshold
+    characters are written to blob_dir and loaded by the parameter cell from there.
+
+    Parameters
+    ----------
+    blob_dir : str
+        Folder of the blobs.
+    threshold : int, optional
+        Minimum size (in characters) of the offloaded outputs.
+    """
+    def __init__(self, blob_dir, threshold=100000):
+        self.blob_dir = blob_dir
+        self.threshold = threshold
+
+    def put(self, value) -> str:
+        """Store a json serialisable value and return its key (sha256 of its json representation)."""
+        text = json.dumps(value)
+        key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        path = self.path(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _write_atomic(path, text)
+        return key
+
+    def get(self, key):
+        """Value stored under key."""
+        with open(self.path(key), 'r', encoding='UTF-8') as f:
+            return json.load(f)
+
+    def path(self, key):
+        """Path of the value stored under key."""
+        return os.path.join(self.blob_dir, key[:2], key)
+
+    def offload(self, outputs):
+        """Replace in place the large outputs of a cell by references."""
+        for output in outputs:
+            if output['output_type'] == 'stream':
+                if len(json.dumps(output['text'])) > self.threshold:
+                    output['text'] = _STREAM_REFERENCE.format(self.put(output['text']))
+            elif output['output_type'] in ('display_data', 'execute_result'):
+                for mime in list(output['data']):
+                    value = output['data'][mime]
+                    if len(json.dumps(value)) > self.threshold:
+                        metadata = output.setdefault('metadata', {})
+                        blobs = metadata.setdefault('run_jnb', {}).setdefault('blobs', {})
+                        blobs[mime] = self.put(value)
+                        del output['data'][mime]
+
+    def rehydrate(self, nb):
+        """
+        Notebook with the references to the offloaded outputs replaced by their values.
+
+        Parameters
+        ----------
+        nb : str, nbformat.notebooknode.NotebookNode
+            Jupyter notebook path or its content as a NotebookNode object (not modified).
+
+        Returns
+        -------
+        nbformat.notebooknode.NotebookNode
+        """
+        if isinstance(nb, str):
+            nb = _read_nb(nb)
+        else:
+            nb = copy.deepcopy(nb)
+        for cell in nb['cells']:
+            for output in cell.get('outputs', []):
+                if output['output_type'] == 'stream':
+                    match = _STREAM_REFERENCE_RE.match(output['text'])
+                    if match is not None:
+                        output['text'] = self.get(match.group(1))
+                elif output['output_type'] in ('display_data', 'execute_result'):
+                    metadata = output.get('metadata', {})
+                    for mime, key in metadata.get('run_jnb', {}).pop('blobs', {}).items():
+                        output['data'][mime] = self.get(key)
+                    if metadata.get('run_jnb') == {}:
+                        del metadata['run_jnb']
+        return nb
+
+    async def async_pre_cell(self, client, cell, cell_index):
+        pass
+
+    async def async_post_cell(self, client, cell, cell_index):
+        self._post_cell(cell)
+
+    def _post_cell(self, cell):
+        if cell['cell_type'] == 'code':
+            self.offload(cell['outputs'])
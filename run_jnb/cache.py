@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import hashlib
+import json
+import os
+import threading
+
+from .util import _read_nb, _write_nb, _write_atomic
+
+
+class AnalysisCache:
+    """
+    Cache of the possible parameters found in jupyter notebooks.
+
+    The results are keyed by a hash of the code cells (and the analysis options),
+    so the same notebook is analysed only once. The cache has an in-memory least
+    recently used layer and an optional on-disk layer.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Maximum number of results kept in memory.
+    cache_dir : str, optional
+        Folder of the on-disk layer (e.g. "_run_jnb/.analysis_cache").
+        If None the results are kept only in memory.
+
+    >>> cache = AnalysisCache(maxsize=1)
+    >>> cache.set('a', 1)
+    >>> cache.set('b', 2)
+    >>> cache.get('a') is None, cache.get('b')
+    (True, 2)
+    """
+    def __init__(self, maxsize=128, cache_dir=None):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return self._data[key]
+        if self.cache_dir is not None:
+            try:
+                with open(self._path(key), 'r') as f:
+                    value = json.load(f)
+            except (OSError, ValueError):
+                return None
+            self._set_memory(key, value)
+            return value
+        return None
+
+    def set(self, key, value):
+        self._set_memory(key, value)
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            _write_atomic(self._path(key), json.dumps(value))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+        if self.cache_dir is not None and os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+    def _set_memory(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+
+def _analysis_key(nb, jsonable_parameter, end_cell_index) -> str:
+    """
+    Hash of the notebook content relevant for finding the possible parameters.
+    """
+    metadata = nb['metadata']
+    content = [metadata.get('kernelspec', {}).get('language'),
+               metadata.get('language_info', {}).get('version'),
+               jsonable_parameter, end_cell_index,
+               [(cell['cell_type'], cell['source'] if cell['cell_type'] == 'code' else '')
+                for cell in nb['cells']]]
+    return hashlib.sha256(json.dumps(content).encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """
+    On-disk cache of the results of executed notebooks.
+
+    The results are keyed by a hash of the cleaned and parametrised notebook, the
+    kernel name, the other execution parameters and the content of the input files
+    declared by the user, so running again the same notebook with the same parameters
+    returns the stored output notebook and output without starting a kernel.
+    The runs stopped by an error are not stored (see run_jnb).
+    If the total size of the stored results exceeds max_size, the least recently
+    used ones are removed.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Folder of the cache (e.g. "_run_jnb/.result_cache").
+    max_size : int, optional
+        Maximum total size (in bytes) of the stored results. If None the size is not bounded.
+    """
+    def __init__(self, cache_dir, max_size=None):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def get(self, key):
+        """
+        Stored result or None.
+
+        Returns
+        -------
+        tuple
+            (executed notebook, dict of the output fields without output_nb_path)
+        """
+        try:
+            with open(self._path(key, '.json'), 'r') as f:
+                entry = json.load(f)
+            nb = _read_nb(self._path(key, '.ipynb'))
+            # the modification time orders the results by their last use
+            os.utime(self._path(key, '.json'))
+        except (OSError, ValueError):
+            return None
+        output = entry['output']
+        if output['slowest_cells'] is not None:
+            output['slowest_cells'] = [tuple(el) for el in output['slowest_cells']]
+        return nb, output
+
+    def set(self, key, nb, output, input_path=None, input_files=None):
+        """
+        Store the executed notebook and its output (collections.namedtuple returned by run_jnb).
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # the collected variables are not cached (see run_jnb collect)
+        entry = {'output': {k: v for k, v in output._asdict().items() if k not in ('output_nb_path', 'variables')},
+                 'paths': [os.path.abspath(path) for path in [input_path] + list(input_files or [])
+                           if path is not None]}
+        _write_nb(nb, self._path(key, '.ipynb'), atomic=True)
+        _write_atomic(self._path(key, '.json'), json.dumps(entry))
+        if self.max_size is not None:
+            self._evict()
+
+    def invalidate(self, path=None):
+        """
+        Remove the results of the notebook or depending on the input file given by path (all if None).
+        """
+        if path is not None:
+            path = os.path.abspath(path)
+        for key, entry_path in self._entries():
+            if path is not None:
+                try:
+                    with open(entry_path, 'r') as f:
+                        paths = json.load(f)['paths']
+                except (OSError, ValueError, KeyError):
+                    paths = []
+                if path not in paths:
+                    continue
+            self._remove(key)
+
+    def clear(self):
+        """Remove all the results."""
+        self.invalidate()
+
+    def _entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return [(name[:-5], os.path.join(self.cache_dir, name))
+                for name in os.listdir(self.cache_dir)
+                if name.endswith('.json') and not name.startswith('.')]
+
+    def _evict(self):
+        entries = []
+        total_size = 0
+        for key, entry_path in self._entries():
+            try:
+                size = os.path.getsize(entry_path) + os.path.getsize(self._path(key, '.ipynb'))
+                entries.append((os.path.getmtime(entry_path), key, size))
+            except OSError:
+                continue
+            total_size += size
+        for _, key, size in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            self._remove(key)
+            total_size -= size
+
+    def _remove(self, key):
+        # the result is not available as soon as the json file is removed
+        for ext in ['.json', '.ipynb']:
+            try:
+                os.remove(self._path(key, ext))
+            except FileNotFoundError:
+                pass
+
+    def _path(self, key, ext):
+        return os.path.join(self.cache_dir, key + ext)
+
+
+def _result_key(nb, kernel_name, ep_kwargs, input_files=None, execution_path='.', timeout=None,
+                blob_store=None, timing=False) -> str:
+    """
+    Hash of the notebook, the execution parameters and the content of the input files.
+
+    The execution path (the notebook may read relative paths), the timeout (a run finished
+    within a timeout may not within a smaller one), the folder and the threshold of the blob
+    store (the stored notebook refers to the offloaded outputs) and timing (the cell metadata)
+    are part of the key. The parameters loaded from a param store are part of the notebook by
+    the hash of their content, and a checkpoint does not change the result.
+    """
+    files = []
+    for path in sorted(input_files or []):
+        try:
+            files.append([path, _file_digest(path)])
+        except FileNotFoundError:
+            files.append([path, None])
+    store = None if blob_store is None else [os.path.abspath(blob_store.blob_dir), blob_store.threshold]
+    content = [nb, kernel_name, ep_kwargs, files, os.path.abspath(execution_path), timeout, store, timing]
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=repr).encode('utf-8')).hexdigest()
+
+
+def _file_digest(path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+_default_analysis_cache = AnalysisCache()
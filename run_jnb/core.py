@@ -3,17 +3,31 @@
 import collections
 import json
 import os
-
-from nbconvert.preprocessors import ExecutePreprocessor
-from nbconvert.preprocessors.execute import CellExecutionError
+import shutil
+import tempfile
 
 from .util import _read_nb, _write_nb, sort_dict, group_dict_by_value, \
  decode_json, kwargs_to_variable_assignment, _mark_auto_generated_code, \
- increment_name
+ _reserve_path, _split_ext, _NB_EXTENSIONS
 from .jnb_helper import _JupyterNotebookHelper
+from .cache import _result_key
+from .analysis import _required_cells
+
+# defaults of nbconvert.preprocessors.ExecutePreprocessor, repeated here so that
+# nbconvert (and the kernel client) is imported only if a notebook is executed
+_DEFAULT_TIMEOUT = None
+_DEFAULT_KERNEL_NAME = ''
+
+Output = collections.namedtuple('Output', ['output_nb_path', 'error_prompt_number',
+                                           'error_type', 'error_value',
+                                           'error_traceback', 'total_time',
+                                           'kernel_startup_time', 'slowest_cells',
+                                           'variables'])
+Output.__new__.__defaults__ = (None, None, None, None)
 
 
-def possible_parameter(nb, jsonable_parameter=True, end_cell_index=None):
+def possible_parameter(nb, jsonable_parameter=True, end_cell_index=None,
+                       analysis_cache=None):
     """
     Find the possible parameters from a jupyter notebook (python3 only).
 
@@ -33,6 +47,8 @@ def possible_parameter(nb, jsonable_parameter=True, end_cell_index=None):
         Consider only jsonable parameters.
     end_cell_index : int, optional
         End cell index used to slice the notebook in finding the possible parameters.
+    analysis_cache : run_jnb.AnalysisCache, optional
+        Cache of the possible parameters. If None an in-memory cache shared by the process is used.
 
     Returns
     -------
@@ -40,7 +56,7 @@ def possible_parameter(nb, jsonable_parameter=True, end_cell_index=None):
         If jsonable_parameter is true the fields are ('name','value','cell_index'), otherwise ('name', 'cell_index').
         The list is ordered by the name of the parameters.
     """
-    jh = _JupyterNotebookHelper(nb, jsonable_parameter, end_cell_index)
+    jh = _JupyterNotebookHelper(nb, jsonable_parameter, end_cell_index, analysis_cache)
 
     if jsonable_parameter is True:
         PossibleParameter=collections.namedtuple('PossibleParameter',['name','value','cell_index'])
@@ -61,9 +77,13 @@ def run_jnb(input_path, output_path=r"///_run_jnb/*-output",
             execution_path=r'///input',
             return_mode='except',
             overwrite=False,
-            timeout=ExecutePreprocessor.timeout.default_value,
-            kernel_name=ExecutePreprocessor.kernel_name.default_value,
-            ep_kwargs=None, jsonable_parameter=True, end_cell_index=None, arg=None, **kwargs):
+            timeout=_DEFAULT_TIMEOUT,
+            kernel_name=_DEFAULT_KERNEL_NAME,
+            ep_kwargs=None, jsonable_parameter=True, end_cell_index=None, arg=None,
+            kernel_pool=None, analysis_cache=None, checkpoint=None,
+            result_cache=None, input_files=None, blob_store=None, targets=None, collect=None,
+            profile=None, profile_stats=False, param_store=None, timing=False,
+            **kwargs):
     """
     Run an input jupyter notebook file and optionally (python3 only)
     parametrise it.
@@ -80,13 +100,16 @@ def run_jnb(input_path, output_path=r"///_run_jnb/*-output",
     Parameters
     ----------
     input_path : str
-        Path of the input jupyter notebook.
+        Path of the input jupyter notebook (".ipynb" or compressed ".ipynb.gz" / ".ipynb.zst").
     output_path : str, optional
         Path of the output jupyter notebook.
         One can use the input_path location as relative path by starting with "///" .
         * can be used once in the beggining or end (excluding the ".ipynb" extension) as a wildcard of the input_path filename.
         "///_run_jnb/*-output" is the default value and states that the output
         is in the run_jnb folder with respect to the input_path directory and "-output" is appended to the input name.
+        Without extension the output has the extension of the input. A ".ipynb.gz" (or ".ipynb.zst",
+        which needs zstandard) output is written as compressed compact json, much smaller and faster
+        to write for the outputs read by programs.
     execution_path : str, optional
         The path of the folder where to execute the notebook.
         r'///input' or r'///output' can be used to denote the input / output folder.
@@ -95,7 +118,9 @@ def run_jnb(input_path, output_path=r"///_run_jnb/*-output",
         Flag to write the generated notebook to the output_path: "parametrised_only" writes the generated notebook without executing it, "except" writes in case of an exception, True writes always, False writes never.
     overwrite : bool, optional
         Flag to overwrite or not the output_path. If the parameter is False
-        the used output_path will be incremented until a valid one is found.
+        and the output_path exists, the index after the highest one in use is appended
+        to its name (e.g. "-output (3).ipynb"). The path is reserved atomically,
+        so concurrent runs never write the same file.
     timeout : int, optional
         ExecutePreprocessor.timeout
     kernel_name : str, optional
@@ -109,23 +134,133 @@ def run_jnb(input_path, output_path=r"///_run_jnb/*-output",
     arg : str
         Path of a json file (it should end in ".json") or json formatted string used to parametrise the jupyter notebook.
         It should containt json objects. It is decoded into python objects following https://docs.python.org/3.6/library/json.html#json-to-py-table .
+    kernel_pool : run_jnb.KernelPool, optional
+        Pool of started kernels used to execute the notebook instead of starting a new kernel.
+    analysis_cache : run_jnb.AnalysisCache, optional
+        Cache of the possible parameters. If None an in-memory cache shared by the process is used.
+    checkpoint : float, optional
+        If not None, the output notebook is written (atomically) also during the execution,
+        after a cell if at least checkpoint seconds passed since the last write (0 to write after each cell).
+        The time spent writing is bounded to a small fraction of the execution time.
+        The output_path is determined before the execution and the file is removed at the end if return_mode does not require it.
+    result_cache : run_jnb.ResultCache, optional
+        Cache of the executed notebooks. If the same notebook was already executed with the same parameters,
+        kernel_name, ep_kwargs and input_files content, the stored notebook and output are returned without execution.
+        Only the runs without error are stored, so a failed run (e.g. a transient error) is executed again.
+    input_files : list, optional
+        Paths of the files read by the notebook. Their content is part of the result_cache key.
+    blob_store : run_jnb.BlobStore, optional
+        Store where the large outputs are offloaded after the execution of each cell.
+        The notebook keeps references to the offloaded outputs (see BlobStore.rehydrate).
+    targets : list, optional
+        Cell indices (int) and variable names (str) needed from the execution (python3 only).
+        Only the code cells they depend on (found from the names each cell defines and uses)
+        are executed, the other ones are marked in their metadata by "run_jnb": {"skipped": true}.
+        A needed cell calling functions also needs the previous cells which may change the state
+        outside the namespace (e.g. np.random.seed, os.chdir, df.to_csv). If a needed cell follows a cell whose effects can not be analysed (e.g. exec, star import
+        or most of the magics), all the code cells up to the last needed one are executed.
+    collect : list, optional
+        Names of the kernel variables returned in the output after the execution (or after the
+        cell stopping it), so the output notebook does not have to be written and read again.
+        The values are json serialisable objects or numpy arrays (loaded by the caller from a
+        temporary .npy file). It can not be used with result_cache.
+    profile : bool or list, optional
+        If True (or a list of code cell indices), each executed code cell (or each listed one) is
+        executed under cProfile inside the kernel (python3 only) and the functions with the largest
+        cumulative time are stored in the cell metadata under "run_jnb": {"profile": [[function,
+        number of calls, total time, cumulative time], ...]}. It can not be used with result_cache.
+    profile_stats : bool, optional
+        With profile, write the statistics of the profiled cells next to the output notebook, at
+        the output path with the ".prof" extension (pstats format, e.g. for snakeviz). The
+        statistics are written only if the output notebook is written (see return_mode).
+    param_store : run_jnb.BlobStore, optional
+        Store where the parameters whose representation is larger than its threshold (in characters)
+        are written as json. Instead of their representation, the parameter cell loads them from the
+        store (by json.load with a path relative to the execution path), so large parameters do not
+        bloat the notebook and are not parsed by the kernel as code.
+    timing : bool, optional
+        If True, for each executed code cell the wall time, the increase of the peak resident
+        memory of the kernel (queried by one more request to the kernel after each cell) and the
+        size of the outputs are stored in the cell metadata under "run_jnb", and the output
+        contains the summary of the execution (see Returns).
     kwargs:
         json serialsable keyword arguments used to parametrise the jupyter notebook.
 
     Returns
     -------
     collections.namedtuple
-        The fields are ('output_nb_path', 'error_prompt_number','error_type','error_value','error_traceback').
+        The fields are ('output_nb_path', 'error_prompt_number','error_type','error_value','error_traceback',
+        'total_time', 'kernel_startup_time', 'slowest_cells', 'variables').
         If the generated file is written the output path is returned otherwise None.
         If an error is catched the details are return otherwise None.
+        If the notebook is executed with timing, the total time and the kernel startup time (in seconds)
+        are returned and slowest_cells is a list of (cell index, wall time) for the five slowest cells,
+        otherwise None.
+        variables is the dictionary {name: value} of the collected variables, otherwise None.
         """
 
-    if os.path.splitext(input_path)[1] != '.ipynb':
-        raise ValueError("The extension of input_path = '{}' is not '.ipynb'".format(input_path))
+    nb, output_path, execution_path, ep_kwargs = _prepare_nb(
+        input_path, output_path, execution_path, return_mode, ep_kwargs,
+        jsonable_parameter, end_cell_index, arg, kwargs, analysis_cache, targets, param_store)
+    _check_collect(collect, result_cache)
+    _check_profile(profile, result_cache)
+    return _run_nb(nb, output_path, execution_path, return_mode, overwrite,
+                   timeout, kernel_name, ep_kwargs, kernel_pool, checkpoint,
+                   result_cache, input_files, input_path, blob_store, collect,
+                   profile, profile_stats, timing)
+
+
+def _prepare_nb(input_path, output_path, execution_path, return_mode, ep_kwargs,
+                jsonable_parameter, end_cell_index, arg, kwargs, analysis_cache, targets=None,
+                param_store=None):
+    _check_input_path(input_path)
+    output_path = _output_path(input_path, output_path)
+    execution_path = _execution_path(input_path, execution_path)
+
+    if ep_kwargs is None:
+        ep_kwargs = {}
+
+    if return_mode not in ['parametrised_only', 'except', True, False]:
+        raise TypeError("return mode is not valid!")
+
+    jupyter_kwargs = _jupyter_kwargs(arg, kwargs)
+    nb = _read_nb(input_path, outputs=False)
+    _clean_nb(nb)
+
+    if jupyter_kwargs != {}:
+        jnh = _JupyterNotebookHelper(nb, jsonable_parameter, end_cell_index, analysis_cache)
+        _parametrise_nb(nb, jnh, jupyter_kwargs, param_store, execution_path)
+    _prune_nb(nb, targets)
+    return nb, output_path, execution_path, ep_kwargs
+
+
+def _check_collect(collect, result_cache=None):
+    if collect is None:
+        return
+    if isinstance(collect, str) or not all(isinstance(name, str) and name.isidentifier() for name in collect):
+        raise ValueError("collect should be a list of variable names.")
+    if result_cache is not None:
+        raise ValueError("collect is not supported with result_cache.")
+
+
+def _check_profile(profile, result_cache=None):
+    if profile is None or profile is False:
+        return
+    if profile is not True and (isinstance(profile, (str, bool)) or
+                                not all(isinstance(i, int) for i in profile)):
+        raise ValueError("profile should be True or a list of cell indices.")
+    if result_cache is not None:
+        raise ValueError("profile is not supported with result_cache.")
+
+
+def _check_input_path(input_path):
+    if _split_ext(input_path)[1] not in _NB_EXTENSIONS:
+        raise ValueError("The extension of input_path = '{}' is not '.ipynb' (or '.ipynb.gz', '.ipynb.zst')".format(input_path))
     if os.path.basename(input_path) == '*':
         raise ValueError("The filename ={} can not start with *".format(input_path))
 
 
+def _output_path(input_path, output_path):
     input_path_dir, input_path_base = os.path.split(input_path)
     if output_path.startswith(r'///'):
         input_rel = True
@@ -138,39 +273,36 @@ def run_jnb(input_path, output_path=r"///_run_jnb/*-output",
         output_path_dir = os.path.join(input_path_dir, output_path_dir)
         output_path_dir = os.path.normpath(output_path_dir)
 
-    if os.path.exists(output_path_dir) is False:
-        os.makedirs(output_path_dir)
-
-    if output_path_base.endswith('.ipynb'):
-        pass
-    elif output_path_base.startswith("*"):
-        output_path_base = input_path_base[:-6]+output_path_base[1:]+'.ipynb'
-    elif output_path_base.endswith("*"):
-        output_path_base = output_path_base[:-1]+input_path_base[:-6]+'.ipynb'
-    else:
+    os.makedirs(output_path_dir, exist_ok=True)
+
+    input_root, input_ext = _split_ext(input_path_base)
+    output_root, output_ext = _split_ext(output_path_base)
+    if output_ext not in _NB_EXTENSIONS:
+        # the output is written in the format of the input
+        output_root, output_ext = output_path_base, None
+    if output_root.startswith("*"):
+        output_path_base = input_root+output_root[1:]+(output_ext or input_ext)
+    elif output_root.endswith("*"):
+        output_path_base = output_root[:-1]+input_root+(output_ext or input_ext)
+    elif output_ext is None:
         raise ValueError("Invalid output_path")
 
-    output_path = os.path.abspath(os.path.join(output_path_dir,
-                                               output_path_base))
+    return os.path.abspath(os.path.join(output_path_dir, output_path_base))
 
-    if output_path is not None and os.path.splitext(output_path)[1] != '.ipynb':
-        raise ValueError("The extension of output_path = '{}' is not '.ipynb'".format(output_path))
 
+def _execution_path(input_path, execution_path):
+    input_path_dir = os.path.dirname(input_path)
     if execution_path.startswith(r'///input'):
         execution_path = os.path.join(input_path_dir, execution_path[8:])
     elif execution_path.startswith(r'///output'):
         execution_path = os.path.join(input_path_dir, execution_path[8:])
     execution_path = os.path.normpath(execution_path)
 
-    if os.path.exists(execution_path) is False:
-        os.makedirs(execution_path)
-
-    if ep_kwargs is None:
-        ep_kwargs = {}
+    os.makedirs(execution_path, exist_ok=True)
+    return execution_path
 
-    if return_mode not in ['parametrised_only', 'except', True, False]:
-        raise TypeError("return mode is not valid!")
 
+def _jupyter_kwargs(arg, kwargs):
     kwarg_to_json = json.dumps(kwargs)
     kwarg_as_kwarg = decode_json(kwarg_to_json)
     arg_as_kwarg = decode_json(arg)
@@ -178,59 +310,207 @@ def run_jnb(input_path, output_path=r"///_run_jnb/*-output",
     multiple_kwarg = set(arg_as_kwarg.keys()) & set(kwarg_as_kwarg.keys())
     if multiple_kwarg != set():
         raise ValueError('Multiple values for keyword argument {}'.format(multiple_kwarg))
-    jupyter_kwargs = {**arg_as_kwarg, **kwarg_as_kwarg}
-    nb = _read_nb(input_path)
+    return {**arg_as_kwarg, **kwarg_as_kwarg}
 
-    # clean notebook
+
+def _clean_nb(nb):
     for i, cell in enumerate(nb['cells']):
         if cell['cell_type'] == 'code':
             nb['cells'][i]['outputs'] = []
             nb['cells'][i]['execution_count'] = None
+            # measurements of a previous execution
+            nb['cells'][i]['metadata'].pop('run_jnb', None)
 
-    if jupyter_kwargs != {}:
-        params_of_interest = {}
-        jnh = _JupyterNotebookHelper(nb, jsonable_parameter ,end_cell_index)
-        for el in jupyter_kwargs.keys():
-            if el not in jnh.param_cell_index.keys():
-                raise ValueError(repr(el)+' is not a possible parameter {}.'.format(list(jnh.param_cell_index.keys())))
-            else:
-                params_of_interest[el] = jnh.param_cell_index[el]
-        params_of_interest = sort_dict(params_of_interest, by='value')
-        cell_index_param = group_dict_by_value(params_of_interest)
-        for key, value in cell_index_param.items():
-            cell_param = {k: jupyter_kwargs[k] for k in value}
-            cell_code = kwargs_to_variable_assignment(cell_param)
-            marked_code = _mark_auto_generated_code(cell_code)
-            nb['cells'][key]['source'] += marked_code
-
-    if return_mode != 'parametrised_only':
-        ep = ExecutePreprocessor(timeout=timeout, kernel_name=kernel_name,
-                                 **ep_kwargs)
 
-    catch_except = False
+def _parametrise_nb(nb, jnh, jupyter_kwargs, param_store=None, execution_path='.'):
+    params_of_interest = {}
+    for el in jupyter_kwargs.keys():
+        if el not in jnh.param_cell_index.keys():
+            raise ValueError(repr(el)+' is not a possible parameter {}.'.format(list(jnh.param_cell_index.keys())))
+        else:
+            params_of_interest[el] = jnh.param_cell_index[el]
+    params_of_interest = sort_dict(params_of_interest, by='value')
+    cell_index_param = group_dict_by_value(params_of_interest)
+    for key, value in cell_index_param.items():
+        cell_param = {k: jupyter_kwargs[k] for k in value}
+        cell_code = _assignment_code(cell_param, param_store, execution_path)
+        marked_code = _mark_auto_generated_code(cell_code)
+        nb['cells'][key]['source'] += marked_code
+
+
+def _assignment_code(cell_param, param_store=None, execution_path='.'):
+    if param_store is None:
+        return kwargs_to_variable_assignment(cell_param)
+    assigned = {}
+    loaded = []
+    for name, value in cell_param.items():
+        if len(repr(value)) <= param_store.threshold:
+            assigned[name] = value
+            continue
+        path = param_store.path(param_store.put(value))
+        try:
+            # the notebook keeps working when moved with the store
+            path = os.path.relpath(path, execution_path)
+        except ValueError:
+            # other drive (windows)
+            path = os.path.abspath(path)
+        loaded.append((name, path))
+    code = kwargs_to_variable_assignment(assigned)
+    if loaded:
+        code += 'import json\n'
+        for name, path in loaded:
+            code += "with open({!r}, encoding='utf-8') as _param_file:\n    {} = json.load(_param_file)\n".format(
+                path, name)
+    return code
+
+
+def _prune_nb(nb, targets):
+    if targets is None:
+        return
+    required = _required_cells(nb['cells'], targets)
+    for i, cell in enumerate(nb['cells']):
+        if cell['cell_type'] == 'code' and i not in required:
+            cell['metadata']['run_jnb'] = {'skipped': True}
 
+
+def _run_nb(nb, output_path, execution_path, return_mode, overwrite,
+            timeout, kernel_name, ep_kwargs, kernel_pool=None, checkpoint=None,
+            result_cache=None, input_files=None, input_path=None, blob_store=None,
+            collect=None, profile=None, profile_stats=False, timing=False):
     error = (None, None, None, None)
+    if return_mode == 'parametrised_only':
+        return _finish_run(nb, output_path, return_mode, overwrite, False, error)
+
+    if result_cache is not None:
+        key = _result_key(nb, kernel_name, ep_kwargs, input_files, execution_path, timeout,
+                          blob_store, timing)
+        cached = result_cache.get(key)
+        if cached is not None:
+            return _finish_cached_run(cached, output_path, return_mode, overwrite)
+
+    output_path, cell_hooks, checkpointer, instrumentation = _start_run(
+        nb, output_path, return_mode, overwrite, checkpoint, blob_store, timing)
+    collector = _variable_collector(cell_hooks, collect)
+    profiler = _cell_profiler(cell_hooks, profile, profile_stats)
+
+    from nbconvert.preprocessors.execute import CellExecutionError
+    from .execute import _ExecutePreprocessor
+
+    ep = _ExecutePreprocessor(cell_hooks=cell_hooks, timeout=timeout,
+                              kernel_name=kernel_name, **ep_kwargs)
+
+    catch_except = False
     try:
-        if return_mode != 'parametrised_only':
-            ep.preprocess(nb, {'metadata': {'path': execution_path}})
+        _preprocess(ep, nb, execution_path, kernel_pool)
     except CellExecutionError:
         catch_except = True
-
-        for cell in nb['cells'][::-1]:
-            if cell['cell_type'] == 'code' and cell.get('outputs') != []:
-                for output in cell['outputs']:
-                    if output.get('output_type') == 'error':
-                        error = (cell['execution_count'],
-                                 output.get('ename'), output.get('evalue'),
-                                 output.get('traceback'))
-                        break
-                if error[0] is not None:
-                    break
-                else:
-                    raise ValueError('Cell expected to have an error.')
+        error = _execution_error(nb)
     except:
+        if checkpointer is not None:
+            checkpointer.write()
+        _finish_profile(profiler, None)
         raise
 
+    res = _finish_run(nb, output_path, return_mode, overwrite, catch_except, error,
+                      checkpointer, instrumentation, collector, profiler)
+    if result_cache is not None and not catch_except:
+        result_cache.set(key, nb, res, input_path, input_files)
+    return res
+
+
+def _finish_cached_run(cached, output_path, return_mode, overwrite):
+    nb, output = cached
+    error = (output['error_prompt_number'], output['error_type'],
+             output['error_value'], output['error_traceback'])
+    res = _finish_run(nb, output_path, return_mode, overwrite, error[0] is not None, error)
+    return res._replace(total_time=output['total_time'],
+                        kernel_startup_time=output['kernel_startup_time'],
+                        slowest_cells=output['slowest_cells'])
+
+
+def _start_run(nb, output_path, return_mode, overwrite, checkpoint, blob_store=None, timing=False):
+    cell_hooks = []
+    checkpointer = None
+    instrumentation = None
+    if return_mode == 'parametrised_only':
+        return output_path, cell_hooks, checkpointer, instrumentation
+
+    from .execute import _Checkpoint, _CellInstrumentation
+
+    if checkpoint is not None:
+        output_path = _free_output_path(output_path, overwrite)
+        checkpointer = _Checkpoint(nb, output_path, checkpoint)
+        checkpointer.write()
+        cell_hooks.append(checkpointer)
+    if blob_store is not None:
+        # offload the outputs before the cell is checkpointed
+        cell_hooks.insert(0, blob_store)
+    if timing:
+        instrumentation = _CellInstrumentation()
+        # measure the cell before its outputs are offloaded or checkpointed
+        cell_hooks.insert(0, instrumentation)
+    return output_path, cell_hooks, checkpointer, instrumentation
+
+
+def _variable_collector(cell_hooks, collect):
+    if collect is None:
+        return None
+    from .execute import _VariableCollector
+
+    collector = _VariableCollector(collect)
+    cell_hooks.append(collector)
+    return collector
+
+
+def _cell_profiler(cell_hooks, profile, profile_stats=False):
+    if profile is None or profile is False:
+        return None
+    from .execute import _CellProfiler, _CellInstrumentation
+
+    stats_path = None
+    if profile_stats:
+        # the output path may change when the notebook is written
+        stats_path = os.path.join(tempfile.mkdtemp(prefix='run_jnb-profile-'), 'stats.prof')
+    profiler = _CellProfiler(None if profile is True else profile, stats_path=stats_path)
+    # after the instrumentation (setting the cell metadata), before the offloading or the checkpoint
+    index = 1 if cell_hooks and isinstance(cell_hooks[0], _CellInstrumentation) else 0
+    cell_hooks.insert(index, profiler)
+    return profiler
+
+
+def _finish_profile(profiler, output_path):
+    # move the statistics next to the output notebook
+    if profiler is None or profiler.stats_path is None:
+        return
+    if output_path is not None and os.path.exists(profiler.stats_path):
+        shutil.move(profiler.stats_path, _split_ext(output_path)[0] + '.prof')
+    shutil.rmtree(os.path.dirname(profiler.stats_path), ignore_errors=True)
+
+
+def _execution_error(nb):
+    error = (None, None, None, None)
+    for cell in nb['cells'][::-1]:
+        if cell['cell_type'] == 'code' and cell.get('outputs') != []:
+            for output in cell['outputs']:
+                if output.get('output_type') == 'error':
+                    error = (cell['execution_count'],
+                             output.get('ename'), output.get('evalue'),
+                             output.get('traceback'))
+                    break
+            if error[0] is not None:
+                break
+            else:
+                raise ValueError('Cell expected to have an error.')
+    return error
+
+
+def _finish_run(nb, output_path, return_mode, overwrite, catch_except, error,
+                checkpointer=None, instrumentation=None, collector=None, profiler=None):
+    if instrumentation is not None:
+        summary = instrumentation.summary()
+    else:
+        summary = (None, None, None)
+
     if return_mode == 'except':
         if catch_except is True:
             nb_return = True
@@ -242,15 +522,46 @@ def run_jnb(input_path, output_path=r"///_run_jnb/*-output",
         nb_return = None
 
     if nb_return is not None:
-        if overwrite is False:
-            while os.path.exists(output_path):
-                dirname, basename = os.path.split(output_path)
-                root, ext = os.path.splitext(basename)
-                new_root = increment_name(root)
-                output_path = os.path.join(dirname, new_root+ext)
+        if checkpointer is None:
+            output_path = _free_output_path(output_path, overwrite)
         nb_return = output_path  # update the output_path
-        _write_nb(nb, output_path)
-    Output=collections.namedtuple('Output',['output_nb_path', 'error_prompt_number','error_type','error_value','error_traceback'])
+        try:
+            _write_nb(nb, output_path, atomic=checkpointer is not None)
+        except:
+            if checkpointer is None and overwrite is False and os.path.exists(output_path):
+                # free the reserved path
+                os.remove(output_path)
+            raise
+    elif checkpointer is not None:
+        os.remove(output_path)
+    # the statistics are written only next to a written (reserved) output notebook
+    _finish_profile(profiler, nb_return)
     res = Output(output_nb_path=nb_return,error_prompt_number=error[0],
-                error_type=error[1],error_value=error[2],error_traceback=error[3])
+                error_type=error[1],error_value=error[2],error_traceback=error[3],
+                total_time=summary[0],kernel_startup_time=summary[1],slowest_cells=summary[2],
+                variables=None if collector is None else collector.variables)
     return res
+
+
+def _free_output_path(output_path, overwrite):
+    if overwrite is False:
+        # an empty file is created, so concurrent runs use different paths
+        output_path = _reserve_path(output_path)
+    return output_path
+
+
+def _preprocess(ep, nb, execution_path, kernel_pool=None):
+    resources = {'metadata': {'path': execution_path}}
+    if kernel_pool is None:
+        ep.preprocess(nb, resources)
+        return
+
+    kernel_name = ep.kernel_name or nb['metadata'].get('kernelspec', {}).get('name', 'python3')
+    with kernel_pool.kernel(kernel_name, execution_path) as km:
+        try:
+            ep.preprocess(nb, resources, km=km)
+        finally:
+            # the kernel is owned by the pool, only the client is closed
+            if ep.kc is not None:
+                ep.kc.stop_channels()
+                ep.kc = None
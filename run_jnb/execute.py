@@ -0,0 +1,451 @@
+# -*- coding: utf-8 -*-
+
+import ast
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+import warnings
+
+from nbclient import NotebookClient
+from nbclient.util import run_sync, ensure_async
+from nbconvert.preprocessors import ExecutePreprocessor
+
+from .util import _write_nb
+
+
+class _CellHookMixin:
+    """
+    Mixin for nbclient.NotebookClient calling hooks before and after the execution of each cell.
+
+    The hooks (attribute cell_hooks) are objects with the coroutine methods
+    async_pre_cell(client, cell, cell_index) and async_post_cell(client, cell, cell_index).
+    async_post_cell is called also if the execution of the cell failed.
+    The cells marked in their metadata by "run_jnb": {"skipped": true} are not executed.
+    """
+    async def async_execute_cell(self, cell, cell_index, execution_count=None,
+                                 store_history=True):
+        if not _is_executed(cell):
+            return cell
+        for hook in self.cell_hooks:
+            await hook.async_pre_cell(self, cell, cell_index)
+        try:
+            return await super().async_execute_cell(cell, cell_index, execution_count,
+                                                    store_history)
+        finally:
+            for hook in self.cell_hooks:
+                await hook.async_post_cell(self, cell, cell_index)
+
+    execute_cell = run_sync(async_execute_cell)
+
+
+class _ExecutePreprocessor(_CellHookMixin, ExecutePreprocessor):
+    """
+    ExecutePreprocessor calling hooks before and after the execution of each cell.
+
+    Parameters
+    ----------
+    cell_hooks : list, optional
+        See _CellHookMixin.
+    kw :
+        Keyword arguments accepted by nbconvert.preprocessors.ExecutePreprocessor
+    """
+    def __init__(self, cell_hooks=None, **kw):
+        super().__init__(**kw)
+        self.cell_hooks = list(cell_hooks or [])
+
+
+class _NotebookClient(_CellHookMixin, NotebookClient):
+    """
+    NotebookClient calling hooks before and after the execution of each cell.
+
+    Parameters
+    ----------
+    nb : nbformat.notebooknode.NotebookNode
+        Notebook to execute.
+    cell_hooks : list, optional
+        See _CellHookMixin.
+    kw :
+        Keyword arguments accepted by nbclient.NotebookClient
+    """
+    def __init__(self, nb, cell_hooks=None, **kw):
+        super().__init__(nb, **kw)
+        self.cell_hooks = list(cell_hooks or [])
+
+
+class _Checkpoint:
+    """
+    Cell hook writing the notebook atomically while it is executed.
+
+    The notebook is written after a cell if at least interval seconds passed since
+    the last write. In order to bound the cost of writing, the time between two
+    writes is also at least the duration of the last write divided by max_overhead.
+
+    Parameters
+    ----------
+    nb : nbformat.notebooknode.NotebookNode
+        Notebook being executed.
+    path : str
+        Path of the written notebook.
+    interval : float, optional
+        Minimum number of seconds between two writes (0 to write after each cell).
+    max_overhead : float, optional
+        Maximum fraction of the execution time spent writing the notebook.
+    """
+    def __init__(self, nb, path, interval=0, max_overhead=0.1):
+        self.nb = nb
+        self.path = path
+        self.interval = interval
+        self.max_overhead = max_overhead
+        self._last_write = None
+        self._write_duration = 0
+
+    def write(self):
+        start = time.monotonic()
+        _write_nb(self.nb, self.path, atomic=True)
+        self._last_write = time.monotonic()
+        self._write_duration = self._last_write - start
+
+    async def async_pre_cell(self, client, cell, cell_index):
+        pass
+
+    async def async_post_cell(self, client, cell, cell_index):
+        self._post_cell(cell)
+
+    def _post_cell(self, cell):
+        if cell['cell_type'] != 'code':
+            return
+        elapsed = time.monotonic() - self._last_write
+        if elapsed >= max(self.interval, self._write_duration / self.max_overhead):
+            self.write()
+
+
+class _CellInstrumentation:
+    """
+    Cell hook measuring the execution of the code cells.
+
+    For each executed code cell, the wall time, the increase of the peak resident
+    memory of the kernel (in bytes, None if not available) and the size of the
+    outputs (length of their json representation) are stored in the metadata of
+    the cell under "run_jnb".
+
+    Parameters
+    ----------
+    slowest_cells : int, optional
+        Number of slowest cells kept in the summary.
+    """
+    def __init__(self, slowest_cells=5):
+        self.slowest_cells = slowest_cells
+        self.start = time.monotonic()
+        self.first_cell_start = None
+        self.wall_time = {}
+        self._cell_start = None
+        self._peak_rss = None
+
+    async def async_pre_cell(self, client, cell, cell_index):
+        if not _is_executed(cell):
+            return
+        if self.first_cell_start is None:
+            self.first_cell_start = time.monotonic()
+            self._peak_rss = await _async_kernel_peak_rss(client)
+        self._cell_start = time.monotonic()
+
+    async def async_post_cell(self, client, cell, cell_index):
+        if not _is_executed(cell):
+            return
+        wall_time = time.monotonic() - self._cell_start
+        peak_rss = await _async_kernel_peak_rss(client)
+        if peak_rss is None or self._peak_rss is None:
+            peak_rss_delta = None
+        else:
+            peak_rss_delta = peak_rss - self._peak_rss
+        self._peak_rss = peak_rss
+        self.wall_time[cell_index] = wall_time
+        cell['metadata']['run_jnb'] = {'wall_time': wall_time,
+                                       'peak_rss_delta': peak_rss_delta,
+                                       'output_size': len(json.dumps(cell.get('outputs', [])))}
+
+    def summary(self):
+        """
+        Summary of the execution.
+
+        Returns
+        -------
+        tuple
+            (total time, kernel startup time, list of (cell index, wall time) of the slowest cells).
+            The times are in seconds.
+        """
+        total_time = time.monotonic() - self.start
+        if self.first_cell_start is None:
+            kernel_startup_time = None
+        else:
+            kernel_startup_time = self.first_cell_start - self.start
+        slowest_cells = sorted(self.wall_time.items(), key=lambda t: t[1], reverse=True)
+        return total_time, kernel_startup_time, slowest_cells[:self.slowest_cells]
+
+
+class _VariableCollector:
+    """
+    Cell hook collecting variables of the kernel after the last executed cell or the cell stopping the execution.
+
+    The json serialisable values are sent as json by the kernel and the numpy arrays are
+    saved by the kernel in temporary .npy files read by the client (the kernel runs on
+    the same machine), so the values are available without writing the notebook.
+    The variables which can not be collected (e.g. undefined) are reported by a warning.
+
+    Parameters
+    ----------
+    names : list
+        Names of the variables (python identifiers).
+    timeout : int, optional
+        Timeout (in seconds) of the collection.
+    """
+    def __init__(self, names, timeout=60):
+        self.names = list(names)
+        self.timeout = timeout
+        self.variables = None
+        self._last_cell_index = None
+
+    async def async_pre_cell(self, client, cell, cell_index):
+        pass
+
+    async def async_post_cell(self, client, cell, cell_index):
+        if not _is_executed(cell):
+            return
+        if self._last_cell_index is None:
+            self._last_cell_index = max(i for i, c in enumerate(client.nb['cells']) if _is_executed(c))
+        if cell_index == self._last_cell_index or _stops_execution(client, cell):
+            self.variables = await self._async_collect(client)
+
+    async def _async_collect(self, client):
+        tmp_dir = tempfile.mkdtemp(prefix='run_jnb-variables-')
+        try:
+            expressions = {name: _COLLECT_EXPRESSION.format(name=name, path=os.path.join(tmp_dir, name + '.npy'))
+                           for name in self.names}
+            results = await _async_user_expression_results(client, expressions, self.timeout)
+            variables = {}
+            for name in self.names:
+                result = results.get(name, {'status': 'error', 'ename': 'TimeoutError', 'evalue': ''})
+                if result.get('status') != 'ok':
+                    warnings.warn('The variable {} could not be collected: {}: {}'.format(
+                        name, result.get('ename'), result.get('evalue')))
+                    continue
+                kind, value = ast.literal_eval(result['data']['text/plain'])
+                if kind == 'npy':
+                    import numpy
+                    variables[name] = numpy.load(os.path.join(tmp_dir, name + '.npy'))
+                else:
+                    variables[name] = json.loads(value)
+            return variables
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# tagged value of a variable: a numpy array is saved in a .npy file, another value is sent as json
+_COLLECT_EXPRESSION = ("(lambda v: ('npy', __import__('numpy').save({path!r}, v, allow_pickle=False)) "
+                       "if type(v).__module__ == 'numpy' and type(v).__name__ == 'ndarray' "
+                       "else ('json', __import__('json').dumps(v)))({name})")
+
+
+class _CellProfiler:
+    """
+    Cell hook profiling the execution of the code cells inside the kernel (python kernels only).
+
+    Before a profiled cell, a profiler is armed in the kernel and the IPython events
+    pre_run_cell / post_run_cell enable and disable it around the execution of the cell
+    only, so the silent requests of the client are not profiled. After the cell, the
+    functions with the largest cumulative time are stored in the metadata of the cell
+    under "run_jnb": {"profile": [[function, number of calls, total time, cumulative time], ...]}.
+    Only the functions called by the code of the cell are kept, not the compilation of
+    the cell or the formatting of a traceback by IPython.
+
+    Parameters
+    ----------
+    cells : list, optional
+        Indices of the profiled code cells. By default all the executed code cells are profiled.
+    top : int, optional
+        Number of functions stored per cell.
+    stats_path : str, optional
+        Path of a file where the kernel accumulates the statistics of all the profiled cells
+        (pstats format, e.g. for snakeviz or pstats.Stats).
+    timeout : int, optional
+        Timeout (in seconds) of the requests to the kernel.
+    """
+    def __init__(self, cells=None, top=20, stats_path=None, timeout=60):
+        self.cells = None if cells is None else set(cells)
+        self.top = top
+        self.stats_path = stats_path
+        self.timeout = timeout
+        self._armed = None
+
+    async def async_pre_cell(self, client, cell, cell_index):
+        self._armed = None
+        if not _is_executed(cell) or (self.cells is not None and cell_index not in self.cells):
+            return
+        results = await _async_user_expression_results(
+            client, {'arm': _PROFILE_ARM_EXPRESSION}, self.timeout,
+            code=_PROFILE_SETUP_CODE)
+        if results.get('arm', {}).get('status') == 'ok':
+            self._armed = cell_index
+        else:
+            warnings.warn('The cell {} could not be profiled: {}'.format(
+                cell_index, results.get('arm', {}).get('evalue', 'no reply of the kernel')))
+
+    async def async_post_cell(self, client, cell, cell_index):
+        if self._armed != cell_index:
+            return
+        self._armed = None
+        expression = _PROFILE_COLLECT_EXPRESSION.format(top=self.top, path=self.stats_path)
+        values = await _async_user_expressions(client, {'profile': expression}, self.timeout)
+        if values['profile'] is None:
+            warnings.warn('The profile of the cell {} could not be collected.'.format(cell_index))
+            return
+        cell['metadata'].setdefault('run_jnb', {})['profile'] = values['profile']
+
+
+# kernel side of _CellProfiler, executed in its own namespace and kept by the shell
+_PROFILE_SOURCE = """
+import cProfile
+import os
+import pstats
+import sys
+from IPython import get_ipython
+
+
+# the code of a cell is called by exec (eval with top-level await), the other calls are made by IPython
+_CELL_CALLERS = {('~', 0, "<built-in method builtins.exec>"), ('~', 0, "<built-in method builtins.eval>")}
+
+
+def _cell_functions(stats):
+    callees = {}
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        for caller in callers:
+            callees.setdefault(caller, []).append(func)
+    # the bodies of the imported modules are also executed by exec
+    module_files = {getattr(module, '__file__', None) for module in list(sys.modules.values())}
+    todo = [func for caller in _CELL_CALLERS for func in callees.get(caller, [])
+            if func[2] == '<module>' and func[0] not in module_files]
+    functions = set()
+    while todo:
+        func = todo.pop()
+        if func not in functions:
+            functions.add(func)
+            todo.extend(callees.get(func, []))
+    return functions
+
+
+def _setup(shell):
+    state = {'armed': False, 'profiler': None}
+
+    def pre_run_cell(*args):
+        if state['armed']:
+            state['armed'] = False
+            state['profiler'] = cProfile.Profile()
+            state['profiler'].enable()
+
+    def post_run_cell(*args):
+        if state['profiler'] is not None:
+            state['profiler'].disable()
+
+    def arm():
+        state['armed'] = True
+        state['profiler'] = None
+
+    def collect(top, path):
+        profiler, state['profiler'] = state['profiler'], None
+        if profiler is None:
+            return []
+        stats = pstats.Stats(profiler)
+        rows = []
+        for func in _cell_functions(stats):
+            cc, nc, tt, ct, callers = stats.stats[func]
+            rows.append([pstats.func_std_string(func), nc, round(tt, 6), round(ct, 6)])
+        rows.sort(key=lambda row: row[3], reverse=True)
+        if path is not None:
+            if os.path.exists(path):
+                stats.add(path)
+            stats.dump_stats(path)
+        return rows[:top]
+
+    shell.events.register('pre_run_cell', pre_run_cell)
+    shell.events.register('post_run_cell', post_run_cell)
+    shell._run_jnb_profile = {'arm': arm, 'collect': collect}
+
+
+if getattr(get_ipython(), '_run_jnb_profile', None) is None:
+    _setup(get_ipython())
+"""
+_PROFILE_SETUP_CODE = ("__import__('builtins').exec(compile({!r}, '<run_jnb profile>', 'exec'), {{}})"
+                       .format(_PROFILE_SOURCE))
+_PROFILE_ARM_EXPRESSION = "__import__('IPython').get_ipython()._run_jnb_profile['arm']()"
+_PROFILE_COLLECT_EXPRESSION = "__import__('IPython').get_ipython()._run_jnb_profile['collect']({top!r}, {path!r})"
+
+
+def _stops_execution(client, cell):
+    # same rule as nbclient.NotebookClient._check_raise_for_error
+    for output in cell.get('outputs', []):
+        if output['output_type'] == 'error':
+            return client.force_raise_errors or not (
+                client.allow_errors or output.get('ename') in client.allow_error_names or
+                'raises-exception' in cell['metadata'].get('tags', []))
+    return False
+
+
+def _is_executed(cell):
+    return cell['cell_type'] == 'code' and cell['source'].strip() != '' and \
+        not cell['metadata'].get('run_jnb', {}).get('skipped', False)
+
+
+async def _async_user_expressions(client, expressions, timeout=10):
+    """
+    Evaluate python expressions silently in the kernel of a client.
+
+    Returns
+    -------
+    dict
+        The values of the expressions recovered by ast.literal_eval from their text representation.
+        The value is None if the evaluation failed.
+    """
+    values = dict.fromkeys(expressions)
+    for name, result in (await _async_user_expression_results(client, expressions, timeout)).items():
+        if result.get('status') == 'ok':
+            try:
+                values[name] = ast.literal_eval(result['data']['text/plain'])
+            except (KeyError, ValueError, SyntaxError):
+                pass
+    return values
+
+
+async def _async_user_expression_results(client, expressions, timeout=10, code=''):
+    """
+    Evaluate python expressions silently in the kernel of a client, after executing code.
+
+    Returns
+    -------
+    dict
+        The user_expressions of the execute reply ({} if there is no reply).
+    """
+    try:
+        msg_id = await ensure_async(client.kc.execute(code, silent=True, store_history=False,
+                                                      user_expressions=expressions))
+        reply = await asyncio.wait_for(client.async_wait_for_reply(msg_id), timeout)
+    except Exception:
+        return {}
+    if reply is None:
+        return {}
+    return reply['content'].get('user_expressions', {})
+
+
+_PEAK_RSS_EXPRESSION = ("(__import__('resource').getrusage(__import__('resource').RUSAGE_SELF).ru_maxrss, "
+                        "__import__('sys').platform)")
+
+
+async def _async_kernel_peak_rss(client):
+    value = (await _async_user_expressions(client, {'peak_rss': _PEAK_RSS_EXPRESSION}))['peak_rss']
+    if value is None:
+        return None
+    peak_rss, platform = value
+    # ru_maxrss is in kilobytes except on macOS
+    return peak_rss if platform == 'darwin' else peak_rss * 1024
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+
+import ast
+import copy
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+
+import nbformat
+
+from .core import _execution_error, _finish_run, _finish_cached_run
+from .cache import _result_key
+from .execute import _ExecutePreprocessor, _CellInstrumentation, _is_executed
+from .kernel_pool import KernelPool
+
+# Defines in the kernel the functions forking it. The child process executes the
+# cells with the kernel messaging replaced by an in-memory recording of the
+# outputs, writes them as json and exits without touching the kernel sockets.
+_FORK_CODE = r"""
+def __run_jnb_define():
+    import base64, io, json, os, resource, signal, sys, time
+    from IPython.core.displayhook import DisplayHook
+    from IPython.core.displaypub import DisplayPublisher
+
+    shell = get_ipython()
+    recorder = {'outputs': []}
+
+    class Stream(io.TextIOBase):
+        def __init__(self, name):
+            self.name = name
+
+        def writable(self):
+            return True
+
+        def write(self, text):
+            outputs = recorder['outputs']
+            if outputs and outputs[-1]['output_type'] == 'stream' and outputs[-1]['name'] == self.name:
+                outputs[-1]['text'] += text
+            else:
+                outputs.append({'output_type': 'stream', 'name': self.name, 'text': text})
+            return len(text)
+
+    class Publisher(DisplayPublisher):
+        def publish(self, data, metadata=None, source=None, *, transient=None, update=False, **kwargs):
+            recorder['outputs'].append({'output_type': 'display_data', 'data': data,
+                                        'metadata': metadata or {}})
+
+        def clear_output(self, wait=False):
+            del recorder['outputs'][:]
+
+    class Hook(DisplayHook):
+        def start_displayhook(self):
+            pass
+
+        def write_output_prompt(self):
+            pass
+
+        def write_format_data(self, format_dict, md_dict=None):
+            recorder['outputs'].append({'output_type': 'execute_result', 'data': format_dict,
+                                        'metadata': md_dict or {},
+                                        'execution_count': self.shell.execution_count})
+
+        def finish_displayhook(self):
+            pass
+
+    def show_traceback(etype, evalue, stb):
+        recorder['outputs'].append({'output_type': 'error', 'ename': getattr(etype, '__name__', str(etype)),
+                                    'evalue': str(evalue), 'traceback': stb})
+
+    def on_timeout(signum, frame):
+        raise TimeoutError('Cell execution timed out')
+
+    def encode(obj):
+        if isinstance(obj, bytes):
+            return base64.b64encode(obj).decode('ascii')
+        return repr(obj)
+
+    def peak_rss():
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+    def run(cells_path, result_path, timeout):
+        with open(cells_path) as f:
+            cells = json.load(f)
+        pid = os.fork()
+        if pid != 0:
+            return pid
+        status = 1
+        try:
+            sys.stdout, sys.stderr = Stream('stdout'), Stream('stderr')
+            shell.display_pub = Publisher(shell=shell)
+            shell.displayhook = shell.display_trap.hook = Hook(shell=shell)
+            shell._showtraceback = show_traceback
+            signal.signal(signal.SIGALRM, on_timeout)
+            results = []
+            for cell in cells:
+                recorder['outputs'] = []
+                rss = peak_rss()
+                start = time.monotonic()
+                signal.alarm(timeout)
+                try:
+                    result = shell.run_cell(cell['source'], store_history=True)
+                finally:
+                    signal.alarm(0)
+                results.append({'outputs': recorder['outputs'], 'execution_count': result.execution_count,
+                                'wall_time': time.monotonic() - start, 'peak_rss_delta': peak_rss() - rss})
+                if not result.success and not cell['allow_errors']:
+                    break
+            with open(result_path + '.tmp', 'w') as f:
+                json.dump(results, f, default=encode)
+            os.replace(result_path + '.tmp', result_path)
+            status = 0
+        finally:
+            os._exit(status)
+
+    def wait(pids):
+        # os.wait would also reap the other children of the kernel (e.g. a subprocess
+        # started by the prefix cells)
+        delay = 0.001
+        while True:
+            for pid in pids:
+                done, status = os.waitpid(pid, os.WNOHANG)
+                if done != 0:
+                    return done, status
+            time.sleep(delay)
+            delay = min(2 * delay, 0.05)
+
+    def kill(pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+
+    return run, wait, kill
+
+get_ipython()._run_jnb_fork = __run_jnb_define()
+del __run_jnb_define
+"""
+
+
+def _run_forked(nbs, prefix_length, output_path, execution_path, return_mode, overwrite,
+                timeout, kernel_name, ep_kwargs, max_workers, result_cache=None,
+                input_files=None, input_path=None, blob_store=None, timing=False):
+    """
+    Execute parametrised copies of a notebook by forking a kernel after their common prefix.
+
+    The cells before prefix_length are executed once, then for each notebook the
+    kernel is forked (POSIX only) and the child process executes only the remaining
+    cells, so the kernel state built by the prefix (e.g. a loaded dataset) is shared.
+    At most max_workers children run concurrently.
+
+    Parameters
+    ----------
+    nbs : iterable
+        (index, parametrised notebook) where the notebooks differ only from the cell prefix_length onward.
+    prefix_length : int
+        Number of cells executed once.
+    output_path, execution_path, return_mode, overwrite, timeout, kernel_name, ep_kwargs,
+    result_cache, input_files, blob_store, timing :
+        See run_jnb.
+
+    Yields
+    ------
+    tuple
+        (index, output) as soon as a notebook is finished, see run_jnb_many.
+    """
+    nbs = iter(nbs)
+    try:
+        index, nb = next(nbs)
+    except StopIteration:
+        return
+
+    pool = KernelPool(size=1)
+    kernel_name = kernel_name or nb['metadata'].get('kernelspec', {}).get('name', 'python3')
+    km = pool.acquire(kernel_name, execution_path)
+    kc = None
+    running = {}
+    tmp_dir = tempfile.mkdtemp(prefix='run_jnb-fork-')
+    try:
+        prefix_nb = copy.deepcopy(nb)
+        prefix_nb['cells'] = prefix_nb['cells'][:prefix_length]
+        prefix_summary, prefix_failed = _execute_prefix(prefix_nb, km, execution_path, timeout,
+                                                        kernel_name, ep_kwargs, blob_store, timing)
+        if prefix_failed:
+            for index, nb in _chain(index, nb, nbs):
+                nb['cells'][:prefix_length] = copy.deepcopy(prefix_nb['cells'])
+                res = _finish_run(nb, output_path, return_mode, overwrite, True, _execution_error(nb))
+                if timing:
+                    res = res._replace(total_time=prefix_summary[0],
+                                       kernel_startup_time=prefix_summary[1],
+                                       slowest_cells=prefix_summary[2])
+                yield index, res
+            return
+
+        from jupyter_client import BlockingKernelClient
+
+        kc = BlockingKernelClient()
+        kc.load_connection_info(km.get_connection_info())
+        kc.start_channels()
+        kc.wait_for_ready(timeout=pool.timeout)
+        _kernel_eval(kc, None, code=_FORK_CODE)
+
+        nbs = _chain(index, nb, nbs)
+        cell_timeout = 0 if timeout is None else int(math.ceil(timeout))
+        allow_errors = ep_kwargs.get('allow_errors', False)
+        while True:
+            for index, nb in nbs:
+                key = None
+                if result_cache is not None:
+                    key = _result_key(nb, kernel_name, ep_kwargs, input_files, execution_path,
+                                      timeout, blob_store, timing)
+                    cached = result_cache.get(key)
+                    if cached is not None:
+                        yield index, _finish_cached_run(cached, output_path, return_mode, overwrite)
+                        continue
+                cells_path = os.path.join(tmp_dir, '{}-cells.json'.format(index))
+                result_path = os.path.join(tmp_dir, '{}-result.json'.format(index))
+                cells = [{'source': cell['source'],
+                          'allow_errors': allow_errors or 'raises-exception' in cell['metadata'].get('tags', [])}
+                         for cell in nb['cells'][prefix_length:] if _is_executed(cell)]
+                with open(cells_path, 'w') as f:
+                    json.dump(cells, f)
+                start = time.monotonic()
+                pid = _kernel_eval(kc, 'get_ipython()._run_jnb_fork[0]({!r}, {!r}, {!r})'.format(
+                    cells_path, result_path, cell_timeout))
+                running[pid] = (index, nb, key, result_path, start)
+                if len(running) >= max_workers:
+                    break
+
+            if not running:
+                break
+
+            pid, status = _kernel_eval(kc, 'get_ipython()._run_jnb_fork[1]({!r})'.format(list(running)))
+            index, nb, key, result_path, start = running.pop(pid)
+            try:
+                with open(result_path) as f:
+                    results = json.load(f)
+            except (OSError, ValueError):
+                raise RuntimeError('The forked kernel of the parameter set {} exited with status {}.'.format(
+                    index, status))
+            nb['cells'][:prefix_length] = copy.deepcopy(prefix_nb['cells'])
+            catch_except = _fill_outputs(nb, prefix_length, results, allow_errors, blob_store, timing)
+            error = _execution_error(nb) if catch_except else (None, None, None, None)
+            res = _finish_run(nb, output_path, return_mode, overwrite, catch_except, error)
+            if timing:
+                res = res._replace(total_time=prefix_summary[0] + time.monotonic() - start,
+                                   kernel_startup_time=prefix_summary[1],
+                                   slowest_cells=_slowest_cells(nb))
+            if result_cache is not None and not catch_except:
+                result_cache.set(key, nb, res, input_path, input_files)
+            yield index, res
+    finally:
+        if kc is not None:
+            if running:
+                _kernel_eval(kc, 'get_ipython()._run_jnb_fork[2]({!r})'.format(list(running)))
+            kc.stop_channels()
+        pool.release(kernel_name, km)
+        pool.shutdown()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _chain(index, nb, nbs):
+    yield index, nb
+    yield from nbs
+
+
+def _execute_prefix(prefix_nb, km, execution_path, timeout, kernel_name, ep_kwargs,
+                    blob_store=None, timing=False):
+    from nbconvert.preprocessors.execute import CellExecutionError
+
+    instrumentation = _CellInstrumentation() if timing else None
+    cell_hooks = [] if instrumentation is None else [instrumentation]
+    if blob_store is not None:
+        cell_hooks.append(blob_store)
+    ep = _ExecutePreprocessor(cell_hooks=cell_hooks, timeout=timeout,
+                              kernel_name=kernel_name, **ep_kwargs)
+    failed = False
+    try:
+        ep.preprocess(prefix_nb, {'metadata': {'path': execution_path}}, km=km)
+    except CellExecutionError:
+        failed = True
+    finally:
+        # the kernel is forked afterwards, only the client is closed
+        if ep.kc is not None:
+            ep.kc.stop_channels()
+            ep.kc = None
+    summary = (None, None, None) if instrumentation is None else instrumentation.summary()
+    return summary, failed
+
+
+def _kernel_eval(kc, expression, code=''):
+    user_expressions = {} if expression is None else {'value': expression}
+    reply = kc.execute_interactive(code, silent=True, store_history=False,
+                                   user_expressions=user_expressions, timeout=None,
+                                   output_hook=lambda msg: None)
+    content = reply['content']
+    if content['status'] != 'ok':
+        raise RuntimeError('Kernel code failed with {}: {}'.format(content.get('ename'), content.get('evalue')))
+    if expression is None:
+        return None
+    result = content['user_expressions']['value']
+    if result['status'] != 'ok':
+        raise RuntimeError('Kernel expression failed with {}: {}'.format(result.get('ename'), result.get('evalue')))
+    return ast.literal_eval(result['data']['text/plain'])
+
+
+def _fill_outputs(nb, prefix_length, results, allow_errors, blob_store=None, timing=False):
+    """
+    Set the outputs executed by a forked kernel and return True if the execution stopped at an error.
+    """
+    failed = False
+    cells = [cell for cell in nb['cells'][prefix_length:] if _is_executed(cell)]
+    for cell, result in zip(cells, results):
+        outputs = [nbformat.from_dict(output) for output in result['outputs']]
+        cell['outputs'] = outputs
+        cell['execution_count'] = result['execution_count']
+        if timing:
+            cell['metadata']['run_jnb'] = {'wall_time': result['wall_time'],
+                                           'peak_rss_delta': result['peak_rss_delta'],
+                                           'output_size': len(json.dumps(outputs))}
+        if blob_store is not None:
+            blob_store.offload(outputs)
+        cell_allow_errors = allow_errors or 'raises-exception' in cell['metadata'].get('tags', [])
+        if not cell_allow_errors and any(output['output_type'] == 'error' for output in outputs):
+            failed = True
+    return failed
+
+
+def _slowest_cells(nb, slowest_cells=5):
+    wall_time = [(i, cell['metadata']['run_jnb']['wall_time']) for i, cell in enumerate(nb['cells'])
+                 if 'wall_time' in cell['metadata'].get('run_jnb', {})]
+    return sorted(wall_time, key=lambda t: t[1], reverse=True)[:slowest_cells]
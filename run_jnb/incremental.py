@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+import copy
+
+from .core import _DEFAULT_TIMEOUT, _DEFAULT_KERNEL_NAME, _prepare_nb, _start_run, \
+ _execution_error, _finish_run
+from .analysis import _incremental_cells
+from .kernel_pool import KernelPool
+
+
+class IncrementalSession:
+    """
+    Session executing a jupyter notebook many times in the same kernel, executing again only the affected cells.
+
+    The first run executes all the cells. A next run (e.g. with other parameters, or after
+    the notebook file was edited) compares the cells with the ones of the last run and
+    executes again only the changed cells (e.g. the parameter cells) and the cells depending
+    on the names they write (see analysis._incremental_cells). The outputs of the other cells
+    are kept. The notebook is executed again from a reset namespace if the cells can not be
+    analysed (e.g. exec, star import or most of the magics), if the number of cells changed
+    or if the last run failed.
+
+    Parameters
+    ----------
+    input_path, output_path, execution_path, return_mode, overwrite, timeout, kernel_name,
+    ep_kwargs, jsonable_parameter, end_cell_index, analysis_cache, timing :
+        See run_jnb. return_mode can not be "parametrised_only".
+    kernel_pool : run_jnb.KernelPool, optional
+        Pool from which the kernel of the session is borrowed (e.g. to use a prelude).
+        By default a pool of one kernel is created.
+
+    >>> session = IncrementalSession('./example/Power_function.ipynb', return_mode='parametrised_only')
+    Traceback (most recent call last):
+        ...
+    ValueError: return_mode can not be 'parametrised_only' in an incremental session.
+    """
+    def __init__(self, input_path, output_path=r"///_run_jnb/*-output",
+                 execution_path=r'///input',
+                 return_mode='except',
+                 overwrite=False,
+                 timeout=_DEFAULT_TIMEOUT,
+                 kernel_name=_DEFAULT_KERNEL_NAME,
+                 ep_kwargs=None, jsonable_parameter=True, end_cell_index=None,
+                 analysis_cache=None, kernel_pool=None, timing=False):
+        if return_mode == 'parametrised_only':
+            raise ValueError("return_mode can not be 'parametrised_only' in an incremental session.")
+        self.input_path = input_path
+        self.output_path = output_path
+        self.execution_path = execution_path
+        self.return_mode = return_mode
+        self.overwrite = overwrite
+        self.timeout = timeout
+        self.kernel_name = kernel_name
+        self.ep_kwargs = ep_kwargs
+        self.jsonable_parameter = jsonable_parameter
+        self.end_cell_index = end_cell_index
+        self.analysis_cache = analysis_cache
+        self.timing = timing
+        self._own_kernel_pool = kernel_pool is None
+        self.kernel_pool = KernelPool() if kernel_pool is None else kernel_pool
+        # indices of the code cells executed by the last run
+        self.executed_cells = None
+        self._km = None
+        self._km_name = None
+        # last executed notebook, None if the namespace of the kernel is unknown
+        self._nb = None
+
+    def run(self, arg=None, **kwargs):
+        """
+        Parametrise the notebook and execute the affected cells.
+
+        Parameters
+        ----------
+        arg, kwargs :
+            Parameters of the notebook, see run_jnb.
+
+        Returns
+        -------
+        collections.namedtuple
+            See run_jnb. The total time and the slowest cells refer to the executed cells.
+        """
+        nb, output_path, execution_path, ep_kwargs = _prepare_nb(
+            self.input_path, self.output_path, self.execution_path, self.return_mode,
+            self.ep_kwargs, self.jsonable_parameter, self.end_cell_index, arg, kwargs,
+            self.analysis_cache)
+        kernel_name = self.kernel_name or nb['metadata'].get('kernelspec', {}).get('name', 'python3')
+
+        previous, self._nb = self._nb, None
+        cells = None
+        if previous is not None and kernel_name == self._km_name:
+            cells = _incremental_cells(previous['cells'], nb['cells'])
+        if cells is None:
+            # the namespace is reset when the kernel is given back to the pool
+            self._release_kernel()
+            previous = None
+            cells = {i for i, cell in enumerate(nb['cells']) if cell['cell_type'] == 'code'}
+        if self._km is None:
+            self._km = self.kernel_pool.acquire(kernel_name, execution_path)
+            self._km_name = kernel_name
+
+        kept = {}
+        if previous is not None:
+            for i, cell in enumerate(nb['cells']):
+                if cell['cell_type'] == 'code' and i not in cells:
+                    kept[i] = previous['cells'][i]
+                    cell['metadata']['run_jnb'] = {'skipped': True}
+
+        output_path, cell_hooks, _, instrumentation = _start_run(
+            nb, output_path, self.return_mode, self.overwrite, None, timing=self.timing)
+
+        from nbconvert.preprocessors.execute import CellExecutionError
+        from .execute import _ExecutePreprocessor
+
+        ep = _ExecutePreprocessor(cell_hooks=cell_hooks, timeout=self.timeout,
+                                  kernel_name=kernel_name, **ep_kwargs)
+        catch_except = False
+        error = (None, None, None, None)
+        try:
+            ep.preprocess(nb, {'metadata': {'path': execution_path}}, km=self._km)
+        except CellExecutionError:
+            catch_except = True
+        except:
+            self._release_kernel()
+            raise
+        finally:
+            # the kernel is kept for the next run, only the client is closed
+            if ep.kc is not None:
+                ep.kc.stop_channels()
+                ep.kc = None
+
+        end = len(nb['cells'])
+        if catch_except:
+            error = _execution_error(nb)
+            # the cells after the failed one are not executed
+            end = max(i for i in cells if any(output['output_type'] == 'error'
+                                              for output in nb['cells'][i]['outputs']))
+        else:
+            self._nb = nb
+        for i, cell in kept.items():
+            if i < end:
+                nb['cells'][i]['outputs'] = copy.deepcopy(cell['outputs'])
+                nb['cells'][i]['execution_count'] = cell['execution_count']
+                nb['cells'][i]['metadata'] = copy.deepcopy(cell['metadata'])
+            else:
+                del nb['cells'][i]['metadata']['run_jnb']
+        # the failed cell is the last executed one
+        self.executed_cells = sorted(i for i in cells if i <= end and nb['cells'][i]['source'].strip() != '')
+        return _finish_run(nb, output_path, self.return_mode, self.overwrite, catch_except, error,
+                           instrumentation=instrumentation)
+
+    def close(self):
+        """Give back the kernel of the session (shutdown if the pool is owned by the session)."""
+        self._nb = None
+        self._release_kernel()
+        if self._own_kernel_pool:
+            self.kernel_pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _release_kernel(self):
+        if self._km is not None:
+            km, self._km = self._km, None
+            self.kernel_pool.release(self._km_name, km)
@@ -1,12 +1,12 @@
 # -*- coding: utf-8 -*-
 
-import os
+import collections
 import copy
 import nbformat
 
-from nbconvert import PythonExporter
-
-from .util import _read_nb, sort_dict, variable_status
+from .util import _read_nb, sort_dict, _split_ext, _NB_EXTENSIONS
+from .analysis import _cell_index_of_possible_param
+from .cache import _analysis_key, _default_analysis_cache
 
 class _JupyterNotebookHelper:
     """
@@ -20,6 +20,8 @@ class _JupyterNotebookHelper:
         End cell index used to slice the notebook in finding the possible parameters.
     jsonable_parameter : 
         Consider only jsonable parameters.
+    cache : run_jnb.AnalysisCache, optional
+        Cache of the possible parameters. If None an in-memory cache shared by the process is used.
 
     Attributes
     ----------
@@ -39,40 +41,35 @@ class _JupyterNotebookHelper:
     param_value : dict
         Dictionary with the parameter values
     """
-    def __init__(self, nb, jsonable_parameter=True, end_cell_index=None):
+    def __init__(self, nb, jsonable_parameter=True, end_cell_index=None, cache=None):
         if isinstance(nb, nbformat.notebooknode.NotebookNode):
             pass
         elif isinstance(nb, str):
-            if os.path.splitext(nb)[1] != '.ipynb':
+            if _split_ext(nb)[1] not in _NB_EXTENSIONS:
                 raise ValueError("The extension of the jupyter notebook = '{}' is not '.ipynb'".format(nb))
-            nb = _read_nb(nb)
+            nb = _read_nb(nb, outputs=False)
         else:
             raise TypeError()
         self.language = nb['metadata']['kernelspec']['language']
         self.language_version = nb['metadata']['language_info']['version']
         self.kernel = nb['metadata']['kernelspec']['name']
         self.nb = nb
-        self.exporter = PythonExporter()
 
         if self.language == 'python' and self.language_version[0] == '3':
-            self.param_cell_index, self.param_value = self._cell_index_of_possible_param(jsonable_parameter, end_cell_index)
+            if cache is None:
+                cache = _default_analysis_cache
+            key = _analysis_key(nb, jsonable_parameter, end_cell_index)
+            cached = cache.get(key)
+            if cached is None:
+                self.param_cell_index, self.param_value = self._cell_index_of_possible_param(jsonable_parameter, end_cell_index)
+                cache.set(key, {'param_cell_index': list(self.param_cell_index.items()),
+                                'param_value': copy.deepcopy(self.param_value)})
+            else:
+                self.param_cell_index = collections.OrderedDict(
+                    (name, cell_index) for name, cell_index in cached['param_cell_index'])
+                self.param_value = copy.deepcopy(cached['param_value'])
         else:
             self.param_cell_index, self.param_value = sort_dict({}), {}
 
     def _cell_index_of_possible_param(self, jsonable_parameter, end_cell_index):
-        index_of_params = {}
-        exclude_variable = set()
-        new_nb = copy.deepcopy(self.nb)
-        param_value = {}
-        for i, cell in enumerate(self.nb['cells'][:end_cell_index]):
-            if cell['cell_type'] == 'code':
-                new_nb['cells'] = [cell]
-                source, _ = self.exporter.from_notebook_node(new_nb)
-                params, exclude_variable, _param_value = variable_status(source,
-                                                           exclude_variable, jsonable_parameter)
-                param_value = {**param_value, **_param_value}                                       
-                for param in params:
-                    if param not in index_of_params.keys():
-                        index_of_params[param] = i
-
-        return sort_dict(index_of_params, by='value'), param_value
+        return _cell_index_of_possible_param(self.nb['cells'], jsonable_parameter, end_cell_index)
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+
+import concurrent.futures
+import json
+import os
+import socket
+import time
+import uuid
+
+from concurrent.futures.process import BrokenProcessPool
+
+from .util import _write_atomic
+
+# keyword arguments of run_jnb that can be given to a job, the caches are given by their folder
+_JOB_OPTIONS = {'output_path', 'execution_path', 'return_mode', 'overwrite', 'timeout',
+                'kernel_name', 'ep_kwargs', 'jsonable_parameter', 'end_cell_index', 'checkpoint',
+                'input_files', 'result_cache', 'blob_dir', 'blob_threshold', 'targets',
+                'profile', 'profile_stats', 'param_dir', 'param_threshold', 'timing'}
+_STATES = ['pending', 'running', 'done', 'failed']
+
+
+class JobQueue:
+    """
+    Queue of notebook runs stored in a folder, shared by workers on many machines.
+
+    A job is a json file moved between the folders pending, running, done and failed
+    of queue_dir. A worker claims a job by an atomic rename from pending to running and
+    renews its lease by updating the modification time of the running file (heartbeat).
+    A running job whose lease expired (e.g. its worker died) is moved back to pending
+    by any worker and it is retried at most max_attempts times, so each job is executed
+    at least once. The clocks of the machines should be synchronised.
+
+    Parameters
+    ----------
+    queue_dir : str
+        Folder of the queue (on a filesystem shared by the workers).
+    lease : float, optional
+        Number of seconds without heartbeat after which a running job is considered abandoned.
+    max_attempts : int, optional
+        Maximum number of executions of a job.
+    """
+    def __init__(self, queue_dir, lease=60, max_attempts=3):
+        self.queue_dir = queue_dir
+        self.lease = lease
+        self.max_attempts = max_attempts
+        for state in _STATES:
+            os.makedirs(os.path.join(queue_dir, state), exist_ok=True)
+
+    def submit(self, input_path, params=None, **options):
+        """
+        Add a job to the queue.
+
+        Parameters
+        ----------
+        input_path : str
+            Path of the input jupyter notebook.
+        params : dict, optional
+            json serialisable keyword arguments used to parametrise the notebook.
+        options :
+            json serialisable keyword arguments of run_jnb (output_path, execution_path,
+            return_mode, overwrite, timeout, kernel_name, ep_kwargs, jsonable_parameter,
+            end_cell_index, checkpoint, input_files, targets, profile, profile_stats, timing).
+            result_cache is the folder of a ResultCache, blob_dir / blob_threshold define a
+            BlobStore and param_dir / param_threshold the BlobStore param_store.
+
+        Returns
+        -------
+        str
+            Job id.
+        """
+        unknown = set(options) - _JOB_OPTIONS
+        if unknown != set():
+            raise TypeError('Unknown job options {}'.format(sorted(unknown)))
+        # the paths are used by workers started in other folders
+        for option in ['output_path', 'execution_path']:
+            if option in options and not options[option].startswith('///'):
+                options[option] = os.path.abspath(options[option])
+        for option in ['result_cache', 'blob_dir', 'param_dir']:
+            if options.get(option) is not None:
+                options[option] = os.path.abspath(options[option])
+        if options.get('input_files') is not None:
+            options['input_files'] = [os.path.abspath(path) for path in options['input_files']]
+
+        # the ids are ordered by the submission time
+        job_id = '{:017.6f}-{}'.format(time.time(), uuid.uuid4().hex[:8])
+        job = {'id': job_id, 'input_path': os.path.abspath(input_path), 'params': params or {},
+               'options': options, 'attempts': 0, 'max_attempts': self.max_attempts,
+               'worker': None, 'error': None, 'output': None}
+        _write_atomic(self._path('pending', job_id), json.dumps(job))
+        return job_id
+
+    def claim(self, worker):
+        """
+        Claim the oldest pending job for a worker.
+
+        Returns
+        -------
+        dict
+            The job or None if there are no pending jobs.
+        """
+        for job_id in self.job_ids('pending'):
+            path = self._path('running', job_id)
+            try:
+                os.rename(self._path('pending', job_id), path)
+            except FileNotFoundError:
+                # claimed by another worker
+                continue
+            # the rename keeps the modification time, the lease starts now
+            os.utime(path)
+            job = self._read(path)
+            job['attempts'] += 1
+            job['worker'] = worker
+            _write_atomic(path, json.dumps(job))
+            return job
+        return None
+
+    def heartbeat(self, job):
+        """Renew the lease of a running job."""
+        try:
+            os.utime(self._path('running', job['id']))
+        except FileNotFoundError:
+            pass
+
+    def complete(self, job, output):
+        """Store the output (collections.namedtuple returned by run_jnb) of a job."""
+        job['output'] = output._asdict()
+        self._finish(job, 'done')
+
+    def fail(self, job, error):
+        """Record the error of a job and retry it if the number of attempts allows it."""
+        job['error'] = error
+        if job['attempts'] < job['max_attempts']:
+            self._finish(job, 'pending')
+        else:
+            self._finish(job, 'failed')
+
+    def requeue_expired(self):
+        """Move back to pending (or to failed) the running jobs whose lease expired."""
+        now = time.time()
+        for job_id in self.job_ids('running'):
+            path = self._path('running', job_id)
+            try:
+                if now - os.path.getmtime(path) <= self.lease:
+                    continue
+                job = self._read(path)
+            except (OSError, ValueError):
+                continue
+            state = 'pending' if job['attempts'] < job['max_attempts'] else 'failed'
+            try:
+                os.rename(path, self._path(state, job_id))
+            except FileNotFoundError:
+                # finished or requeued meanwhile
+                pass
+
+    def job(self, job_id):
+        """
+        State and content of a job.
+
+        Returns
+        -------
+        tuple
+            (state, job) or (None, None) if the job is not found.
+        """
+        for state in _STATES:
+            try:
+                return state, self._read(self._path(state, job_id))
+            except FileNotFoundError:
+                continue
+        return None, None
+
+    def job_ids(self, state):
+        """Sorted ids of the jobs in a state ('pending', 'running', 'done' or 'failed')."""
+        return sorted(name[:-5] for name in os.listdir(os.path.join(self.queue_dir, state))
+                      if name.endswith('.json') and not name.startswith('.'))
+
+    def status(self):
+        """Number of jobs in each state."""
+        return {state: len(self.job_ids(state)) for state in _STATES}
+
+    def work(self, jobs=1, worker=None, poll_interval=1.0, exit_when_empty=False):
+        """
+        Execute the jobs of the queue in a pool of jobs processes.
+
+        Parameters
+        ----------
+        jobs : int, optional
+            Number of jobs executed concurrently.
+        worker : str, optional
+            Name of the worker (by default host name and process id).
+        poll_interval : float, optional
+            Number of seconds between two checks of the queue when it is empty.
+        exit_when_empty : bool, optional
+            Stop when there are no pending and no running jobs of this worker.
+
+        Yields
+        ------
+        tuple
+            (job id, output) as soon as a job is finished, where output is the collections.namedtuple
+            returned by run_jnb or None if the job failed (see the error of the job).
+        """
+        if worker is None:
+            worker = '{}:{}'.format(socket.gethostname(), os.getpid())
+        # the lease is renewed a few times before it expires
+        wait_timeout = min(poll_interval, self.lease / 3)
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+        running = {}
+        try:
+            while True:
+                self.requeue_expired()
+                while len(running) < jobs:
+                    job = self.claim(worker)
+                    if job is None:
+                        break
+                    running[executor.submit(_run_job, job)] = job
+
+                if not running:
+                    if exit_when_empty:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                done, _ = concurrent.futures.wait(running, timeout=wait_timeout,
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    job = running.pop(future)
+                    try:
+                        output = future.result()
+                    except Exception as e:
+                        broken = broken or isinstance(e, BrokenProcessPool)
+                        self.fail(job, repr(e))
+                        yield job['id'], None
+                    else:
+                        self.complete(job, output)
+                        yield job['id'], output
+                if broken:
+                    for future, job in running.items():
+                        self.fail(job, 'The worker process died.')
+                    running = {}
+                    executor.shutdown(wait=False)
+                    executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+                for job in running.values():
+                    self.heartbeat(job)
+        finally:
+            executor.shutdown(wait=not running)
+
+    def _finish(self, job, state):
+        path = self._path('running', job['id'])
+        try:
+            owner = self._read(path)['worker']
+        except (OSError, ValueError):
+            owner = None
+        # the job may have been requeued (and claimed by another worker) after its lease expired
+        if state == 'pending':
+            if owner == job['worker']:
+                _write_atomic(path, json.dumps(job))
+                os.rename(path, self._path('pending', job['id']))
+            return
+        _write_atomic(self._path(state, job['id']), json.dumps(job))
+        stale_paths = [self._path('pending', job['id'])]
+        if owner == job['worker']:
+            stale_paths.append(path)
+        for stale_path in stale_paths:
+            try:
+                os.remove(stale_path)
+            except FileNotFoundError:
+                pass
+
+    def _read(self, path):
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def _path(self, state, job_id):
+        return os.path.join(self.queue_dir, state, job_id + '.json')
+
+
+def _run_job(job):
+    from .core import run_jnb
+
+    return run_jnb(job['input_path'], arg=json.dumps(job['params']), **_run_options(job['options']))
+
+
+def _run_options(options):
+    """Keyword arguments of run_jnb from the json serialisable options of a job."""
+    from .cache import ResultCache
+    from .blob_store import BlobStore
+
+    unknown = set(options) - _JOB_OPTIONS
+    if unknown != set():
+        raise TypeError('Unknown job options {}'.format(sorted(unknown)))
+    options = dict(options)
+    if options.get('result_cache') is not None:
+        options['result_cache'] = ResultCache(options['result_cache'])
+    for store, prefix in [('blob_store', 'blob'), ('param_store', 'param')]:
+        blob_dir = options.pop(prefix + '_dir', None)
+        blob_threshold = options.pop(prefix + '_threshold', None)
+        if blob_dir is not None:
+            options[store] = BlobStore(blob_dir) if blob_threshold is None else \
+                BlobStore(blob_dir, blob_threshold)
+    return options
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import contextlib
+import os
+import threading
+
+from .util import _process_rss
+
+_RESET_CODE = """
+get_ipython().reset(new_session=False)
+get_ipython().execution_count = 1
+import os as __run_jnb_os
+__run_jnb_os.chdir({path!r})
+del __run_jnb_os
+"""
+
+
+class KernelPool:
+    """
+    Pool of started kernels reused across run_jnb calls.
+
+    For each kernel name at most size kernels are started. A kernel is handed out
+    to a single run at a time and when it is given back its namespace is reset and
+    its working directory is restored. The rest of the process state is kept across
+    runs: the imported modules (and their state, e.g. a random seed or a patched
+    function), sys.path, the environment variables, the open files and the threads.
+    Notebooks changing this state should not use a pool. The kernels which died or
+    use more memory than max_memory are replaced by new ones.
+
+    Parameters
+    ----------
+    size : int, optional
+        Number of kernels per kernel name.
+    prelude : str, optional
+        Code (e.g. the imports) executed in every new kernel and after every reset of the namespace.
+    max_memory : int, optional
+        Maximum resident memory (in bytes) of a kernel before it is restarted.
+    timeout : int, optional
+        Timeout (in seconds) for starting a kernel and executing the prelude.
+
+    >>> pool = KernelPool(size=0)
+    Traceback (most recent call last):
+        ...
+    ValueError: size should be a positive integer.
+    """
+    def __init__(self, size=1, prelude=None, max_memory=None, timeout=60):
+        if not isinstance(size, int) or size < 1:
+            raise ValueError("size should be a positive integer.")
+        self.size = size
+        self.prelude = prelude
+        self.max_memory = max_memory
+        self.timeout = timeout
+        self._idle = collections.defaultdict(list)
+        self._started = collections.defaultdict(int)
+        self._condition = threading.Condition()
+
+    def start(self, kernel_name, path='.'):
+        """
+        Start all the kernels of a kernel name.
+
+        Parameters
+        ----------
+        kernel_name : str
+            Kernel name.
+        path : str, optional
+            Working directory of the new kernels.
+        """
+        while True:
+            with self._condition:
+                if self._started[kernel_name] >= self.size:
+                    return
+                self._started[kernel_name] += 1
+            km = self._start_kernel(kernel_name, path)
+            with self._condition:
+                self._idle[kernel_name].append(km)
+                self._condition.notify()
+
+    @contextlib.contextmanager
+    def kernel(self, kernel_name, path='.'):
+        """
+        Context manager to borrow a kernel manager with a started kernel.
+
+        Parameters
+        ----------
+        kernel_name : str
+            Kernel name.
+        path : str
+            Working directory for the borrowed kernel.
+
+        Yields
+        ------
+        jupyter_client.AsyncKernelManager
+        """
+        km = self.acquire(kernel_name, path)
+        try:
+            yield km
+        finally:
+            self.release(kernel_name, km)
+
+    def acquire(self, kernel_name, path='.'):
+        """
+        Borrow a kernel manager with a started kernel (blocks if all the kernels are used).
+
+        The borrowed kernel should be given back by release.
+        """
+        while True:
+            with self._condition:
+                while not self._idle[kernel_name] and self._started[kernel_name] >= self.size:
+                    self._condition.wait()
+                if self._idle[kernel_name]:
+                    km = self._idle[kernel_name].pop()
+                else:
+                    self._started[kernel_name] += 1
+                    km = None
+            if km is None:
+                return self._start_kernel(kernel_name, path)
+            if _run_sync(km.is_alive)():
+                try:
+                    return self._reset(km, path)
+                except:
+                    self._discard(kernel_name, km)
+                    raise
+            self._discard(kernel_name, km)
+
+    def release(self, kernel_name, km):
+        """Give back a kernel manager obtained by acquire."""
+        rss = _process_rss(_kernel_pid(km))
+        if (not _run_sync(km.is_alive)() or
+                self.max_memory is not None and rss is not None and rss > self.max_memory):
+            self._discard(kernel_name, km)
+        else:
+            with self._condition:
+                self._idle[kernel_name].append(km)
+                self._condition.notify()
+
+    def shutdown(self):
+        """Shutdown all the idle kernels."""
+        with self._condition:
+            idle, self._idle = self._idle, collections.defaultdict(list)
+            for kernel_name, kms in idle.items():
+                self._started[kernel_name] -= len(kms)
+        for kms in idle.values():
+            for km in kms:
+                _shutdown_kernel(km)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def _discard(self, kernel_name, km):
+        _shutdown_kernel(km)
+        with self._condition:
+            self._started[kernel_name] -= 1
+            self._condition.notify()
+
+    def _start_kernel(self, kernel_name, path):
+        from jupyter_client import AsyncKernelManager
+
+        km = AsyncKernelManager(kernel_name=kernel_name)
+        try:
+            _run_sync(km.start_kernel)(cwd=os.path.abspath(path))
+            # wait until the kernel is ready, so a started kernel is warm
+            self._execute(km, self.prelude or '')
+        except:
+            self._discard(kernel_name, km)
+            raise
+        return km
+
+    def _reset(self, km, path):
+        code = _RESET_CODE.format(path=os.path.abspath(path))
+        if self.prelude:
+            code += self.prelude
+        self._execute(km, code)
+        return km
+
+    def _execute(self, km, code):
+        from jupyter_client import BlockingKernelClient
+
+        kc = BlockingKernelClient()
+        kc.load_connection_info(km.get_connection_info())
+        kc.start_channels()
+        try:
+            kc.wait_for_ready(timeout=self.timeout)
+            reply = kc.execute_interactive(code, silent=True, store_history=False,
+                                           timeout=self.timeout, output_hook=lambda msg: None)
+        finally:
+            kc.stop_channels()
+        if reply['content']['status'] != 'ok':
+            raise RuntimeError('Kernel code failed with {}: {}'.format(
+                reply['content'].get('ename'), reply['content'].get('evalue')))
+
+
+def _run_sync(coro):
+    # jupyter_client and nbclient are imported only when a kernel is used
+    from nbclient.util import run_sync
+    return run_sync(coro)
+
+
+def _kernel_pid(km):
+    provisioner = getattr(km, 'provisioner', None)
+    if provisioner is not None:
+        return getattr(provisioner, 'pid', None)
+    kernel = getattr(km, 'kernel', None)
+    return getattr(kernel, 'pid', None)
+
+
+def _shutdown_kernel(km):
+    if not km.has_kernel:
+        return
+    try:
+        _run_sync(km.shutdown_kernel)(now=True)
+    except RuntimeError:
+        pass
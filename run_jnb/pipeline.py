@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import concurrent.futures
+import json
+import os
+import warnings
+from concurrent.futures.process import BrokenProcessPool
+
+from .job_queue import _JOB_OPTIONS, _run_options
+
+# keyword arguments of run_jnb that can be given to a node, the input files and the
+# result cache are given by the pipeline
+_NODE_OPTIONS = (_JOB_OPTIONS - {'input_files', 'result_cache'}) | {'collect'}
+
+_Node = collections.namedtuple('_Node', ['name', 'input_path', 'params', 'depends_on',
+                                         'inputs', 'outputs', 'options'])
+
+
+class Pipeline:
+    """
+    Directed acyclic graph of notebook runs executed in parallel.
+
+    Each node runs a notebook with parameters (see run_jnb). A node depends on the nodes
+    given by depends_on and on the nodes writing one of its input files. As soon as the
+    dependencies of a node are finished without error, the node is executed in a pool of
+    max_workers processes, so the duration of the pipeline is the one of its critical path.
+    A node fails if its notebook raises an error or if its run raises an exception (e.g. an
+    invalid option or a cell timeout, reported by a warning). The nodes depending on a failed
+    node are not executed.
+
+    With a result cache, a node whose notebook, parameters and input files (including the
+    output files of its dependencies) did not change since a previous run is not executed
+    again, provided that its output files exist. The files a node reads and writes should
+    be declared by inputs and outputs for this.
+
+    Parameters
+    ----------
+    max_workers : int, optional
+        Maximum number of nodes executed concurrently. By default the number of CPUs.
+    result_cache : run_jnb.ResultCache, optional
+        Cache of the executed nodes.
+
+    >>> pipeline = Pipeline()
+    >>> pipeline.add('ingest', 'ingest.ipynb', outputs=['raw.csv'])
+    >>> pipeline.add('features', 'features.ipynb', inputs=['raw.csv'])
+    >>> pipeline.add('report', 'report.ipynb', depends_on=['features'])
+    >>> pipeline.dependencies()
+    OrderedDict([('ingest', []), ('features', ['ingest']), ('report', ['features'])])
+    """
+    def __init__(self, max_workers=None, result_cache=None):
+        self.max_workers = max_workers
+        self.result_cache = result_cache
+        self.nodes = collections.OrderedDict()
+
+    def add(self, name, input_path, params=None, depends_on=None, inputs=None, outputs=None,
+            **options):
+        """
+        Add a node.
+
+        Parameters
+        ----------
+        name : str
+            Name of the node.
+        input_path : str
+            Path of the input jupyter notebook.
+        params : dict, optional
+            json serialisable keyword arguments used to parametrise the notebook.
+        depends_on : list, optional
+            Names of the nodes executed before the node.
+        inputs : list, optional
+            Paths of the files read by the notebook.
+        outputs : list, optional
+            Paths of the files written by the notebook.
+        options :
+            json serialisable keyword arguments of run_jnb (output_path, execution_path,
+            return_mode, overwrite, timeout, kernel_name, ep_kwargs, jsonable_parameter,
+            end_cell_index, checkpoint, targets, collect, profile, profile_stats, timing).
+            blob_dir / blob_threshold define a BlobStore and param_dir / param_threshold the
+            BlobStore param_store.
+        """
+        if name in self.nodes:
+            raise ValueError('The node {} already exists.'.format(name))
+        unknown = set(options) - _NODE_OPTIONS
+        if unknown != set():
+            raise TypeError('Unknown node options {}'.format(sorted(unknown)))
+        self.nodes[name] = _Node(name, input_path, dict(params or {}), list(depends_on or []),
+                                 [os.path.abspath(path) for path in inputs or []],
+                                 [os.path.abspath(path) for path in outputs or []], options)
+
+    @classmethod
+    def from_dict(cls, spec, base_path='.', max_workers=None, result_cache=None):
+        """
+        Pipeline from a json serialisable dictionary.
+
+        Parameters
+        ----------
+        spec : dict
+            {"nodes": [{"name": ..., "input_path": ..., "params": {...}, "depends_on": [...],
+            "inputs": [...], "outputs": [...], other options of add}, ...]}
+        base_path : str, optional
+            Folder of the relative paths (input_path, inputs, outputs, blob_dir and param_dir).
+        max_workers, result_cache :
+            See Pipeline.
+        """
+        pipeline = cls(max_workers=max_workers, result_cache=result_cache)
+        for node in spec['nodes']:
+            node = dict(node)
+            for key in ['input_path', 'blob_dir', 'param_dir']:
+                if node.get(key) is not None:
+                    node[key] = os.path.join(base_path, node[key])
+            for key in ['inputs', 'outputs']:
+                node[key] = [os.path.join(base_path, path) for path in node.get(key) or []]
+            pipeline.add(**node)
+        return pipeline
+
+    def dependencies(self):
+        """
+        Dependencies of the nodes.
+
+        Returns
+        -------
+        collections.OrderedDict
+            {node name: list of the names of the nodes it depends on} ordered such that
+            every node follows its dependencies.
+
+        Raises
+        ------
+        ValueError
+            If a dependency is unknown or the nodes have a cycle.
+        """
+        writers = collections.defaultdict(list)
+        for node in self.nodes.values():
+            for path in node.outputs:
+                writers[path].append(node.name)
+        dependencies = {}
+        for node in self.nodes.values():
+            unknown = [name for name in node.depends_on if name not in self.nodes]
+            if unknown:
+                raise ValueError('The node {} depends on the unknown nodes {}.'.format(node.name, unknown))
+            names = list(node.depends_on)
+            for path in node.inputs:
+                names.extend(writers[path])
+            dependencies[node.name] = [name for name in _unique(names) if name != node.name]
+
+        ordered = collections.OrderedDict()
+        while len(ordered) < len(dependencies):
+            ready = [name for name in self.nodes if name not in ordered and
+                     all(dependency in ordered for dependency in dependencies[name])]
+            if ready == []:
+                raise ValueError('The nodes {} have a cycle.'.format(
+                    [name for name in self.nodes if name not in ordered]))
+            for name in ready:
+                ordered[name] = dependencies[name]
+        return ordered
+
+    def run(self):
+        """
+        Execute the nodes.
+
+        Yields
+        ------
+        tuple
+            (node name, output) as soon as a node is finished, where output is the
+            collections.namedtuple returned by run_jnb or None if the run of the node
+            raised an exception or the node was not executed because a dependency failed.
+        """
+        dependencies = self.dependencies()
+        max_workers = self.max_workers or os.cpu_count() or 1
+        done = {}
+        pending = {}
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+        try:
+            while len(done) < len(dependencies):
+                for name, names in dependencies.items():
+                    if name in done or name in pending.values() or \
+                            not all(dependency in done for dependency in names):
+                        continue
+                    if any(done[dependency] is None or done[dependency].error_type is not None
+                           for dependency in names):
+                        done[name] = None
+                        yield name, None
+                        continue
+                    future = executor.submit(_run_node, self._run_kwargs(self.nodes[name], names))
+                    pending[future] = name
+
+                if not pending:
+                    continue
+                finished, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                broken = False
+                for future in finished:
+                    name = pending.pop(future)
+                    try:
+                        done[name] = future.result()
+                    except Exception as e:
+                        broken = broken or isinstance(e, BrokenProcessPool)
+                        warnings.warn('The run of the node {} failed: {!r}'.format(name, e))
+                        done[name] = None
+                    yield name, done[name]
+                if broken:
+                    # the pending nodes of the broken pool fail, the next ones use a new pool
+                    executor.shutdown(wait=False)
+                    executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+        finally:
+            executor.shutdown(wait=not pending)
+
+    def _run_kwargs(self, node, dependencies):
+        # the output files of the dependencies are part of the key of the result cache
+        input_files = list(node.inputs)
+        for name in dependencies:
+            input_files.extend(self.nodes[name].outputs)
+        result_cache = self.result_cache
+        if node.options.get('collect') or node.options.get('profile'):
+            result_cache = None
+        elif result_cache is not None and not all(os.path.exists(path) for path in node.outputs):
+            # a cached result would not write the output files
+            result_cache = _StoreOnly(result_cache)
+        options = dict(node.options)
+        collect = options.pop('collect', None)
+        # the stores are built as for a job
+        options = _run_options(options)
+        return dict(input_path=node.input_path, arg=json.dumps(node.params), collect=collect,
+                    result_cache=result_cache, input_files=_unique(input_files), **options)
+
+
+def _run_node(kwargs):
+    from .core import run_jnb
+
+    return run_jnb(**kwargs)
+
+
+class _StoreOnly:
+    """Result cache storing the runs without returning the cached ones."""
+    def __init__(self, result_cache):
+        self.result_cache = result_cache
+
+    def get(self, key):
+        return None
+
+    def set(self, *args, **kwargs):
+        self.result_cache.set(*args, **kwargs)
+
+
+def _unique(values):
+    return list(collections.OrderedDict.fromkeys(values))
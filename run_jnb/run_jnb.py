@@ -3,17 +3,75 @@
 import argparse as argparse
 import json as json
 import csv
+import os
+import sys
 from io import StringIO
 
-from nbconvert.preprocessors import ExecutePreprocessor as EP
-
-from .core import run_jnb
+# the modules of the other commands are imported by their branch, so a run starts fast
+from .core import _DEFAULT_TIMEOUT, _DEFAULT_KERNEL_NAME, run_jnb, _jupyter_kwargs
 
 
 def main():
-    parser = argparse.ArgumentParser(description='Execute and parametrise (python3 only) jupyter notebooks.')
+    if sys.argv[1:2] == ['submit']:
+        _main_submit(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['worker']:
+        _main_worker(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['serve']:
+        _main_serve(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['pipeline']:
+        _main_pipeline(sys.argv[2:])
+        return
+
+    parser = _parser('Execute and parametrise (python3 only) jupyter notebooks. '
+                     'See also "run_jnb submit -h" and "run_jnb worker -h" to run notebooks with a job queue '
+                     '"run_jnb serve -h" to run notebooks with a long-lived server '
+                     'and "run_jnb pipeline -h" to run a pipeline of notebooks.')
+    args = _parse_args(parser, sys.argv[1:])
+
+    if args.result_cache is not None:
+        from .cache import ResultCache
+
+        args.result_cache = ResultCache(args.result_cache)
+
+    if args.blob_dir is not None or args.param_dir is not None:
+        from .blob_store import BlobStore
+
+        if args.blob_dir is not None:
+            args.blob_dir = BlobStore(args.blob_dir, args.blob_threshold)
+        if args.param_dir is not None:
+            args.param_dir = BlobStore(args.param_dir, args.param_threshold)
+
+    if args.watch:
+        _main_watch(parser, args)
+        return
+
+    if args.arg_lines is not None:
+        _main_batch(args)
+        return
+
+    res = run_jnb(input_path=args.input_path, output_path=args.output_path,
+                  execution_path=args.execution_path,
+                  return_mode=args.return_mode, overwrite=args.overwrite,
+                  timeout=args.timeout, kernel_name=args.kernel_name,
+                  ep_kwargs=args.ep_kwargs, end_cell_index=args.end_cell_index,
+                  jsonable_parameter=args.jsonable_parameter,
+                  checkpoint=args.checkpoint, result_cache=args.result_cache,
+                  input_files=args.input_file, blob_store=args.blob_dir, targets=args.target,
+                  collect=args.collect, profile=_profile(args.profile),
+                  profile_stats=args.profile_stats, param_store=args.param_dir, timing=args.timing,
+                  arg=args.arg)
+
+    if args.verbose is not None:
+        print(_format_output(res, args.verbose, args.format, timing=args.timing))
+
+
+def _parser(description, prog=None):
+    parser = argparse.ArgumentParser(description=description, prog=prog)
     parser.add_argument("input_path", help="path of input jupyter notebook")
-    parser.add_argument("-o", "--output_path", help="path of the output jupyter notebook. The input path can be used as relative path by starting with '///' . * can be used once at the beggining or at the end as a wildcard of the input_path filename, excluding the '.ipynb' extension.",
+    parser.add_argument("-o", "--output_path", help="path of the output jupyter notebook. The input path can be used as relative path by starting with '///' . * can be used once at the beggining or at the end as a wildcard of the input_path filename, excluding the '.ipynb' extension. A '.ipynb.gz' (or '.ipynb.zst') extension writes a compressed compact notebook.",
                         default=r"///_run_jnb/*-output", type=str)
     parser.add_argument("-e", "--execution_path", help="path of the folder where to execute the notebook.  r'///input' or r'///output' can be used to denote the input / output folder.",
                         default=r'///input', type=str)
@@ -22,45 +80,329 @@ def main():
     parser.add_argument("-O", "--overwrite", help="overwrite output_path if exists. If the parameter is False the used output_path will be incremented until a valid one is found.",
                         action='store_true', default=False)
     parser.add_argument("-t", "--timeout", help="ExecutePreprocessor.timeout",
-                        type=int, default=EP.timeout.default_value)
+                        type=int, default=_DEFAULT_TIMEOUT)
     parser.add_argument("-k", "--kernel_name", help="ExecutePreprocessor.kernel_name",
-                        type=str, default=EP.kernel_name.default_value)
+                        type=str, default=_DEFAULT_KERNEL_NAME)
     parser.add_argument('-E', "--ep_kwargs", help="other ExecutePreprocessor parameters as keyword arguments",
                         default=None, type=str)
     parser.add_argument('-j', "--jsonable_parameter", help="Parametrise only jsonable parameters.", choices=['true', 'false'], default='true')                        
     parser.add_argument('-M', "--end_cell_index", help="End cell index used to slice the notebook in finding the possible parameters.", default=None, type=int),
+    parser.add_argument('-c', "--checkpoint", help="write the output notebook also during the execution, after a cell if at least CHECKPOINT seconds passed since the last write (0 to write after each cell).",
+                        default=None, type=float)
+    parser.add_argument('-R', "--result_cache", help="folder of a cache of the executed notebooks. A notebook already executed with the same parameters is not executed again.",
+                        default=None, type=str)
+    parser.add_argument('-I', "--input_file", help="path of a file read by the notebook (can be repeated). Its content is part of the key of the result cache.",
+                        default=None, action='append')
+    parser.add_argument('-b', "--blob_dir", help="folder of a content-addressed store where the outputs larger than --blob_threshold characters are offloaded. The notebook keeps references to them.",
+                        default=None, type=str)
+    parser.add_argument("--blob_threshold", help="minimum size (in characters) of the outputs offloaded to --blob_dir.",
+                        default=100000, type=int)
+    parser.add_argument("--param_dir", help="folder of a content-addressed store where the parameters whose representation is larger than --param_threshold characters are written as json. The parameter cell loads them from it.",
+                        default=None, type=str)
+    parser.add_argument("--param_threshold", help="minimum size (in characters) of the parameters written to --param_dir.",
+                        default=100000, type=int)
     parser.add_argument('-a', "--arg", help="jupyter notebook argument as json file or as json string (python3 only)",
                         default=None, type=str)
-    parser.add_argument("-v", "--verbose", help="verbose mode to write the returned output as csv. -v for the path of the generated notebook and the error prompt number. -vv appends also the error type and value. -vvv or more appends the error traceback.", action='count')
+    parser.add_argument('-A', "--arg_lines", help="batch mode: path of a file (or - for stdin) with a jupyter notebook argument as json object per line. The notebook is run for each line (combined with --arg) and a result row, starting with the line index, is written as soon as each run is finished.",
+                        default=None, type=str)
+    parser.add_argument('-J', "--jobs", help="number of notebooks run concurrently in batch mode.",
+                        default=1, type=int)
+    parser.add_argument('-F', "--fork", help="batch mode: execute the cells before the first parameter cell once and fork the kernel (POSIX only) for each line to execute the remaining cells.",
+                        action='store_true', default=False)
+    parser.add_argument('-T', "--target", help="cell index or variable name needed from the execution (can be repeated). Only the cells it depends on are executed.",
+                        default=None, action='append', type=_target)
+    parser.add_argument('-C', "--collect", help="name of a kernel variable (json serialisable or numpy array) written with the output after the execution (can be repeated).",
+                        default=None, action='append')
+    parser.add_argument('-P', "--profile", help="profile the code cells with cProfile inside the kernel and store the functions with the largest cumulative time in the cell metadata. Without cell index all the executed code cells are profiled.",
+                        default=None, nargs='*', type=int, metavar='CELL_INDEX')
+    parser.add_argument("--profile_stats", help="with --profile, write the statistics of the profiled cells next to the output notebook (.prof file, pstats format).",
+                        action='store_true', default=False)
+    parser.add_argument("--timing", help="store the wall time, the increase of the peak resident memory of the kernel and the size of the outputs of each executed code cell in its metadata, and append the total time, the kernel startup time and the slowest cells (json list of [cell index, wall time]) to the returned output.",
+                        action='store_true', default=False)
+    parser.add_argument("--max_memory", help="batch mode: start a new run only if the memory (in bytes) used by the running runs (the largest of their --memory hints and their measured memory) stays below MAX_MEMORY.",
+                        default=None, type=int)
+    parser.add_argument("--max_load", help="batch mode: start a new run only while the 1 minute load average is below MAX_LOAD.",
+                        default=None, type=float)
+    parser.add_argument("--memory", help="batch mode: memory (in bytes) needed by a run. By default the notebook metadata run_jnb.resources.memory or 0.",
+                        default=None, type=int)
+    parser.add_argument('-w', "--watch", help="execute the notebook again each time it or the --arg json file changes, "
+                        "with a warm kernel executing only the changed cells and the cells depending on them.",
+                        action='store_true', default=False)
+    parser.add_argument("--poll_interval", help="watch mode: number of seconds between two checks of the files.",
+                        default=0.5, type=float)
+    parser.add_argument('-f', "--format", help="format of the returned output.",
+                        choices=['csv', 'jsonl'], default='csv')
+    parser.add_argument("-v", "--verbose", help="verbose mode to write the returned output as csv. -v for the path of the generated notebook and the error prompt number. -vv appends also the error type and value. -vvv or more appends the error traceback. In batch mode -v is the default.", action='count')
+
+    return parser
+
+
+def _profile(cells):
+    # --profile without cell index profiles all the cells
+    return True if cells == [] else cells
 
-    args = parser.parse_args()
+
+def _target(value):
+    return int(value) if value.isdigit() else value
+
+
+def _parse_args(parser, argv):
+    args = parser.parse_args(argv)
 
     if args.return_mode not in ['except', 'parametrised_only']:
         args.return_mode = json.loads(args.return_mode)
 
     args.jsonable_parameter = json.loads(args.jsonable_parameter)
-    
+
     if args.ep_kwargs is not None:
         args.ep_kwargs = json.loads(args.ep_kwargs)
-    res = run_jnb(input_path=args.input_path, output_path=args.output_path,
-                  execution_path=args.execution_path,
-                  return_mode=args.return_mode, overwrite=args.overwrite,
-                  timeout=args.timeout, kernel_name=args.kernel_name,
-                  ep_kwargs=args.ep_kwargs, end_cell_index=args.end_cell_index,
-                  jsonable_parameter=args.jsonable_parameter,
-                  arg=args.arg)
+    return args
 
-    output = StringIO()
-    writer = csv.writer(output)
 
-    if args.verbose is None:
+def _main_submit(argv):
+    parser = _parser('Add runs of a jupyter notebook to a job queue executed by "run_jnb worker". '
+                     'The id of each submitted job is written.', prog='run_jnb submit')
+    parser.add_argument('-q', "--queue_dir", help="folder of the job queue.", required=True, type=str)
+    parser.add_argument("--max_attempts", help="maximum number of executions of a job whose worker died or failed.",
+                        default=3, type=int)
+    args = _parse_args(parser, argv)
+    if args.collect is not None:
+        parser.error("--collect is not supported by the job queue.")
+    if args.watch:
+        parser.error("--watch is not supported by the job queue.")
+
+    from .job_queue import JobQueue
+
+    queue = JobQueue(args.queue_dir, max_attempts=args.max_attempts)
+    options = dict(output_path=args.output_path, execution_path=args.execution_path,
+                   return_mode=args.return_mode, overwrite=args.overwrite,
+                   timeout=args.timeout, kernel_name=args.kernel_name,
+                   ep_kwargs=args.ep_kwargs, end_cell_index=args.end_cell_index,
+                   jsonable_parameter=args.jsonable_parameter, checkpoint=args.checkpoint,
+                   result_cache=args.result_cache, input_files=args.input_file,
+                   blob_dir=args.blob_dir, blob_threshold=args.blob_threshold, targets=args.target,
+                   profile=_profile(args.profile), profile_stats=args.profile_stats,
+                   param_dir=args.param_dir, param_threshold=args.param_threshold, timing=args.timing)
+
+    if args.arg_lines is None:
+        params = [_jupyter_kwargs(args.arg, {})]
+    elif args.arg_lines == '-':
+        params = [_jupyter_kwargs(args.arg, json.loads(line)) for line in sys.stdin if line.strip()]
+    else:
+        with open(args.arg_lines) as f:
+            params = [_jupyter_kwargs(args.arg, json.loads(line)) for line in f if line.strip()]
+
+    for param in params:
+        print(queue.submit(args.input_path, param, **options))
+
+
+def _main_worker(argv):
+    parser = argparse.ArgumentParser(description='Execute the jobs of a job queue filled by "run_jnb submit". '
+                                     'Many workers (on machines sharing the queue folder) can use the same queue.',
+                                     prog='run_jnb worker')
+    parser.add_argument('-q', "--queue_dir", help="folder of the job queue.", required=True, type=str)
+    parser.add_argument('-J', "--jobs", help="number of jobs executed concurrently.", default=1, type=int)
+    parser.add_argument("--lease", help="number of seconds without heartbeat after which a running job is retried by another worker.",
+                        default=60, type=float)
+    parser.add_argument("--poll_interval", help="number of seconds between two checks of an empty queue.",
+                        default=1, type=float)
+    parser.add_argument("--exit_when_empty", help="stop when the queue is empty.",
+                        action='store_true', default=False)
+    parser.add_argument('-f', "--format", help="format of the returned output.",
+                        choices=['csv', 'jsonl'], default='csv')
+    parser.add_argument("-v", "--verbose", help="verbose mode to write the output of each finished job, starting with the job id (see run_jnb -h). -v is the default.",
+                        action='count')
+    parser.add_argument("--timing", help="append the total time, the kernel startup time and the slowest cells of each job (measured for the jobs submitted with --timing).",
+                        action='store_true', default=False)
+    args = parser.parse_args(argv)
+
+    from .job_queue import JobQueue
+
+    queue = JobQueue(args.queue_dir, lease=args.lease)
+    for job_id, res in queue.work(jobs=args.jobs, poll_interval=args.poll_interval,
+                                  exit_when_empty=args.exit_when_empty):
+        if res is None:
+            sys.stderr.write('Job {} failed: {}\n'.format(job_id, queue.job(job_id)[1]['error']))
+        else:
+            sys.stdout.write(_format_output(res, args.verbose or 1, args.format, index=job_id, timing=args.timing))
+        sys.stdout.flush()
+
+
+def _main_serve(argv):
+    parser = argparse.ArgumentParser(description='Serve the execution of jupyter notebooks over HTTP with warm kernels '
+                                     'and cached analyses. POST /run a json object {"input_path": ..., "params": {...}} '
+                                     'with the options of "run_jnb submit" (e.g. "return_mode", "timeout") '
+                                     'to get {"output": {...}}, GET /status for the number of runs.',
+                                     prog='run_jnb serve')
+    parser.add_argument("--host", help="host of the server.", default='127.0.0.1', type=str)
+    parser.add_argument("--port", help="port of the server.", default=8765, type=int)
+    parser.add_argument('-J', "--jobs", help="number of kernels (per kernel name), i.e. of runs executed concurrently.",
+                        default=1, type=int)
+    parser.add_argument("--prelude", help="code (e.g. the imports) executed in every kernel before the runs.",
+                        default=None, type=str)
+    parser.add_argument("--max_memory", help="maximum resident memory (in bytes) of a kernel before it is restarted.",
+                        default=None, type=int)
+    parser.add_argument('-k', "--kernel_name", help="name of a kernel started with the server (can be repeated). By default python3.",
+                        default=None, action='append')
+    parser.add_argument("-v", "--verbose", help="log the requests.", action='store_true', default=False)
+    args = parser.parse_args(argv)
+
+    from .kernel_pool import KernelPool
+    from .server import NotebookServer
+
+    kernel_pool = KernelPool(size=args.jobs, prelude=args.prelude, max_memory=args.max_memory)
+    with NotebookServer((args.host, args.port), kernel_pool=kernel_pool, verbose=args.verbose,
+                        kernel_names=args.kernel_name or ['python3']) as server:
+        sys.stderr.write('Serving on http://{}:{}\n'.format(*server.server_address[:2]))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            kernel_pool.shutdown()
+
+
+def _main_pipeline(argv):
+    parser = argparse.ArgumentParser(description='Execute a pipeline of jupyter notebooks defined by a json file '
+                                     '{"nodes": [{"name": ..., "input_path": ..., "params": {...}, "depends_on": [...], '
+                                     '"inputs": [...], "outputs": [...]}, ...]} where the other keys of a node are '
+                                     'the options of run_jnb (e.g. "return_mode", "timeout"). The relative paths are '
+                                     'relative to the folder of the json file. The independent nodes are executed '
+                                     'in parallel.',
+                                     prog='run_jnb pipeline')
+    parser.add_argument("spec_path", help="path of the json file of the pipeline.", type=str)
+    parser.add_argument('-J', "--jobs", help="number of nodes executed concurrently (by default the number of CPUs).",
+                        default=None, type=int)
+    parser.add_argument('-R', "--result_cache", help="folder of a result cache, the nodes whose notebook, parameters "
+                        "and input files did not change are not executed again.", default=None, type=str)
+    parser.add_argument('-f', "--format", help="format of the returned output.",
+                        choices=['csv', 'jsonl'], default='csv')
+    parser.add_argument("-v", "--verbose", help="verbose mode to write the output of each finished node, starting with the node name (see run_jnb -h). -v is the default.",
+                        action='count')
+    parser.add_argument("--timing", help="measure the cells of the nodes without a timing option (see run_jnb --timing) and append the total time, the kernel startup time and the slowest cells of each node.",
+                        action='store_true', default=False)
+    args = parser.parse_args(argv)
+
+    from .cache import ResultCache
+    from .pipeline import Pipeline
+
+    with open(args.spec_path) as f:
+        spec = json.load(f)
+    if args.timing:
+        for node in spec['nodes']:
+            node.setdefault('timing', True)
+    result_cache = None if args.result_cache is None else ResultCache(args.result_cache)
+    pipeline = Pipeline.from_dict(spec, base_path=os.path.dirname(os.path.abspath(args.spec_path)),
+                                  max_workers=args.jobs, result_cache=result_cache)
+    for name, res in pipeline.run():
+        if res is None:
+            sys.stderr.write('Node {} not executed: its run or a dependency failed.\n'.format(name))
+        else:
+            sys.stdout.write(_format_output(res, args.verbose or 1, args.format, index=name, timing=args.timing))
+        sys.stdout.flush()
+
+
+def _main_watch(parser, args):
+    unsupported = [option for option, value in [('--arg_lines', args.arg_lines), ('--checkpoint', args.checkpoint),
+                                                ('--result_cache', args.result_cache), ('--blob_dir', args.blob_dir),
+                                                ('--param_dir', args.param_dir), ('--target', args.target),
+                                                ('--collect', args.collect), ('--profile', args.profile)]
+                   if value is not None]
+    if unsupported:
+        parser.error('{} not supported with --watch.'.format(', '.join(unsupported)))
+    if args.return_mode == 'parametrised_only':
+        parser.error("--return_mode parametrised_only is not supported with --watch.")
+
+    from .watch import run_jnb_watch
+
+    try:
+        for res in run_jnb_watch(args.input_path, output_path=args.output_path,
+                                 execution_path=args.execution_path,
+                                 return_mode=args.return_mode, overwrite=args.overwrite,
+                                 timeout=args.timeout, kernel_name=args.kernel_name,
+                                 ep_kwargs=args.ep_kwargs, end_cell_index=args.end_cell_index,
+                                 jsonable_parameter=args.jsonable_parameter,
+                                 timing=args.timing, arg=args.arg, poll_interval=args.poll_interval):
+            sys.stdout.write(_format_output(res, args.verbose or 1, args.format, timing=args.timing))
+            sys.stdout.flush()
+    except KeyboardInterrupt:
         pass
-    elif args.verbose == 1:
-        writer.writerow(res[:2])
-    elif args.verbose == 2:
-        writer.writerow(res[:-1])
-    elif args.verbose > 2:
-        writer.writerow(res[:])
 
-    if args.verbose is not None:
-        print(output.getvalue())
+
+def _main_batch(args):
+    from .sweep import run_jnb_many
+    from .scheduler import ResourceScheduler
+
+    if args.arg_lines == '-':
+        lines = sys.stdin
+    else:
+        lines = open(args.arg_lines)
+
+    def params():
+        for line in lines:
+            if line.strip():
+                yield _jupyter_kwargs(args.arg, json.loads(line))
+
+    scheduler = None
+    if args.max_memory is not None or args.max_load is not None:
+        scheduler = ResourceScheduler(max_memory=args.max_memory, max_load=args.max_load)
+    resources = None if args.memory is None else {'memory': args.memory}
+
+    try:
+        for index, res in run_jnb_many(args.input_path, params(), max_workers=args.jobs,
+                                       output_path=args.output_path,
+                                       execution_path=args.execution_path,
+                                       return_mode=args.return_mode, overwrite=args.overwrite,
+                                       timeout=args.timeout, kernel_name=args.kernel_name,
+                                       ep_kwargs=args.ep_kwargs, end_cell_index=args.end_cell_index,
+                                       jsonable_parameter=args.jsonable_parameter,
+                                       checkpoint=args.checkpoint,
+                                       result_cache=args.result_cache,
+                                       input_files=args.input_file, targets=args.target,
+                                       collect=args.collect, profile=_profile(args.profile),
+                                       profile_stats=args.profile_stats,
+                                       blob_store=args.blob_dir, param_store=args.param_dir,
+                                       fork=args.fork, timing=args.timing,
+                                       scheduler=scheduler, resources=resources):
+            sys.stdout.write(_format_output(res, args.verbose or 1, args.format, index=index,
+                                            timing=args.timing))
+            sys.stdout.flush()
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+
+
+def _jsonable(value):
+    # numpy arrays of the collected variables
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(value).__name__))
+
+
+def _format_output(res, verbose, format='csv', index=None, timing=False):
+    if verbose == 1:
+        fields = res._fields[:2]
+    elif verbose == 2:
+        fields = res._fields[:4]
+    else:
+        fields = res._fields[:5]
+    if timing:
+        fields += ('total_time', 'kernel_startup_time', 'slowest_cells')
+    if getattr(res, 'variables', None) is not None:
+        fields += ('variables',)
+    row = [getattr(res, field) for field in fields]
+
+    if format == 'jsonl':
+        row = dict(zip(fields, row))
+        if index is not None:
+            row = {'index': index, **row}
+        return json.dumps(row, default=_jsonable) + '\n'
+
+    output = StringIO()
+    writer = csv.writer(output)
+    row = [json.dumps(value, default=_jsonable) if field in ('slowest_cells', 'variables') and value is not None
+           else value for field, value in zip(fields, row)]
+    if index is not None:
+        row = [index] + row
+    writer.writerow(row)
+    return output.getvalue()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import time
+
+from .util import _process_pss, _descendant_pids, _available_memory
+
+
+class ResourceScheduler:
+    """
+    Admission control of concurrent notebook runs based on their resources.
+
+    Each run declares the memory (in bytes) and the number of CPUs it needs (resource
+    hints). A new run is admitted only if, with its hints added, the memory used by the
+    running runs stays below max_memory, their CPUs below max_cpus, the memory available
+    on the machine above min_available_memory and the 1 minute load average below max_load.
+    The memory used by the running runs is the largest of the sum of their hints and the
+    measured memory of their kernels, so the runs using more than declared are taken into
+    account. The kernels are the processes started by the worker processes of this process
+    (including their own subprocesses), so the idle workers are not counted, and their memory
+    is their proportional set size, so the pages they share are counted once. The measure is
+    cached during poll_interval seconds.
+    A run is always admitted if no other run is running.
+
+    Parameters
+    ----------
+    max_memory : int, optional
+        Maximum memory (in bytes) used by the running runs.
+    max_cpus : int, optional
+        Maximum number of CPUs used by the running runs.
+    min_available_memory : int, optional
+        Minimum memory (in bytes) left available on the machine.
+    max_load : float, optional
+        The new runs are admitted only while the 1 minute load average is below max_load.
+    poll_interval : float, optional
+        Number of seconds between two admission attempts of a queued run (and between two
+        measures of the memory).
+
+    >>> scheduler = ResourceScheduler(max_cpus=2)
+    >>> scheduler.try_admit('a', cpus=2), scheduler.try_admit('b', cpus=1)
+    (True, False)
+    >>> scheduler.release('a')
+    >>> scheduler.try_admit('b', cpus=1)
+    True
+    """
+    def __init__(self, max_memory=None, max_cpus=None, min_available_memory=None,
+                 max_load=None, poll_interval=0.5):
+        self.max_memory = max_memory
+        self.max_cpus = max_cpus
+        self.min_available_memory = min_available_memory
+        self.max_load = max_load
+        self.poll_interval = poll_interval
+        self._running = {}
+        self._lock = threading.Lock()
+        self._measure = (None, None)
+
+    def try_admit(self, key, memory=0, cpus=1):
+        """
+        Admit the run identified by key if the resources allow it.
+
+        Returns
+        -------
+        bool
+            True if the run is admitted. The admitted runs should be released when they are finished.
+        """
+        with self._lock:
+            if self._running and not self._has_capacity(memory, cpus):
+                return False
+            self._running[key] = (memory, cpus)
+            return True
+
+    def release(self, key):
+        """Release the resources of an admitted run."""
+        with self._lock:
+            self._running.pop(key, None)
+
+    def usage(self):
+        """
+        Resources used by the running runs and the state of the machine.
+
+        Returns
+        -------
+        dict
+            {'runs', 'memory', 'cpus', 'available_memory', 'load'} where memory is the largest of the sum
+            of the hints and the measured memory of the kernels. The unknown values are None.
+        """
+        with self._lock:
+            running = list(self._running.values())
+        memory = sum(m for m, _ in running)
+        measured = self._measured_memory()
+        if measured is not None:
+            memory = max(memory, measured)
+        try:
+            load = os.getloadavg()[0]
+        except (AttributeError, OSError):
+            load = None
+        return {'runs': len(running), 'memory': memory, 'cpus': sum(c for _, c in running),
+                'available_memory': _available_memory(), 'load': load}
+
+    def _has_capacity(self, memory, cpus):
+        if self.max_cpus is not None and sum(c for _, c in self._running.values()) + cpus > self.max_cpus:
+            return False
+        if self.max_memory is not None:
+            used = sum(m for m, _ in self._running.values())
+            measured = self._measured_memory()
+            if measured is not None:
+                used = max(used, measured)
+            if used + memory > self.max_memory:
+                return False
+        if self.min_available_memory is not None:
+            available = _available_memory()
+            if available is not None and available - memory < self.min_available_memory:
+                return False
+        if self.max_load is not None:
+            try:
+                if os.getloadavg()[0] >= self.max_load:
+                    return False
+            except (AttributeError, OSError):
+                pass
+        return True
+
+    def _measured_memory(self):
+        # scanning the processes is costly, the measure is reused between polls
+        measured_at, measured = self._measure
+        now = time.monotonic()
+        if measured_at is None or now - measured_at >= self.poll_interval:
+            measured = _kernels_memory()
+            self._measure = (now, measured)
+        return measured
+
+
+def _kernels_memory():
+    # the children are the worker processes, the kernels (and the processes they
+    # start) are their descendants
+    memory = [_process_pss(pid) for pid in _descendant_pids(os.getpid(), min_depth=2)]
+    memory = [m for m in memory if m is not None]
+    return sum(memory) if memory else None
+
+
+def _resources(nb, resources=None):
+    """
+    Resource hints of a run: the keys memory and cpus of resources or else of the
+    notebook metadata run_jnb.resources.
+    """
+    hints = dict(nb['metadata'].get('run_jnb', {}).get('resources', {}))
+    hints.update(resources or {})
+    return {'memory': hints.get('memory', 0), 'cpus': hints.get('cpus', 1)}
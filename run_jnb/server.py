@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import http.server
+import json
+import socketserver
+import threading
+
+from .core import run_jnb
+from .cache import AnalysisCache
+from .kernel_pool import KernelPool
+from .job_queue import _run_options
+
+
+class NotebookServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """
+    Long-lived HTTP server executing notebooks with warm state.
+
+    The server keeps the imported modules, an analysis cache of the notebooks and a
+    pool of started kernels, so a run does not pay the process startup, the imports,
+    the analysis of the notebook nor the kernel startup: the execution modules are
+    imported and the kernels of kernel_names are started with the server. The requests are handled
+    concurrently (at most the size of the kernel pool are executed at the same time).
+
+    POST /run with a json object {"input_path": ..., "params": {...}, ...} where the
+    other keys are the json serialisable options of run_jnb (see JobQueue.submit)
+    answers {"output": {...}} with the fields of the output of run_jnb. The relative
+    paths are relative to the working directory of the server. GET /status answers the
+    number of runs executed, failed and running. An invalid request is answered with
+    the status 400 and a failed run with 500, both as {"error": ...}.
+
+    Parameters
+    ----------
+    server_address : tuple, optional
+        (host, port) of the server. The port 0 selects a free port (see server_address).
+    kernel_pool : run_jnb.KernelPool, optional
+        Kernels used by the runs. By default a pool of one kernel per kernel name is
+        created and shut down by server_close.
+    analysis_cache : run_jnb.AnalysisCache, optional
+        Cache of the possible parameters of the notebooks.
+    verbose : bool, optional
+        Log the requests to stderr.
+    kernel_names : list, optional
+        Names of the kernels started with the server (all the kernels of the pool). The
+        kernels of the other names are started by the first requests using them.
+    """
+    daemon_threads = True
+
+    def __init__(self, server_address=('127.0.0.1', 8765), kernel_pool=None,
+                 analysis_cache=None, verbose=False, kernel_names=('python3',)):
+        self._own_kernel_pool = kernel_pool is None
+        self.kernel_pool = KernelPool() if kernel_pool is None else kernel_pool
+        self.analysis_cache = AnalysisCache() if analysis_cache is None else analysis_cache
+        self.verbose = verbose
+        self._counts = {'executed': 0, 'failed': 0, 'running': 0}
+        self._lock = threading.Lock()
+        super().__init__(server_address, _Handler)
+        try:
+            # the first requests do not pay the imports nor the kernel startup
+            from . import execute  # noqa: F401
+            for kernel_name in kernel_names:
+                self.kernel_pool.start(kernel_name)
+        except:
+            self.server_close()
+            raise
+
+    def run(self, request):
+        """
+        Execute a run request (decoded json object) and return the output of run_jnb.
+
+        Raises
+        ------
+        TypeError, ValueError
+            If the request is invalid.
+        """
+        if not isinstance(request, dict) or not isinstance(request.get('input_path'), str):
+            raise ValueError('The request should be a json object with an input_path.')
+        request = dict(request)
+        input_path = request.pop('input_path')
+        params = request.pop('params', None) or {}
+        if not isinstance(params, dict):
+            raise ValueError('params should be a json object.')
+        options = _run_options(request)
+
+        with self._lock:
+            self._counts['running'] += 1
+        try:
+            res = run_jnb(input_path, arg=json.dumps(params), kernel_pool=self.kernel_pool,
+                          analysis_cache=self.analysis_cache, **options)
+        except Exception:
+            with self._lock:
+                self._counts['failed'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._counts['running'] -= 1
+        with self._lock:
+            self._counts['executed'] += 1
+        return res
+
+    def status(self):
+        """Number of runs executed, failed and running."""
+        with self._lock:
+            return dict(self._counts)
+
+    def server_close(self):
+        super().server_close()
+        if self._own_kernel_pool:
+            self.kernel_pool.shutdown()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path != '/status':
+            self._reply(404, {'error': 'Unknown path {}'.format(self.path)})
+            return
+        self._reply(200, self.server.status())
+
+    def do_POST(self):
+        if self.path != '/run':
+            self._reply(404, {'error': 'Unknown path {}'.format(self.path)})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError as e:
+            self._reply(400, {'error': 'Invalid json: {}'.format(e)})
+            return
+        try:
+            res = self.server.run(request)
+        except (TypeError, ValueError) as e:
+            self._reply(400, {'error': str(e)})
+        except Exception as e:
+            self._reply(500, {'error': repr(e)})
+        else:
+            self._reply(200, {'output': res._asdict()})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _reply(self, status, content):
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
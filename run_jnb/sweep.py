@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+import concurrent.futures
+import copy
+import os
+import time
+import traceback
+from concurrent.futures.process import BrokenProcessPool
+
+from .core import _DEFAULT_TIMEOUT, _DEFAULT_KERNEL_NAME, _check_input_path, \
+ _output_path, _execution_path, _jupyter_kwargs, _clean_nb, _parametrise_nb, _prune_nb, _run_nb, _check_collect, \
+ _check_profile, Output
+from .util import _read_nb
+from .jnb_helper import _JupyterNotebookHelper
+from .scheduler import _resources
+
+
+def run_jnb_many(input_path, params, max_workers=None,
+                 output_path=r"///_run_jnb/*-output",
+                 execution_path=r'///input',
+                 return_mode='except',
+                 overwrite=False,
+                 timeout=_DEFAULT_TIMEOUT,
+                 kernel_name=_DEFAULT_KERNEL_NAME,
+                 ep_kwargs=None, jsonable_parameter=True, end_cell_index=None,
+                 analysis_cache=None, checkpoint=None, result_cache=None, input_files=None,
+                 blob_store=None, fork=False, scheduler=None, resources=None, targets=None,
+                 collect=None, profile=None, profile_stats=False, param_store=None, timing=False):
+    """
+    Run an input jupyter notebook file for many parametrisations in parallel.
+
+    The notebook is read, cleaned and analysed only once. Each element of params
+    is used to parametrise a copy of the notebook and the copies are executed in a
+    pool of processes.
+
+    Parameters
+    ----------
+    input_path : str
+        Path of the input jupyter notebook.
+    params : iterable
+        Parameter sets. Each element is a dictionary of json serialisable keyword
+        arguments or a json file path / json formatted string (see arg in run_jnb).
+    max_workers : int, optional
+        Maximum number of processes used to execute the notebooks.
+        If None, the number of processors on the machine is used.
+    output_path, execution_path, return_mode, overwrite, timeout, kernel_name,
+    ep_kwargs, jsonable_parameter, end_cell_index, analysis_cache, checkpoint,
+    result_cache, input_files, blob_store, param_store, timing :
+        See run_jnb. A parameter shared by many parameter sets is written once in param_store.
+    fork : bool, optional
+        If True, the cells before the first cell defining a possible parameter are
+        executed only once and the kernel is forked (POSIX only) for each parameter set
+        to execute the remaining cells. max_workers children run concurrently in the
+        forked kernel. The notebook should not use top-level await after the prefix
+        and the order between the stream and the display outputs of a cell is not kept.
+        checkpoint, scheduler, collect and profile are not supported.
+    scheduler : run_jnb.ResourceScheduler, optional
+        Scheduler admitting a new run only if the resources allow it. The other runs
+        wait (at most max_workers runs are executed concurrently).
+    resources : dict, optional
+        Resource hints of each run for the scheduler: memory (in bytes) and cpus.
+        By default the hints are read from the notebook metadata run_jnb.resources
+        (e.g. {"run_jnb": {"resources": {"memory": 4000000000, "cpus": 2}}}), otherwise
+        0 bytes and 1 CPU are assumed.
+    targets : list, optional
+        Cell indices and variable names needed from each execution, see run_jnb.
+    collect : list, optional
+        Names of the kernel variables returned in each output, see run_jnb (not supported with fork).
+    profile, profile_stats :
+        Profiling of the cells of each execution, see run_jnb (not supported with fork).
+
+    Yields
+    ------
+    tuple
+        (index, output) as soon as a parametrisation is finished, where index is
+        the position of the parameter set in params and output is the
+        collections.namedtuple returned by run_jnb. If the run raised an exception
+        (e.g. a cell timed out or the kernel died), the error fields of the output
+        are the type, the message and the traceback of the exception, and the other
+        runs go on.
+    """
+    _check_input_path(input_path)
+    output_path = _output_path(input_path, output_path)
+    execution_path = _execution_path(input_path, execution_path)
+
+    if ep_kwargs is None:
+        ep_kwargs = {}
+
+    if return_mode not in ['parametrised_only', 'except', True, False]:
+        raise TypeError("return mode is not valid!")
+    _check_collect(collect, result_cache)
+    _check_profile(profile, result_cache)
+
+    nb = _read_nb(input_path, outputs=False)
+    _clean_nb(nb)
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    nbs = _parametrised_nbs(nb, params, jsonable_parameter, end_cell_index, analysis_cache,
+                            targets, param_store, execution_path)
+
+    if fork and return_mode != 'parametrised_only':
+        if not hasattr(os, 'fork'):
+            raise ValueError("fork is available only on POSIX systems.")
+        if checkpoint is not None or scheduler is not None or collect is not None or profile:
+            raise ValueError("checkpoint, scheduler, collect and profile are not supported with fork.")
+        from .fork import _run_forked
+
+        jnh = _JupyterNotebookHelper(nb, jsonable_parameter, end_cell_index, analysis_cache)
+        prefix_length = min(jnh.param_cell_index.values(), default=len(nb['cells']))
+        yield from _run_forked(nbs, prefix_length, output_path, execution_path, return_mode,
+                               overwrite, timeout, kernel_name, ep_kwargs, max_workers,
+                               result_cache, input_files, input_path, blob_store, timing)
+        return
+
+    if scheduler is None:
+        # bound the number of parametrised notebooks waiting in memory
+        max_pending = 2 * max_workers
+    else:
+        # the admitted runs are started at once
+        max_pending = max_workers
+    sweep = object()
+
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+    pending = {}
+    waiting = None
+    try:
+        while True:
+            while len(pending) < max_pending:
+                if waiting is None:
+                    waiting = next(nbs, None)
+                    if waiting is None:
+                        break
+                index, param_nb = waiting
+                if scheduler is not None and not scheduler.try_admit(
+                        (sweep, index), **_resources(param_nb, resources)):
+                    break
+                future = executor.submit(_run_nb, param_nb, output_path,
+                                         execution_path, return_mode, overwrite,
+                                         timeout, kernel_name, ep_kwargs,
+                                         checkpoint=checkpoint, result_cache=result_cache,
+                                         input_files=input_files, input_path=input_path,
+                                         blob_store=blob_store, collect=collect,
+                                         profile=profile, profile_stats=profile_stats,
+                                         timing=timing)
+                pending[future] = index
+                waiting = None
+
+            if not pending:
+                if waiting is None:
+                    break
+                # the resources are used by runs of other sweeps sharing the scheduler
+                time.sleep(scheduler.poll_interval)
+                continue
+
+            # a run waiting for resources is admitted again after poll_interval
+            wait_timeout = None if waiting is None else scheduler.poll_interval
+            done, _ = concurrent.futures.wait(pending, timeout=wait_timeout,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                index = pending.pop(future)
+                if scheduler is not None:
+                    scheduler.release((sweep, index))
+                try:
+                    res = future.result()
+                except Exception as e:
+                    broken = broken or isinstance(e, BrokenProcessPool)
+                    res = _exception_output(e)
+                yield index, res
+            if broken:
+                # the pending runs of the broken pool fail, the next ones use a new pool
+                executor.shutdown(wait=False)
+                executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+    finally:
+        if scheduler is not None:
+            for index in pending.values():
+                scheduler.release((sweep, index))
+        executor.shutdown()
+
+
+def _exception_output(e):
+    # an exception stopping a run is reported as an error of the run
+    return Output(output_nb_path=None, error_prompt_number=None, error_type=type(e).__name__,
+                  error_value=str(e), error_traceback=traceback.format_exception(type(e), e, e.__traceback__))
+
+
+def _parametrised_nbs(nb, params, jsonable_parameter, end_cell_index, analysis_cache,
+                      targets=None, param_store=None, execution_path='.'):
+    jnh = None
+    for index, param in enumerate(params):
+        if isinstance(param, dict):
+            jupyter_kwargs = _jupyter_kwargs(None, param)
+        else:
+            jupyter_kwargs = _jupyter_kwargs(param, {})
+
+        param_nb = copy.deepcopy(nb)
+        if jupyter_kwargs != {}:
+            if jnh is None:
+                jnh = _JupyterNotebookHelper(nb, jsonable_parameter, end_cell_index,
+                                             analysis_cache)
+            _parametrise_nb(param_nb, jnh, jupyter_kwargs, param_store, execution_path)
+        _prune_nb(param_nb, targets)
+        yield index, param_nb
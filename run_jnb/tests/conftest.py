@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+import nbformat
+import pytest
+
+
+@pytest.fixture
+def write_notebook():
+    """
+    Function writing a python3 notebook to a path and returning the path.
+
+    The cells are code cell sources (str) or notebook cells (e.g. a markdown cell).
+    """
+    def write(path, *cells):
+        nb = nbformat.v4.new_notebook()
+        nb['cells'] = [nbformat.v4.new_code_cell(cell) if isinstance(cell, str) else cell for cell in cells]
+        nb['metadata']['kernelspec'] = {'name': 'python3', 'display_name': 'Python 3', 'language': 'python'}
+        nb['metadata']['language_info'] = {'name': 'python', 'version': '3'}
+        nbformat.write(nb, path)
+        return path
+
+    return write
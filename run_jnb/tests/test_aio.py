@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+import threading
+import pytest
+from .. import blob_store, execute
+from ..aio import run_jnb_async
+from ..kernel_pool import KernelPool
+
+
+def test_run_jnb_async(tmp_path):
+    input_path = r'./example/Power_function.ipynb'
+    output_path = os.path.join(str(tmp_path), '*-output')
+
+    async def run_many():
+        return await asyncio.gather(
+            run_jnb_async(input_path, output_path=output_path, return_mode=True, exponent=1),
+            run_jnb_async(input_path, output_path=output_path, exponent=1, np_arange_args={'step': 0.1}),
+            run_jnb_async(input_path, output_path=output_path, return_mode=False, arg='{"exponent": 2}'))
+
+    res = asyncio.run(run_many())
+    assert res[0][1:5] == (None, None, None, None)
+    assert os.path.exists(res[0].output_nb_path)
+    assert res[1][1:3] == (3, 'TypeError')
+    assert res[2][:5] == (None, None, None, None, None)
+
+    with KernelPool() as pool:
+        res = asyncio.run(run_jnb_async(input_path, output_path=output_path, return_mode=False,
+                                        kernel_pool=pool, exponent=1, np_arange_args={'step': 0.1}))
+        assert res[:3] == (None, 3, 'TypeError')
+        assert len(pool._idle['python3']) == 1
+
+
+def test_run_jnb_async_cancel(tmp_path, write_notebook):
+    input_path = write_notebook(os.path.join(str(tmp_path), 'sleep.ipynb'), 'import time\ntime.sleep(60)')
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(asyncio.wait_for(run_jnb_async(input_path, checkpoint=0), 5))
+    # the checkpoint is written when the execution is cancelled
+    assert os.listdir(os.path.join(str(tmp_path), '_run_jnb')) == ['sleep-output.ipynb']
+
+
+def test_run_jnb_async_hooks_in_executor(tmp_path, monkeypatch, write_notebook):
+    # the checkpoints and the blobs are written outside of the event loop thread
+    input_path = write_notebook(os.path.join(str(tmp_path), 'nb.ipynb'), "'x' * 100")
+
+    threads = []
+
+    def recorded(function):
+        def record(*args, **kwargs):
+            threads.append(threading.get_ident())
+            return function(*args, **kwargs)
+        return record
+    monkeypatch.setattr(execute, '_write_nb', recorded(execute._write_nb))
+    monkeypatch.setattr(blob_store, '_write_atomic', recorded(blob_store._write_atomic))
+    store = blob_store.BlobStore(os.path.join(str(tmp_path), 'blobs'), threshold=10)
+
+    async def run():
+        return threading.get_ident(), await run_jnb_async(input_path, checkpoint=0, blob_store=store)
+
+    loop_thread, res = asyncio.run(run())
+    assert res.error_type is None
+    assert len(threads) >= 3
+    assert loop_thread not in threads
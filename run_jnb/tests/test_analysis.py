@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+import copy
+import nbformat
+import pytest
+from nbconvert import PythonExporter
+from ..analysis import _cell_index_of_possible_param, ipython_to_python
+from ..util import _read_nb, sort_dict, variable_status
+
+
+def _exporter_cell_index_of_possible_param(nb, jsonable_parameter, end_cell_index):
+    # analysis based on nbconvert.PythonExporter used as reference
+    index_of_params = {}
+    exclude_variable = set()
+    exporter = PythonExporter()
+    new_nb = copy.deepcopy(nb)
+    param_value = {}
+    for i, cell in enumerate(nb['cells'][:end_cell_index]):
+        if cell['cell_type'] == 'code':
+            new_nb['cells'] = [cell]
+            source, _ = exporter.from_notebook_node(new_nb)
+            params, exclude_variable, _param_value = variable_status(source,
+                                                                     exclude_variable, jsonable_parameter)
+            param_value = {**param_value, **_param_value}
+            for param in params:
+                if param not in index_of_params.keys():
+                    index_of_params[param] = i
+    return sort_dict(index_of_params, by='value'), param_value
+
+
+def test_ipython_to_python():
+    assert ipython_to_python("!ls\na = 1") == "get_ipython().system('ls')\na = 1\n"
+    assert ipython_to_python("a = 1") == "a = 1\n"
+
+
+def test_cell_index_of_possible_param():
+    nb = nbformat.v4.new_notebook()
+    nb['cells'] = [nbformat.v4.new_code_cell(source) for source in [
+        '%matplotlib inline\nimport numpy as np',
+        'a = 1\nb, c = 2, [3]\n# comment',
+        'd = np.pi',
+        '%%time\ne = 5',
+        'f = 1\na = 2',
+        'g = {"h": a}\ni = (1, 2)',
+        '',
+        'def k(x):\n    return x',
+        'l = 1\nl += 1',
+        'm = 1',
+        'print(m)\nm = 2']]
+    nb['cells'].insert(3, nbformat.v4.new_markdown_cell('n = 1'))
+
+    for path_or_nb in [nb, './example/Power_function.ipynb', './example/Getting Started.ipynb']:
+        if isinstance(path_or_nb, str):
+            path_or_nb = _read_nb(path_or_nb)
+        for jsonable_parameter in [True, False]:
+            for end_cell_index in [None, 3, 7]:
+                assert _cell_index_of_possible_param(path_or_nb['cells'], jsonable_parameter, end_cell_index) == \
+                    _exporter_cell_index_of_possible_param(path_or_nb, jsonable_parameter, end_cell_index)
+
+
+def test_required_cells():
+    from ..analysis import _required_cells
+
+    def cells(*sources):
+        return [nbformat.v4.new_code_cell(source) for source in sources]
+
+    nb_cells = cells("import numpy as np", "data = [1, 2]", "np.random.seed(0)\nnoise = np.random.rand(2)",
+                     "data[1] = 3", "summary = len(data)", "# exploration\nprint(noise)")
+    nb_cells.insert(1, nbformat.v4.new_markdown_cell("Data"))
+    # the mutation of data is needed, the seed and the import of np are not
+    assert _required_cells(nb_cells, ['summary']) == {2, 4, 5}
+    assert _required_cells(nb_cells, [6]) == {0, 3, 6}
+    assert _required_cells(nb_cells, []) == set()
+
+    # shell commands and safe magics before a needed cell are executed
+    assert _required_cells(cells("!pip list", "%matplotlib inline\na = 1", "b = 2", "a"), [3]) == {0, 1, 3}
+    assert _required_cells(cells("a = 1", "b = 2", "c = 3"), ['b']) == {1}
+    # a cell calling functions needs the previous cells changing the state outside the namespace
+    assert _required_cells(cells("import sys", "sys.path.append('lib')", "import mylib\nr = mylib.f()"),
+                           ['r']) == {0, 1, 2}
+    assert _required_cells(cells("import numpy as np", "a = 1", "np.random.seed(0)", "x = np.random.rand(3)"),
+                           ['x']) == {0, 2, 3}
+    assert _required_cells(cells("import os", "os.chdir('data')", "text = open('x.txt').read()"),
+                           ['text']) == {0, 1, 2}
+    nb_cells_io = cells("import pandas as pd", "df = pd.DataFrame({'a': [1]})", "df.to_csv('a.csv')", "b = 2",
+                        "copy = pd.read_csv('a.csv')")
+    assert _required_cells(nb_cells_io, ['copy']) == {0, 1, 2, 4}
+    assert _required_cells(nb_cells_io, ['b']) == {3}
+    # opaque cells: all the code cells up to the target are executed
+    assert _required_cells(cells("a = 1", "exec('b = 2')", "b", "c = 3"), [2]) == {0, 1, 2}
+    assert _required_cells(cells("a = 1", "%run script.py", "b"), ['a']) == {0}
+    assert _required_cells(cells("a = 1", "%run script.py", "b"), [2]) == {0, 1, 2}
+    # the names local to functions and comprehensions do not hide the global ones
+    assert _required_cells(cells("a = 1", "def f():\n    a = 2\n    return a", "[a for a in range(2)]",
+                                 "b = a"), ['b']) == {0, 3}
+
+    with pytest.raises(ValueError):
+        _required_cells(nb_cells, ['unknown'])
+    with pytest.raises(ValueError):
+        _required_cells(nb_cells, [1])
+
+
+def test_incremental_cells():
+    from ..analysis import _incremental_cells
+
+    def cells(*sources):
+        return [nbformat.v4.new_code_cell(source) for source in sources]
+
+    old = cells("a = 1", "b = 2", "x = a * 10", "y = b * 10", "print(x + y)")
+    assert _incremental_cells(old, copy.deepcopy(old)) == set()
+    assert _incremental_cells(old, cells("a = 2", "b = 2", "x = a * 10", "y = b * 10", "print(x + y)")) == {0, 2, 4}
+    # the object mutated by a cell executed again is built again
+    old = cells("a = 1", "log = []", "log.append(a)", "print(log)")
+    assert _incremental_cells(old, cells("a = 2", "log = []", "log.append(a)", "print(log)")) == {0, 1, 2, 3}
+    # a cell executed again needs the value of x before the cell rebinding it
+    old = cells("a = 1", "x = 1", "y = x + a", "x = 5")
+    assert _incremental_cells(old, cells("a = 2", "x = 1", "y = x + a", "x = 5")) == {0, 1, 2, 3}
+    # a new version of a cell overwrites also the names of the old version
+    old = cells("a = 1", "b = a", "print(b)")
+    assert _incremental_cells(old, cells("a = 1", "c = a", "print(b)")) == {1, 2}
+    # the state outside the namespace (here the random generator) is read and written by the calls,
+    # so the generator is seeded again (with s, assumed to be mutated as an argument)
+    old = cells("import numpy as np", "s = 0", "np.random.seed(s)", "x = np.random.rand(3)", "y = 1")
+    assert _incremental_cells(old, cells("import numpy as np", "s = 1", "np.random.seed(s)",
+                                         "x = np.random.rand(3)", "y = 1")) == {1, 2, 3}
+    assert _incremental_cells(old, cells("import numpy as np", "s = 0", "np.random.seed(s)",
+                                         "x = np.random.rand(4)", "y = 1")) == {1, 2, 3}
+
+    assert _incremental_cells(old, old[:2]) is None
+    assert _incremental_cells(cells("a = 1", "exec('b = a')"), cells("a = 2", "exec('b = a')")) is None
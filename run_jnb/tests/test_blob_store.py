@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import copy
+import os
+import nbformat
+from ..blob_store import BlobStore
+from ..core import run_jnb
+from ..util import _read_nb
+
+
+def test_blob_store_offload(tmp_path):
+    store = BlobStore(str(tmp_path), threshold=10)
+    outputs = [nbformat.v4.new_output('stream', name='stdout', text='a' * 20),
+               nbformat.v4.new_output('stream', name='stdout', text='short'),
+               nbformat.v4.new_output('display_data', data={'text/plain': 'plot', 'image/png': 'b' * 20}),
+               nbformat.v4.new_output('execute_result', data={'application/json': {'a': 'c' * 20}},
+                                      execution_count=1)]
+    nb = nbformat.v4.new_notebook(cells=[nbformat.v4.new_code_cell('', outputs=outputs)])
+    expected = copy.deepcopy(nb)
+
+    store.offload(nb['cells'][0]['outputs'])
+    nbformat.validate(nb)
+    assert outputs[0]['text'].startswith('[run_jnb blob sha256:')
+    assert outputs[1]['text'] == 'short'
+    assert outputs[2]['data'] == {'text/plain': 'plot'}
+    assert list(outputs[2]['metadata']['run_jnb']['blobs']) == ['image/png']
+    assert outputs[3]['data'] == {}
+
+    assert store.rehydrate(nb) == expected
+    # the references are kept in the given notebook
+    assert outputs[3]['data'] == {}
+
+
+def test_run_jnb_blob_store(tmp_path):
+    input_path = r'./example/Power_function.ipynb'
+    blob_dir = os.path.join(str(tmp_path), 'blobs')
+    output_path = os.path.join(str(tmp_path), 'output.ipynb')
+    store = BlobStore(blob_dir, threshold=1000)
+
+    res = run_jnb(input_path, output_path, return_mode=True, blob_store=store)
+    nb = _read_nb(res.output_nb_path)
+    blobs = [output['metadata']['run_jnb']['blobs'] for cell in nb['cells'] if cell['cell_type'] == 'code'
+             for output in cell['outputs'] if 'run_jnb' in output.get('metadata', {})]
+    assert blobs != []
+    assert all('image/png' not in output.get('data', {}) for cell in nb['cells'] if cell['cell_type'] == 'code'
+               for output in cell['outputs'])
+    rehydrated = store.rehydrate(res.output_nb_path)
+    nbformat.validate(rehydrated)
+    assert any('image/png' in output.get('data', {}) for cell in rehydrated['cells'] if cell['cell_type'] == 'code'
+               for output in cell['outputs'])
+
+    # the same plot is stored once
+    n_blobs = sum(len(files) for _, _, files in os.walk(blob_dir))
+    run_jnb(input_path, output_path, return_mode=True, blob_store=store)
+    assert sum(len(files) for _, _, files in os.walk(blob_dir)) == n_blobs
+
+
+def test_run_jnb_param_store(tmp_path, write_notebook):
+    from ..sweep import run_jnb_many
+
+    input_path = write_notebook(os.path.join(str(tmp_path), 'nb.ipynb'), "data = [1, 2]\nname = 'a'",
+                                "name, sum(data), type(data).__name__")
+    store = BlobStore(os.path.join(str(tmp_path), 'params'), threshold=100)
+    data = list(range(1000))
+
+    res = run_jnb(input_path, return_mode=True, param_store=store, data=data, name='b')
+    assert res.error_type is None
+    source = _read_nb(res.output_nb_path)['cells'][0]['source']
+    # the large parameter is loaded from the store, the small one is assigned in the cell
+    assert '999' not in source and "name = 'b'" in source
+    key = store.put(data)
+    assert "open({!r}, encoding='utf-8')".format(os.path.join('params', key[:2], key)) in source
+    outputs = _read_nb(res.output_nb_path)['cells'][1]['outputs']
+    assert outputs[0]['data']['text/plain'] == "('b', 499500, 'list')"
+
+    params = [{'data': data, 'name': 'c'}, {'data': data, 'name': 'd'}]
+    res = dict(run_jnb_many(input_path, params, max_workers=2, return_mode='parametrised_only',
+                            param_store=store))
+    assert sorted(res) == [0, 1]
+    # the same value is stored once
+    blobs = [name for _, _, names in os.walk(store.blob_dir) for name in names]
+    assert blobs == [key]
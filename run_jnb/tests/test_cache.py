@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import os
+from unittest import mock
+from ..blob_store import BlobStore
+from ..cache import AnalysisCache, ResultCache
+from ..core import possible_parameter, run_jnb, Output
+from ..jnb_helper import _JupyterNotebookHelper
+from ..util import _read_nb
+
+
+def test_analysis_cache(tmp_path):
+    input_path = r'./example/Power_function.ipynb'
+    cache_dir = os.path.join(str(tmp_path), '.analysis_cache')
+    cache = AnalysisCache(cache_dir=cache_dir)
+    expected = possible_parameter(input_path, analysis_cache=AnalysisCache())
+
+    original = _JupyterNotebookHelper._cell_index_of_possible_param
+    analysis = mock.Mock(side_effect=lambda *args: original(*args))
+
+    with mock.patch.object(_JupyterNotebookHelper, '_cell_index_of_possible_param',
+                           lambda *args: analysis(*args)):
+        assert possible_parameter(input_path, analysis_cache=cache) == expected
+        assert possible_parameter(input_path, analysis_cache=cache) == expected
+        assert analysis.call_count == 1
+        assert possible_parameter(input_path, end_cell_index=5, analysis_cache=cache) != expected
+        assert analysis.call_count == 2
+
+        # the on-disk layer is used by a new cache
+        assert possible_parameter(input_path, analysis_cache=AnalysisCache(cache_dir=cache_dir)) == expected
+        assert analysis.call_count == 2
+
+        # changing a code cell invalidates the result
+        nb = _read_nb(input_path)
+        nb['cells'][7]['source'] = 'exponent=3'
+        assert possible_parameter(nb, analysis_cache=cache)[0].value == 3
+        assert analysis.call_count == 3
+
+    cache.clear()
+    assert os.listdir(cache_dir) == []
+
+
+def test_result_cache(tmp_path):
+    input_path = r'./example/Power_function.ipynb'
+    output_path = os.path.join(str(tmp_path), 'output.ipynb')
+    input_file = tmp_path / 'input.txt'
+    input_file.write_text('a')
+    cache = ResultCache(os.path.join(str(tmp_path), '.result_cache'))
+
+    res = run_jnb(input_path, output_path, return_mode=True, result_cache=cache,
+                  input_files=[str(input_file)], exponent=3)
+    assert len(cache._entries()) == 1
+
+    with mock.patch('run_jnb.core._preprocess') as preprocess:
+        res_cached = run_jnb(input_path, output_path, return_mode=True, result_cache=cache,
+                             input_files=[str(input_file)], exponent=3)
+        assert preprocess.call_count == 0
+        assert res_cached[1:] == res[1:]
+        assert res_cached.output_nb_path != res.output_nb_path
+        assert _read_nb(res_cached.output_nb_path) == _read_nb(res.output_nb_path)
+        assert run_jnb(input_path, return_mode=False, result_cache=cache,
+                       input_files=[str(input_file)], exponent=3).output_nb_path is None
+        assert preprocess.call_count == 0
+
+        # other parameters or input file content are not in the cache
+        run_jnb(input_path, return_mode=False, result_cache=cache,
+                input_files=[str(input_file)], exponent=4)
+        input_file.write_text('b')
+        run_jnb(input_path, return_mode=False, result_cache=cache,
+                input_files=[str(input_file)], exponent=3)
+        assert preprocess.call_count == 2
+        # nor other execution parameters
+        input_file.write_text('a')
+        for kwargs in [{'timeout': 5}, {'execution_path': str(tmp_path)}, {'timing': True},
+                       {'blob_store': BlobStore(str(tmp_path / 'blobs'))}]:
+            run_jnb(input_path, return_mode=False, result_cache=cache,
+                    input_files=[str(input_file)], exponent=3, **kwargs)
+        assert preprocess.call_count == 6
+
+    cache.invalidate(str(input_file))
+    assert cache._entries() == []
+
+    # a failed run is executed again
+    res = run_jnb(input_path, return_mode=False, result_cache=cache, np_arange_args={'step': 0.1})
+    assert res.error_type == 'TypeError'
+    assert cache._entries() == []
+
+
+def test_result_cache_eviction(tmp_path):
+    nb = _read_nb(r'./example/Power_function.ipynb')
+    cache = ResultCache(str(tmp_path), max_size=0)
+    output = Output(None, None, None, None, None)
+    cache.set('a', nb, output, input_path='a.ipynb')
+    assert cache.get('a') is None
+
+    cache.max_size = None
+    cache.set('a', nb, output, input_path='a.ipynb')
+    cache.set('b', nb, output, input_path='b.ipynb')
+    assert cache.get('a') == (nb, {'error_prompt_number': None, 'error_type': None, 'error_value': None,
+                                   'error_traceback': None, 'total_time': None,
+                                   'kernel_startup_time': None, 'slowest_cells': None})
+    # "b" is the least recently used result
+    os.utime(cache._path('b', '.json'), (0, 0))
+    cache.max_size = os.path.getsize(cache._path('a', '.json')) + os.path.getsize(cache._path('a', '.ipynb'))
+    cache._evict()
+    assert cache.get('b') is None and cache.get('a') is not None
+
+    cache.invalidate('a.ipynb')
+    assert cache.get('a') is None
+    cache.set('c', nb, output)
+    cache.clear()
+    assert os.listdir(str(tmp_path)) == []
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 import shutil
 import os
+import json
+import subprocess
+import sys
 from collections import OrderedDict, namedtuple
 from ..core import possible_parameter, run_jnb
 
@@ -29,25 +32,144 @@ def test_run_jnb():
         shutil.rmtree(output_dir)
 
     output_path = os.path.join(output_dir, basename[:-6]+'-output'+basename[-6:])
-    assert run_jnb(input_path, return_mode='parametrised_only', exponent=1) == Output(output_path, None, None, None, None)
+    assert run_jnb(input_path, return_mode='parametrised_only', exponent=1)[:5] == Output(output_path, None, None, None, None)
 
     output_path = output_path[:-6]+' (1)'+output_path[-6:]
-    assert run_jnb(input_path, return_mode=True, exponent=1) == Output(output_path, None, None, None, None)
+    assert run_jnb(input_path, return_mode=True, exponent=1)[:5] == Output(output_path, None, None, None, None)
 
     output_path = output_path.replace('(1).ipynb', '(2).ipynb')
     assert run_jnb(input_path, return_mode=True, exponent=3,
                    np_arange_args={'start': -20,
                                    'stop': 20,
-                                   'step': 0.1}) == Output(output_path, None, None, None, None)
+                                   'step': 0.1})[:5] == Output(output_path, None, None, None, None)
 
     assert run_jnb(input_path, return_mode=False, arg='{"exponent":1}',
                    np_arange_args={'start': -20,
                                    'stop': 20,
-                                   'step': 0.1}) == Output(None, None, None, None, None)
+                                   'step': 0.1})[:5] == Output(None, None, None, None, None)
 
 
     output_path = output_path.replace('(2).ipynb', '(3).ipynb')
     res = run_jnb(input_path, return_mode=True, exponent=1, np_arange_args={'step': 0.1})
     expected_res = (output_path, 3, 'TypeError', "Required argument 'start' (pos 1) not found",'')
-    assert res[:-1] == expected_res[:-1]
-    assert run_jnb(input_path, return_mode=False, arg='./example/power_function_arg.json') == Output(None, None, None, None, None)
+    assert res[:4] == expected_res[:-1]
+    assert run_jnb(input_path, return_mode=False, arg='./example/power_function_arg.json')[:5] == Output(None, None, None, None, None)
+
+
+# modules needed only to execute a notebook
+HEAVY_MODULES = ['nbconvert', 'nbclient', 'jupyter_client', 'jinja2', 'zmq']
+# modules needed only by the other entry points (the import time is measured by the benchmarks)
+LAZY_MODULES = ['asyncio', 'http.server', 'concurrent.futures', 'run_jnb.server', 'run_jnb.scheduler']
+
+
+def _run_python(code, modules=HEAVY_MODULES):
+    script = ("import json, sys\n"
+              "{}\n"
+              "print(json.dumps(sorted(m for m in {!r} if m in sys.modules)))").format(code, modules)
+    output = subprocess.check_output([sys.executable, '-c', script], universal_newlines=True)
+    return json.loads(output.splitlines()[-1])
+
+
+def test_lazy_import(tmp_path):
+    assert _run_python("import run_jnb", HEAVY_MODULES + LAZY_MODULES) == []
+    assert _run_python("from run_jnb import Pipeline", ['run_jnb.pipeline']) == ['run_jnb.pipeline']
+
+    heavy_modules = _run_python("from run_jnb.run_jnb import main\n"
+                                "sys.argv = ['run_jnb', '-h']\n"
+                                "try:\n"
+                                "    main()\n"
+                                "except SystemExit:\n"
+                                "    pass")
+    assert heavy_modules == []
+
+    output_path = str(tmp_path / 'output.ipynb')
+    heavy_modules = _run_python("import run_jnb\n"
+                                "run_jnb.run_jnb('./example/Power_function.ipynb', output_path={!r},"
+                                " return_mode='parametrised_only', exponent=3)".format(output_path))
+    assert heavy_modules == []
+    assert os.path.exists(output_path)
+
+
+def test_default_ep_parameters():
+    from nbconvert.preprocessors import ExecutePreprocessor
+    from ..core import _DEFAULT_TIMEOUT, _DEFAULT_KERNEL_NAME
+    assert _DEFAULT_TIMEOUT == ExecutePreprocessor.timeout.default_value
+    assert _DEFAULT_KERNEL_NAME == ExecutePreprocessor.kernel_name.default_value
+
+
+def test_run_jnb_targets(tmp_path, write_notebook):
+    from ..util import _read_nb
+
+    input_path = write_notebook(str(tmp_path / 'nb.ipynb'), "a = 1", "b = a * 2", "# slow exploration\n1 / 0",
+                                "print(b + 1)", "c = 3")
+
+    res = run_jnb(input_path, output_path=str(tmp_path / 'out.ipynb'), return_mode=True,
+                  targets=[3], a=2)
+    assert res.error_type is None
+    cells = _read_nb(res.output_nb_path)['cells']
+    assert [cell['metadata'].get('run_jnb', {}).get('skipped', False) for cell in cells] == \
+        [False, False, True, False, True]
+    assert cells[3]['outputs'][0]['text'] == '5\n'
+    assert cells[2]['outputs'] == [] and cells[2]['execution_count'] is None
+
+    res = run_jnb(input_path, output_path=str(tmp_path / 'out.ipynb'), return_mode=False, targets=[2])
+    assert res.error_type == 'ZeroDivisionError'
+
+
+def test_run_jnb_collect(tmp_path):
+    import numpy as np
+    import pytest
+
+    input_path = r'./example/Power_function.ipynb'
+    output_path = str(tmp_path / 'out.ipynb')
+    with pytest.warns(UserWarning, match='undefined_name'):
+        res = run_jnb(input_path, output_path=output_path, return_mode=False,
+                      collect=['exponent', 'np_arange_args', 'y', 'undefined_name'], exponent=2)
+    assert res.output_nb_path is None and res.error_type is None
+    assert sorted(res.variables) == ['exponent', 'np_arange_args', 'y']
+    assert res.variables['exponent'] == 2
+    assert isinstance(res.variables['y'], np.ndarray)
+    assert np.allclose(res.variables['y'], np.arange(**res.variables['np_arange_args']) ** 2)
+
+    # the variables are collected after the cell stopping the execution
+    res = run_jnb(input_path, output_path=output_path, return_mode=False, collect=['np_arange_args'],
+                  np_arange_args={'step': 0.1})
+    assert res.error_type == 'TypeError' and res.variables == {'np_arange_args': {'step': 0.1}}
+
+    assert run_jnb(input_path, output_path=output_path, return_mode=False).variables is None
+    with pytest.raises(ValueError):
+        run_jnb(input_path, output_path=output_path, collect=['a.b'])
+
+
+def test_run_jnb_profile(tmp_path, write_notebook):
+    import pstats
+    import pytest
+    from ..util import _read_nb
+
+    input_path = write_notebook(str(tmp_path / 'nb.ipynb'), "def slow(n):\n    return sum(i * i for i in range(n))",
+                                "x = slow(100000)", "y = slow(10)")
+
+    output_path = str(tmp_path / 'out.ipynb')
+    res = run_jnb(input_path, output_path=output_path, return_mode=True, overwrite=True,
+                  profile=[1], profile_stats=True, timing=True)
+    assert res.error_type is None
+    cells = _read_nb(res.output_nb_path)['cells']
+    assert 'profile' not in cells[0]['metadata']['run_jnb'] and 'profile' not in cells[2]['metadata']['run_jnb']
+    profile = cells[1]['metadata']['run_jnb']['profile']
+    assert cells[1]['metadata']['run_jnb']['wall_time'] > 0
+    # the functions are sorted by cumulative time
+    assert any(row[0].endswith('(<module>)') for row in profile[:2])
+    assert any(row[0].endswith('(slow)') and row[1] == 1 for row in profile)
+    assert [row[3] for row in profile] == sorted((row[3] for row in profile), reverse=True)
+    stats = pstats.Stats(str(tmp_path / 'out.prof'))
+    assert any(func[2] == 'slow' for func in stats.stats)
+
+    # without output notebook, no statistics are written
+    os.remove(str(tmp_path / 'out.prof'))
+    res = run_jnb(input_path, output_path=output_path, return_mode=False, overwrite=True,
+                  profile=[1], profile_stats=True)
+    assert res.output_nb_path is None
+    assert not os.path.exists(str(tmp_path / 'out.prof'))
+
+    with pytest.raises(ValueError):
+        run_jnb(input_path, output_path=output_path, profile='1')
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+import nbformat
+from ..core import run_jnb
+from ..execute import _Checkpoint
+from ..util import _read_nb
+
+
+def test_checkpoint(tmp_path):
+    path = os.path.join(str(tmp_path), 'checkpoint.ipynb')
+    nb = nbformat.v4.new_notebook()
+    nb['cells'] = [nbformat.v4.new_code_cell('a = 1'), nbformat.v4.new_markdown_cell('b')]
+    checkpoint = _Checkpoint(nb, path, interval=3600)
+    checkpoint.write()
+    assert _read_nb(path) == nb
+
+    nb['cells'][0]['execution_count'] = 1
+    asyncio.run(checkpoint.async_post_cell(None, nb['cells'][0], 0))
+    assert _read_nb(path)['cells'][0]['execution_count'] is None
+
+    checkpoint.interval = 0
+    checkpoint._write_duration = 0
+    asyncio.run(checkpoint.async_post_cell(None, nb['cells'][0], 0))
+    assert _read_nb(path)['cells'][0]['execution_count'] == 1
+    assert os.listdir(str(tmp_path)) == ['checkpoint.ipynb']
+
+
+def test_run_jnb_checkpoint(tmp_path):
+    input_path = r'./example/Power_function.ipynb'
+    output_path = os.path.join(str(tmp_path), '*-output')
+
+    res = run_jnb(input_path, output_path=output_path, return_mode=True, checkpoint=0, exponent=1)
+    assert res[1:5] == (None, None, None, None)
+    assert [cell.get('execution_count') for cell in _read_nb(res.output_nb_path)['cells']
+            if cell['cell_type'] == 'code'] == [1, 2, 3, 4, 5, 6]
+
+    res = run_jnb(input_path, output_path=output_path, return_mode='except', checkpoint=0,
+                  exponent=1, np_arange_args={'step': 0.1})
+    assert res[1:3] == (3, 'TypeError')
+    assert res.output_nb_path.endswith('-output (1).ipynb')
+
+    assert run_jnb(input_path, output_path=output_path, checkpoint=0, exponent=1)[:5] == \
+        (None, None, None, None, None)
+    assert sorted(os.listdir(str(tmp_path))) == ['Power_function-output (1).ipynb',
+                                                 'Power_function-output.ipynb']
+
+
+def test_run_jnb_instrumentation(tmp_path):
+    input_path = r'./example/Power_function.ipynb'
+    output_path = os.path.join(str(tmp_path), '*-output')
+
+    res = run_jnb(input_path, output_path=output_path, return_mode=True, exponent=1, timing=True)
+    assert res.total_time > res.kernel_startup_time > 0
+    assert len(res.slowest_cells) == 5
+    assert res.slowest_cells[0][1] >= res.slowest_cells[-1][1]
+    metadata = [cell['metadata'].get('run_jnb') for cell in _read_nb(res.output_nb_path)['cells']]
+    assert [i for i, m in enumerate(metadata) if m is not None] == [2, 4, 5, 7, 9, 11]
+    assert metadata[11]['output_size'] > 1000
+    assert metadata[2]['peak_rss_delta'] >= 0
+
+    # the execution is measured only with timing
+    res = run_jnb(input_path, output_path=output_path, return_mode=True, exponent=1)
+    assert res[5:8] == (None, None, None)
+    assert all('run_jnb' not in cell['metadata'] for cell in _read_nb(res.output_nb_path)['cells'])
+
+    res = run_jnb(input_path, output_path=output_path, return_mode='parametrised_only', exponent=1)
+    assert res[5:] == (None, None, None, None)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import os
+import nbformat
+import pytest
+from ..sweep import run_jnb_many
+from ..util import _read_nb
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason='fork is available only on POSIX systems')
+
+
+def _outputs(path):
+    return [(cell['execution_count'], cell['outputs']) for cell in _read_nb(path)['cells']
+            if cell['cell_type'] == 'code']
+
+
+def test_run_jnb_many_fork(tmp_path, write_notebook):
+    input_path = write_notebook(os.path.join(str(tmp_path), 'nb.ipynb'),
+                                "with open('prefix.log', 'a') as f:\n    f.write('x')\ndata = list(range(10))",
+                                nbformat.v4.new_markdown_cell("Parameters"), "exponent = 2",
+                                "print('sum')\nsum(x ** exponent for x in data)", "1 / (exponent - 3)")
+    params = [{'exponent': e} for e in range(5)]
+
+    res = dict(run_jnb_many(input_path, params, max_workers=2, return_mode=True, fork=True, timing=True,
+                            output_path=os.path.join(str(tmp_path), 'fork', '*')))
+    # the prefix is executed once
+    with open(os.path.join(str(tmp_path), 'prefix.log')) as f:
+        assert f.read() == 'x'
+    assert sorted(res.keys()) == list(range(5))
+    assert res[3][1:3] == (4, 'ZeroDivisionError')
+    assert all(res[i][1] is None for i in [0, 1, 2, 4])
+
+    expected = dict(run_jnb_many(input_path, params, max_workers=2, return_mode=True,
+                                 output_path=os.path.join(str(tmp_path), 'expected', '*')))
+    for i in res:
+        assert _outputs(res[i].output_nb_path)[:-1] == _outputs(expected[i].output_nb_path)[:-1]
+        outputs = _read_nb(res[i].output_nb_path)['cells'][4]['outputs']
+        assert outputs[0]['output_type'] == ('error' if i == 3 else 'execute_result')
+        assert 'wall_time' in _read_nb(res[i].output_nb_path)['cells'][3]['metadata']['run_jnb']
+
+
+def test_run_jnb_many_fork_prefix_subprocess(tmp_path, write_notebook):
+    # a child of the kernel exiting during the sweep is not taken for a forked kernel
+    input_path = write_notebook(os.path.join(str(tmp_path), 'nb.ipynb'),
+                                "import subprocess, sys, time\nproc = subprocess.Popen([sys.executable, '-c', 'pass'])",
+                                "delay = 0", "time.sleep(delay)\ndelay")
+
+    params = [{'delay': 1}, {'delay': 1.5}]
+    res = dict(run_jnb_many(input_path, params, max_workers=2, return_mode=True, fork=True,
+                            output_path=os.path.join(str(tmp_path), 'fork', '*')))
+    assert sorted(res.keys()) == [0, 1]
+    assert all(res[i].error_type is None for i in res)
+    assert _read_nb(res[1].output_nb_path)['cells'][2]['outputs'][0]['data']['text/plain'] == '1.5'
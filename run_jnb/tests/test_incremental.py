@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import os
+from ..incremental import IncrementalSession
+from ..util import _read_nb
+
+
+def test_incremental_session(tmp_path, write_notebook):
+    input_path = write_notebook(os.path.join(str(tmp_path), 'nb.ipynb'),
+                                "a = 1", "b = 2", "x = a * 10", "y = 10 / b", "print(x + y)")
+    output_path = os.path.join(str(tmp_path), 'out.ipynb')
+
+    with IncrementalSession(input_path, output_path=output_path, return_mode=True, overwrite=True,
+                            timing=True) as session:
+        res = session.run()
+        assert session.executed_cells == [0, 1, 2, 3, 4]
+        assert _read_nb(res.output_nb_path)['cells'][4]['outputs'][0]['text'] == '15.0\n'
+
+        res = session.run(a=2)
+        assert session.executed_cells == [0, 2, 4]
+        cells = _read_nb(res.output_nb_path)['cells']
+        assert cells[4]['outputs'][0]['text'] == '25.0\n'
+        # the outputs and the execution counts of the other cells are kept
+        assert cells[3]['execution_count'] == 4
+        assert cells[3]['metadata']['run_jnb']['wall_time'] >= 0
+
+        session.run(a=2)
+        assert session.executed_cells == []
+
+        res = session.run(a=2, b=0)
+        assert session.executed_cells == [1, 3]
+        assert res.error_type == 'ZeroDivisionError'
+        assert _read_nb(res.output_nb_path)['cells'][4]['outputs'] == []
+
+        # the namespace is reset after a failed run
+        res = session.run(a=3)
+        assert session.executed_cells == [0, 1, 2, 3, 4]
+        assert _read_nb(res.output_nb_path)['cells'][4]['outputs'][0]['text'] == '35.0\n'
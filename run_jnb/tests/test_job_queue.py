@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+from ..job_queue import JobQueue
+from ..run_jnb import main
+
+
+def test_job_queue(tmp_path):
+    input_path = r'./example/Power_function.ipynb'
+    queue = JobQueue(os.path.join(str(tmp_path), 'queue'))
+    output_path = os.path.join(str(tmp_path), '*-output')
+    job_ids = [queue.submit(input_path, {'exponent': 2}, output_path=output_path, return_mode=False),
+               queue.submit(input_path, {'exponent': 2, 'np_arange_args': {'step': 0.1}},
+                            output_path=output_path, return_mode=True)]
+    assert queue.job_ids('pending') == job_ids
+
+    res = dict(queue.work(jobs=2, exit_when_empty=True))
+    assert sorted(res) == job_ids
+    assert res[job_ids[0]][:2] == (None, None)
+    assert res[job_ids[1]].error_type == 'TypeError'
+    assert os.path.exists(res[job_ids[1]].output_nb_path)
+    assert queue.status() == {'pending': 0, 'running': 0, 'done': 2, 'failed': 0}
+    state, job = queue.job(job_ids[1])
+    assert state == 'done' and job['attempts'] == 1 and job['output']['error_type'] == 'TypeError'
+
+
+def test_job_queue_lease(tmp_path):
+    queue = JobQueue(str(tmp_path), lease=10, max_attempts=2)
+    job_id = queue.submit('a.ipynb')
+
+    # the worker of the job died
+    job = queue.claim('dead')
+    assert job['attempts'] == 1 and queue.claim('other') is None
+    queue.requeue_expired()
+    assert queue.job(job_id)[0] == 'running'
+    os.utime(queue._path('running', job_id), (0, 0))
+    queue.requeue_expired()
+    assert queue.job(job_id)[0] == 'pending'
+
+    # the job is retried at most max_attempts times
+    job = queue.claim('other')
+    assert job['attempts'] == 2
+    queue.fail(job, 'error')
+    assert queue.job(job_id)[0] == 'failed'
+
+    # a job requeued meanwhile is not finished twice
+    job_id = queue.submit('b.ipynb')
+    job = queue.claim('slow')
+    os.utime(queue._path('running', job_id), (0, 0))
+    queue.requeue_expired()
+    queue.claim('other')
+    queue.fail(job, 'error')
+    assert queue.job(job_id)[1]['worker'] == 'other'
+
+
+def test_job_queue_command_line(tmp_path, capsys, monkeypatch):
+    input_path = r'./example/Power_function.ipynb'
+    queue_dir = os.path.join(str(tmp_path), 'queue')
+    arg_lines = tmp_path / 'params.jsonl'
+    arg_lines.write_text('{"exponent": 1}\n{"exponent": 3}\n')
+    monkeypatch.setattr(sys, 'argv', ['run_jnb', 'submit', input_path, '-q', queue_dir, '-m', 'false',
+                                      '-A', str(arg_lines)])
+    main()
+    job_ids = capsys.readouterr().out.split()
+    assert len(job_ids) == 2
+
+    monkeypatch.setattr(sys, 'argv', ['run_jnb', 'worker', '-q', queue_dir, '-J', '2', '--exit_when_empty'])
+    main()
+    rows = capsys.readouterr().out.splitlines()
+    assert sorted(row.split(',')[0] for row in rows) == job_ids
+    assert JobQueue(queue_dir).status()['done'] == 2
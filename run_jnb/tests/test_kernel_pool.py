@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+import os
+from ..core import run_jnb
+from ..kernel_pool import KernelPool, _shutdown_kernel
+
+
+def test_kernel_pool(tmp_path):
+    input_path = r'./example/Power_function.ipynb'
+    output_path = os.path.join(str(tmp_path), '*-output')
+    with KernelPool(size=1, prelude='import numpy') as pool:
+        pool.start('python3')
+        km = pool._idle['python3'][0]
+        for _ in range(2):
+            res = run_jnb(input_path, output_path=output_path, return_mode=False,
+                          kernel_pool=pool, exponent=1, np_arange_args={'step': 0.1})
+            # the namespace and the execution count are reset between runs
+            assert res[:3] == (None, 3, 'TypeError')
+        assert pool._idle['python3'] == [km]
+        _shutdown_kernel(km)
+
+        res = run_jnb(input_path, output_path=output_path, return_mode=False,
+                      kernel_pool=pool, exponent=1)
+        assert res[:5] == (None, None, None, None, None)
+        assert pool._idle['python3'] != [km]
+    assert pool._started['python3'] == 0
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+from ..pipeline import Pipeline
+from ..cache import ResultCache
+
+
+def test_pipeline(tmp_path, write_notebook):
+    folder = str(tmp_path)
+    write_notebook(os.path.join(folder, 'ingest.ipynb'), "n = 1",
+                   "open('log.txt', 'a').write('ingest\\n')\nopen('raw.txt', 'w').write(str(n))")
+    write_notebook(os.path.join(folder, 'double.ipynb'),
+                   "open('log.txt', 'a').write('double\\n')\n"
+                   "open('double.txt', 'w').write(str(2 * int(open('raw.txt').read())))")
+    write_notebook(os.path.join(folder, 'fail.ipynb'), "1 / 0")
+    write_notebook(os.path.join(folder, 'blobs.ipynb'), "s = 'x'", "s * 100")
+    spec = {'nodes': [{'name': 'double', 'input_path': 'double.ipynb', 'inputs': ['raw.txt'],
+                       'outputs': ['double.txt']},
+                      {'name': 'ingest', 'input_path': 'ingest.ipynb', 'params': {'n': 3},
+                       'outputs': ['raw.txt']},
+                      {'name': 'fail', 'input_path': 'fail.ipynb'},
+                      {'name': 'after_fail', 'input_path': 'double.ipynb', 'depends_on': ['fail']},
+                      {'name': 'invalid', 'input_path': 'fail.ipynb', 'profile': 'all'},
+                      {'name': 'after_invalid', 'input_path': 'double.ipynb', 'depends_on': ['invalid']},
+                      {'name': 'blobs', 'input_path': 'blobs.ipynb', 'params': {'s': 'y' * 20},
+                       'blob_dir': 'blobs', 'blob_threshold': 10, 'param_dir': 'params', 'param_threshold': 10}]}
+    pipeline = Pipeline.from_dict(spec, base_path=folder, max_workers=2,
+                                  result_cache=ResultCache(os.path.join(folder, 'cache')))
+    assert pipeline.dependencies() == {'ingest': [], 'fail': [], 'double': ['ingest'],
+                                       'after_fail': ['fail'], 'invalid': [], 'after_invalid': ['invalid'],
+                                       'blobs': []}
+
+    with pytest.warns(UserWarning, match='invalid'):
+        res = dict(pipeline.run())
+    assert res['double'].error_type is None
+    assert res['fail'].error_type == 'ZeroDivisionError'
+    assert res['after_fail'] is None
+    # a run raising an exception fails the node
+    assert res['invalid'] is None
+    assert res['after_invalid'] is None
+    assert res['blobs'].error_type is None
+    assert len(os.listdir(os.path.join(folder, 'blobs'))) == 1
+    assert len(os.listdir(os.path.join(folder, 'params'))) == 1
+    with open(os.path.join(folder, 'double.txt')) as f:
+        assert f.read() == '6'
+
+    # the unchanged nodes are not executed again
+    with pytest.warns(UserWarning):
+        res = dict(pipeline.run())
+    assert res['double'].error_type is None
+    with open(os.path.join(folder, 'log.txt')) as f:
+        assert f.read() == 'ingest\ndouble\n'
+
+    # a changed parameter executes again the node and its dependents
+    pipeline.nodes['ingest'].params['n'] = 4
+    with pytest.warns(UserWarning):
+        dict(pipeline.run())
+    with open(os.path.join(folder, 'double.txt')) as f:
+        assert f.read() == '8'
+    with open(os.path.join(folder, 'log.txt')) as f:
+        assert f.read() == 'ingest\ndouble\n' * 2
+
+
+def test_pipeline_errors():
+    pipeline = Pipeline()
+    pipeline.add('a', 'a.ipynb', depends_on=['b'])
+    pipeline.add('b', 'b.ipynb', depends_on=['a'])
+    with pytest.raises(ValueError):
+        pipeline.dependencies()
+    with pytest.raises(ValueError):
+        pipeline.add('a', 'a.ipynb')
+    with pytest.raises(TypeError):
+        pipeline.add('c', 'c.ipynb', unknown_option=1)
+    pipeline.add('d', 'd.ipynb', depends_on=['e'])
+    with pytest.raises(ValueError):
+        pipeline.dependencies()
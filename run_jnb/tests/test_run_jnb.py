@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import sys
 import io
+import json
+import pytest
 from ..run_jnb import main
 
 # https://stackoverflow.com/questions/22822267/python-capture-print-output-of-another-module
@@ -12,3 +14,32 @@ def test_run_jnb_command_line():
     main()
     output = sys.stdout.getvalue()
     assert output[:4] == ',,,,'
+
+
+def test_run_jnb_command_line_batch(tmp_path, capsys, monkeypatch):
+    input_path = r'./example/Power_function.ipynb'
+    arg_lines = tmp_path / 'params.jsonl'
+    arg_lines.write_text('{"exponent": 1}\n\n{"np_arange_args": {"step": 0.1}}\n')
+    monkeypatch.setattr(sys, 'argv', ['run_jnb', input_path, '-m', 'false', '-A', str(arg_lines),
+                                      '-J', '2', '-a', '{"exponent": 2}', '-f', 'jsonl', '-vv'])
+    with pytest.raises(ValueError):
+        main()
+
+    monkeypatch.setattr(sys, 'argv', ['run_jnb', input_path, '-m', 'false', '-A', '-', '-J', '2'])
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(arg_lines.read_text()))
+    main()
+    rows = sorted(capsys.readouterr().out.splitlines())
+    # the timing fields are appended only with --timing
+    assert [row.split(',') for row in rows] == [['0', '', ''], ['1', '', '3']]
+
+    arg_lines.write_text('{"exponent": 1}\n{"np_arange_args": {"step": 0.1}}\n')
+    monkeypatch.setattr(sys, 'argv', ['run_jnb', input_path, '-m', 'false', '-A', str(arg_lines),
+                                      '-f', 'jsonl', '-vv', '--timing'])
+    main()
+    rows = sorted((json.loads(line) for line in capsys.readouterr().out.splitlines()),
+                  key=lambda row: row['index'])
+    assert rows[0].pop('total_time') > rows[0].pop('kernel_startup_time') > 0
+    assert len(rows[0].pop('slowest_cells')) == 5
+    assert rows[0] == {'index': 0, 'output_nb_path': None, 'error_prompt_number': None,
+                       'error_type': None, 'error_value': None}
+    assert (rows[1]['index'], rows[1]['error_prompt_number'], rows[1]['error_type']) == (1, 3, 'TypeError')
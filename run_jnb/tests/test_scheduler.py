@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import os
+import signal
+import subprocess
+import sys
+import time
+import nbformat
+import pytest
+from .. import scheduler as scheduler_module
+from ..scheduler import ResourceScheduler, _resources
+from ..sweep import run_jnb_many
+from ..util import _descendant_pids, _process_pss
+
+
+def test_resource_scheduler(monkeypatch):
+    monkeypatch.setattr(scheduler_module, '_kernels_memory', lambda: None)
+    monkeypatch.setattr(scheduler_module, '_available_memory', lambda: 1000)
+
+    scheduler = ResourceScheduler(max_memory=100, max_cpus=4, min_available_memory=500, poll_interval=0)
+    # a run is always admitted if nothing runs
+    assert scheduler.try_admit('a', memory=200, cpus=8)
+    assert not scheduler.try_admit('b', memory=10)
+    scheduler.release('a')
+    assert scheduler.try_admit('b', memory=60)
+    assert not scheduler.try_admit('c', memory=60)
+    assert scheduler.try_admit('c', memory=40, cpus=3)
+    assert scheduler.usage()['runs'] == 2
+    assert scheduler.usage()['memory'] == 100
+    assert scheduler.usage()['cpus'] == 4
+    scheduler.release('b')
+    scheduler.release('c')
+
+    # the measured memory is used if it is larger than the hints
+    monkeypatch.setattr(scheduler_module, '_kernels_memory', lambda: 90)
+    assert scheduler.try_admit('a', memory=10)
+    assert not scheduler.try_admit('b', memory=20)
+    scheduler.release('a')
+
+    # the available memory of the machine
+    monkeypatch.setattr(scheduler_module, '_kernels_memory', lambda: None)
+    assert scheduler.try_admit('a', memory=10)
+    assert not scheduler.try_admit('b', memory=501)
+    assert scheduler.try_admit('b', memory=50)
+
+    # the measure is reused during poll_interval
+    calls = []
+    monkeypatch.setattr(scheduler_module, '_kernels_memory', lambda: calls.append(1) or 10)
+    scheduler = ResourceScheduler(max_memory=100, poll_interval=60)
+    assert scheduler.usage()['memory'] == 10
+    assert scheduler.usage()['memory'] == 10
+    assert len(calls) == 1
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc'), reason='/proc is needed without psutil')
+def test_descendant_pids():
+    # a worker process starting a kernel process
+    code = 'import subprocess, sys, time; subprocess.Popen([sys.executable, "-c", "import time; time.sleep(10)"]); ' \
+           'time.sleep(10)'
+    worker = subprocess.Popen([sys.executable, '-c', code])
+    kernels = []
+    try:
+        for _ in range(100):
+            kernels = _descendant_pids(os.getpid(), min_depth=2)
+            if kernels:
+                break
+            time.sleep(0.05)
+        assert worker.pid in _descendant_pids(os.getpid())
+        assert len(kernels) == 1 and worker.pid not in kernels
+        assert _process_pss(kernels[0]) > 0
+    finally:
+        for pid in kernels:
+            os.kill(pid, signal.SIGKILL)
+        worker.kill()
+        worker.wait()
+
+
+def test_resources():
+    nb = nbformat.v4.new_notebook()
+    assert _resources(nb) == {'memory': 0, 'cpus': 1}
+    nb['metadata']['run_jnb'] = {'resources': {'memory': 10, 'cpus': 2}}
+    assert _resources(nb) == {'memory': 10, 'cpus': 2}
+    assert _resources(nb, {'memory': 20}) == {'memory': 20, 'cpus': 2}
+
+
+def test_run_jnb_many_scheduler(tmp_path):
+    input_path = r'./example/Power_function.ipynb'
+    output_path = os.path.join(str(tmp_path), '*-output')
+    params = [{'exponent': e} for e in range(3)]
+
+    # each run needs all the memory, so the runs are executed one by one
+    scheduler = ResourceScheduler(max_memory=1, poll_interval=0.05)
+    res = dict(run_jnb_many(input_path, params, max_workers=3, output_path=output_path,
+                            return_mode=False, scheduler=scheduler, resources={'memory': 1}))
+    assert sorted(res.keys()) == [0, 1, 2]
+    assert all(r[:5] == (None, None, None, None, None) for r in res.values())
+    assert scheduler.usage()['runs'] == 0
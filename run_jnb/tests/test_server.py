@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from ..server import NotebookServer
+from ..kernel_pool import KernelPool
+
+
+def _post(url, request):
+    data = json.dumps(request).encode('utf-8')
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data)) as response:
+            return response.status, json.loads(response.read().decode('utf-8'))
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read().decode('utf-8'))
+
+
+def test_notebook_server(tmp_path):
+    input_path = os.path.abspath(r'./example/Power_function.ipynb')
+    output_path = os.path.join(str(tmp_path), '*-output')
+    with NotebookServer(('127.0.0.1', 0)) as server:
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            url = 'http://{}:{}'.format(*server.server_address[:2])
+            status, content = _post(url + '/run', {'input_path': input_path, 'params': {'exponent': 2},
+                                                   'output_path': output_path, 'return_mode': False,
+                                                   'timing': True})
+            assert status == 200
+            assert content['output']['error_type'] is None
+            assert content['output']['kernel_startup_time'] is not None
+
+            status, content = _post(url + '/run', {'input_path': input_path, 'output_path': output_path,
+                                                   'params': {'np_arange_args': {'step': 0.1}},
+                                                   'return_mode': True})
+            assert status == 200
+            assert content['output']['error_type'] == 'TypeError'
+            assert os.path.exists(content['output']['output_nb_path'])
+
+            assert _post(url + '/run', {'input_path': input_path, 'unknown': 1})[0] == 400
+            assert _post(url + '/run', [input_path])[0] == 400
+            assert _post(url + '/other', {})[0] == 404
+            with urllib.request.urlopen(url + '/status') as response:
+                assert json.loads(response.read().decode('utf-8')) == {'executed': 2, 'failed': 0, 'running': 0}
+        finally:
+            server.shutdown()
+            thread.join()
+
+
+def test_notebook_server_concurrent(tmp_path):
+    input_path = os.path.abspath(r'./example/Power_function.ipynb')
+    output_path = os.path.join(str(tmp_path), '*-output')
+    with KernelPool(size=2) as pool, NotebookServer(('127.0.0.1', 0), kernel_pool=pool) as server:
+        # the kernels are started with the server
+        assert len(pool._idle['python3']) == 2
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            url = 'http://{}:{}'.format(*server.server_address[:2])
+            results = {}
+
+            def post(exponent):
+                results[exponent] = _post(url + '/run', {'input_path': input_path, 'params': {'exponent': exponent},
+                                                         'output_path': output_path, 'return_mode': False})
+            threads = [threading.Thread(target=post, args=(exponent,)) for exponent in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            assert sorted(results) == [0, 1, 2, 3]
+            assert all(status == 200 and content['output']['error_type'] is None
+                       for status, content in results.values())
+            assert server.status() == {'executed': 4, 'failed': 0, 'running': 0}
+            # no other kernel was started
+            assert pool._started['python3'] == 2
+        finally:
+            server.shutdown()
+            thread.join()
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import os
+from ..core import run_jnb
+from ..sweep import run_jnb_many
+
+
+def test_run_jnb_many(tmp_path):
+    input_path = r'./example/Power_function.ipynb'
+    output_path = os.path.join(str(tmp_path), '*-output')
+    params = [{'exponent': 1}, '{"exponent": 2}', {'exponent': 3, 'np_arange_args': {'step': 0.1}}]
+
+    res = dict(run_jnb_many(input_path, params, max_workers=2, output_path=output_path,
+                            return_mode=False))
+    assert sorted(res.keys()) == [0, 1, 2]
+    assert res[0][:5] == res[1][:5] == (None, None, None, None, None)
+    assert res[2][:3] == (None, 3, 'TypeError')
+
+    res = dict(run_jnb_many(input_path, params[:1], output_path=output_path,
+                            return_mode='parametrised_only'))
+    expected = run_jnb(input_path, output_path=output_path + '-expected',
+                       return_mode='parametrised_only', exponent=1)
+    with open(res[0].output_nb_path) as f1, open(expected.output_nb_path) as f2:
+        assert f1.read() == f2.read()
+
+
+def test_run_jnb_many_exception(tmp_path, write_notebook):
+    input_path = write_notebook(os.path.join(str(tmp_path), 'nb.ipynb'), "t = 0", "import time\ntime.sleep(t)")
+
+    # the timed out run is reported as failed, the other runs go on
+    res = dict(run_jnb_many(input_path, [{'t': 0}, {'t': 30}, {'t': 0}], max_workers=2, timeout=2,
+                            return_mode=False))
+    assert sorted(res.keys()) == [0, 1, 2]
+    assert res[0].error_type is None and res[2].error_type is None
+    assert res[1].error_prompt_number is None
+    assert res[1].error_type == 'CellTimeoutError'
+    assert 'CellTimeoutError' in ''.join(res[1].error_traceback)
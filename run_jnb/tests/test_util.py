@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
+import concurrent.futures
+import os
 
-from ..util import find_duplicates, variable_status
+from ..util import find_duplicates, variable_status, _reserve_path, _read_nb
 
 
 def test_find_duplicates():
@@ -59,3 +61,89 @@ a = 2
     assert variable_status("a,b = [1,2,3]") == ({'a', 'b'}, {'a', 'b'}, {'a':1, 'b':2})
     assert variable_status("a,b = map(lambda x: x**2, [1,2])") == (set(), {'a', 'b', 'map', 'x'}, {})
     assert variable_status("a  = f(a)", jsonable_parameter=False) == (set(), {'a', 'f'}, {})
+
+
+def test_reserve_path(tmp_path):
+    path = str(tmp_path / 'a-output.ipynb')
+    assert _reserve_path(path) == path
+    assert os.path.exists(path)
+    assert _reserve_path(path) == str(tmp_path / 'a-output (1).ipynb')
+
+    # the next index is after the highest index in use
+    (tmp_path / 'b (7).ipynb').touch()
+    (tmp_path / 'b (x).ipynb').touch()
+    (tmp_path / 'b.ipynb').touch()
+    assert _reserve_path(str(tmp_path / 'b.ipynb')) == str(tmp_path / 'b (8).ipynb')
+    assert _reserve_path(str(tmp_path / 'b (2).ipynb')) == str(tmp_path / 'b (2).ipynb')
+    assert _reserve_path(str(tmp_path / 'b (2).ipynb')) == str(tmp_path / 'b (9).ipynb')
+    # files created by another process are skipped
+    (tmp_path / 'b (10).ipynb').touch()
+    assert _reserve_path(str(tmp_path / 'b.ipynb')) == str(tmp_path / 'b (11).ipynb')
+    assert _reserve_path(str(tmp_path / 'b (20).ipynb')) == str(tmp_path / 'b (20).ipynb')
+    assert _reserve_path(str(tmp_path / 'b (20).ipynb')) == str(tmp_path / 'b (21).ipynb')
+
+    # the folder is scanned again once the reserved files are removed
+    for name in ['a-output.ipynb', 'a-output (1).ipynb']:
+        os.remove(str(tmp_path / name))
+    assert _reserve_path(path) == path
+    assert _reserve_path(path) == str(tmp_path / 'a-output (1).ipynb')
+
+
+def test_reserve_path_concurrent(tmp_path):
+    path = str(tmp_path / 'c.ipynb')
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        paths = list(executor.map(lambda _: _reserve_path(path), range(100)))
+    assert len(set(paths)) == 100
+    assert len(os.listdir(str(tmp_path))) == 100
+
+
+def test_read_nb_without_outputs(tmp_path):
+    import nbformat
+    import pytest
+    from ..core import _clean_nb
+
+    path = str(tmp_path / 'nb.ipynb')
+    output = nbformat.v4.new_output('display_data', data={'image/png': 'a' * 100000})
+    nb = nbformat.v4.new_notebook(cells=[nbformat.v4.new_markdown_cell('# Title'),
+                                         nbformat.v4.new_code_cell('a = 1', outputs=[output], execution_count=1),
+                                         nbformat.v4.new_code_cell(['b = 2\n', 'c = 3'])])
+    nb['metadata']['kernelspec'] = {'name': 'python3', 'display_name': 'Python 3', 'language': 'python'}
+    nbformat.write(nb, path)
+
+    nb = _read_nb(path)
+    _clean_nb(nb)
+    res = _read_nb(path, outputs=False)
+    assert res == nb
+    assert isinstance(res, nbformat.NotebookNode) and res.cells[2].source == 'b = 2\nc = 3'
+
+    with open(path, 'w') as f:
+        f.write('{"nbformat": 4, "nbformat_minor": 2, "metadata": {}, "cells": [{"cell_type": "code"}]}')
+    with pytest.raises(nbformat.ValidationError):
+        _read_nb(path, outputs=False)
+
+
+def test_write_nb_compressed(tmp_path):
+    import gzip
+    import nbformat
+    from ..util import _write_nb
+    from ..core import _output_path
+
+    output = nbformat.v4.new_output('stream', text='line 1\nline 2\n')
+    nb = nbformat.v4.new_notebook(cells=[nbformat.v4.new_code_cell('a = 1\nb = 2', outputs=[output],
+                                                                   execution_count=1)])
+    _write_nb(nb, str(tmp_path / 'nb.ipynb'))
+    assert _read_nb(str(tmp_path / 'nb.ipynb')) == nb
+    for atomic in [False, True]:
+        path = str(tmp_path / 'nb.ipynb.gz')
+        _write_nb(nb, path, atomic=atomic)
+        assert _read_nb(path) == nb
+        # compact json
+        assert b'\n' not in gzip.decompress((tmp_path / 'nb.ipynb.gz').read_bytes())
+    nbformat.validate(_read_nb(path))
+    assert _read_nb(path, outputs=False).cells[0].outputs == []
+
+    assert _reserve_path(path) == str(tmp_path / 'nb (1).ipynb.gz')
+    input_path = str(tmp_path / 'a.ipynb')
+    assert _output_path(input_path, '///*-output.ipynb.gz') == str(tmp_path / 'a-output.ipynb.gz')
+    assert _output_path(input_path, '///*-output') == str(tmp_path / 'a-output.ipynb')
+    assert _output_path(path, '///out-*') == str(tmp_path / 'out-nb.ipynb.gz')
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+from ..watch import run_jnb_watch
+from ..util import _read_nb
+
+
+def _sources(a):
+    return "a = {}".format(a), "b = 2", "print(a * b)"
+
+
+def _output(res):
+    return _read_nb(res.output_nb_path)['cells'][2]['outputs'][0]['text']
+
+
+def test_run_jnb_watch(tmp_path, write_notebook):
+    input_path = os.path.join(str(tmp_path), 'nb.ipynb')
+    arg_path = os.path.join(str(tmp_path), 'arg.json')
+    write_notebook(input_path, *_sources(1))
+    with open(arg_path, 'w') as f:
+        json.dump({'b': 3}, f)
+
+    runs = run_jnb_watch(input_path, output_path=os.path.join(str(tmp_path), 'out.ipynb'),
+                         return_mode=True, overwrite=True, arg=arg_path, poll_interval=0.05)
+    try:
+        assert _output(next(runs)) == '3\n'
+
+        write_notebook(input_path, *_sources(5))
+        assert _output(next(runs)) == '15\n'
+
+        with open(arg_path, 'w') as f:
+            json.dump({'b': 4}, f)
+        assert _output(next(runs)) == '20\n'
+    finally:
+        runs.close()
@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
 
 import collections
+import collections.abc
 import ast
+import gzip
 import json
-import copy
+import os
+import sys
+import threading
+import uuid
 
 from typing import Union
 import nbformat
@@ -266,14 +271,131 @@ def group_dict_by_value(d: dict) -> dict:
     return d_out
 
 
-def _read_nb(nb_path: str):
-    with open(nb_path, 'r') as f:
-        return nbformat.read(f, as_version=nbformat.NO_CONVERT)
+# extensions of the notebooks, the compressed notebooks are written as compact json
+_NB_EXTENSIONS = ('.ipynb', '.ipynb.gz', '.ipynb.zst')
 
 
-def _write_nb(nb: nbformat.notebooknode.NotebookNode, nb_path: str):
-    with open(nb_path, mode='wt', newline='\n', encoding='UTF-8') as f:
-        nbformat.write(nb, f)
+def _split_ext(path: str) -> tuple:
+    """
+    Split the extension of a path, keeping the notebook extensions (e.g. '.ipynb.gz') whole.
+
+    >>> _split_ext('a/b.ipynb.gz')
+    ('a/b', '.ipynb.gz')
+    >>> _split_ext('b.txt')
+    ('b', '.txt')
+    """
+    for ext in _NB_EXTENSIONS:
+        if path.endswith(ext):
+            return path[:-len(ext)], ext
+    return os.path.splitext(path)
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstandard is needed to read and write '.ipynb.zst' notebooks."
+                          " Install zstandard or use '.ipynb.gz'.")
+    return zstandard
+
+
+def _read_text(nb_path: str) -> str:
+    ext = _split_ext(nb_path)[1]
+    with open(nb_path, 'rb') as f:
+        data = f.read()
+    if ext == '.ipynb.gz':
+        data = gzip.decompress(data)
+    elif ext == '.ipynb.zst':
+        # the size is not in the frame header when the notebook was written by a stream
+        data = _zstandard().ZstdDecompressor().decompressobj().decompress(data)
+    return data.decode('UTF-8')
+
+
+def _read_nb(nb_path: str, outputs: bool = True):
+    """
+    Read a jupyter notebook (.ipynb or compressed .ipynb.gz / .ipynb.zst).
+
+    If outputs is False, the outputs of the code cells are dropped while the json is
+    parsed (they are never converted to NotebookNode objects), the execution counts
+    are cleared and only the structure used by run_jnb is validated instead of the
+    whole notebook schema.
+    """
+    text = _read_text(nb_path)
+    if outputs:
+        return nbformat.reads(text, as_version=nbformat.NO_CONVERT)
+
+    from nbformat.reader import reads
+
+    nb = reads(text, object_hook=_drop_outputs)
+    cells = nb.get('cells')
+    if not isinstance(cells, list) or not all(
+            isinstance(cell, dict) and {'cell_type', 'source', 'metadata'} <= set(cell) for cell in cells):
+        raise nbformat.ValidationError("The notebook '{}' has no valid cells.".format(nb_path))
+    return nb
+
+
+def _drop_outputs(obj: dict) -> dict:
+    # called by the json decoder for each object once its content is decoded,
+    # so the outputs of a cell are released before the next cell is decoded
+    if obj.get('cell_type') == 'code' and 'outputs' in obj:
+        obj['outputs'] = []
+        obj['execution_count'] = None
+    return obj
+
+
+def _nb_bytes(nb: nbformat.notebooknode.NotebookNode, nb_path: str) -> bytes:
+    """
+    Serialise a notebook for its path.
+
+    The notebooks written by run_jnb come from a read notebook and from the kernel
+    messages, so they are not validated again. A .ipynb notebook is written as
+    nbformat does (indented, sorted keys, multiline strings split in lines), the
+    compressed ones as compact json.
+    """
+    ext = _split_ext(nb_path)[1]
+    if ext in ('.ipynb.gz', '.ipynb.zst'):
+        data = json.dumps(nb, ensure_ascii=False, separators=(',', ':')).encode('UTF-8')
+        if ext == '.ipynb.gz':
+            # a low level is several times faster and the outputs compress well
+            return gzip.compress(data, compresslevel=3)
+        return _zstandard().ZstdCompressor(level=3).compress(data)
+    if nb.get('nbformat') == 4:
+        text = nbformat.v4.writes(nb)
+    else:
+        text = nbformat.writes(nb)
+    if not text.endswith('\n'):
+        text += '\n'
+    return text.encode('UTF-8')
+
+
+def _write_nb(nb: nbformat.notebooknode.NotebookNode, nb_path: str,
+              atomic: bool = False):
+    data = _nb_bytes(nb, nb_path)
+    if atomic:
+        _write_atomic(nb_path, data)
+        return
+    with open(nb_path, mode='wb') as f:
+        f.write(data)
+
+
+def _write_atomic(path: str, data: Union[str, bytes]):
+    """
+    Write a text (or binary) file atomically by writing a temporary file and renaming it.
+    """
+    dirname, basename = os.path.split(os.path.abspath(path))
+    tmp_path = os.path.join(dirname, '.{}.{}.tmp'.format(basename, uuid.uuid4().hex))
+    try:
+        if isinstance(data, bytes):
+            with open(tmp_path, mode='xb') as f:
+                f.write(data)
+        else:
+            with open(tmp_path, mode='xt', newline='\n', encoding='UTF-8') as f:
+                f.write(data)
+        os.replace(tmp_path, path)
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 
 def variable_status(code: str,
@@ -328,8 +450,33 @@ def variable_status(code: str,
     """
     if exclude_variable is None:
         exclude_variable = set()
-    else:
-        exclude_variable = copy.deepcopy(exclude_variable)
+    assign_only, store_variable_name, cell_exclude_variable, dict_parameter = \
+        _variable_summary(code, jsonable_parameter)
+    exclude_variable = exclude_variable | cell_exclude_variable
+    if assign_only is True:
+        possible_parameter = store_variable_name-exclude_variable
+        if jsonable_parameter is True:
+            dict_parameter = {k:dict_parameter[k] for k in possible_parameter}
+        return (possible_parameter, store_variable_name | exclude_variable, dict_parameter)
+    return set(), store_variable_name | exclude_variable, {}
+
+
+def _variable_summary(code: str, jsonable_parameter: bool = True) -> tuple:
+    """
+    Summary of the variables of a python code, independent of the variables to exclude.
+
+    Returns
+    -------
+    tuple
+        (a flag if the code contains only assignments, a set of possible parameter,
+        a set of parameter to exclude, a dictionary of possible parameter)
+
+    >>> _variable_summary("a=3")
+    (True, {'a'}, set(), {'a': 3})
+    >>> _variable_summary("import f")
+    (False, set(), {'f'}, {})
+    """
+    exclude_variable = set()
     root = ast.parse(code)
     store_variable_name = set()
     assign_only = True
@@ -355,7 +502,7 @@ def variable_status(code: str,
                         for assign_tuple_node in ast.iter_child_nodes(assign_node):
                             if isinstance(assign_tuple_node, ast.Name):
 
-                                if isinstance(_value,(collections.Iterable)) and is_jsonable(_value[i]) and _is_literal_eval:
+                                if isinstance(_value,(collections.abc.Iterable)) and is_jsonable(_value[i]) and _is_literal_eval:
                                     dict_parameter[assign_tuple_node.id]=_value[i]                                
                                     store_variable_name |= {assign_tuple_node.id} 
                                 else:
@@ -395,12 +542,158 @@ def variable_status(code: str,
                     exclude_variable |= {node1.name}
         else:
             assign_only = False
-    if assign_only is True:
-        possible_parameter = store_variable_name-exclude_variable
-        if jsonable_parameter is True:
-            dict_parameter = {k:dict_parameter[k] for k in possible_parameter}
-        return (possible_parameter, store_variable_name | exclude_variable, dict_parameter)
-    return set(), store_variable_name | exclude_variable, {}
+    return assign_only, store_variable_name, exclude_variable, dict_parameter
+
+
+# functions assumed not to mutate their arguments
+_PURE_FUNCTIONS = {'print', 'display', 'len', 'repr', 'str', 'type', 'isinstance', 'sorted',
+                   'sum', 'min', 'max', 'abs', 'round', 'format', 'int', 'float', 'bool'}
+# functions accessing the namespace in a way the syntax does not show
+_OPAQUE_FUNCTIONS = {'exec', 'eval', 'globals', 'locals', 'vars', '__import__'}
+# magics without effect on the namespace
+_NAMESPACE_SAFE_MAGICS = {'matplotlib', 'config', 'load_ext', 'reload_ext', 'autoreload',
+                          'precision', 'env', 'pip', 'conda'}
+# effects of a code, from the weakest to the strongest
+_EFFECTS = [None, 'call', 'side_effect', 'opaque']
+
+
+def _def_use(code: str) -> tuple:
+    """
+    Names defined, possibly mutated and used by a python code (e.g. a cell transformed by ipython_to_python).
+
+    The analysis is conservative: the object of a method call and the arguments of a
+    call (except for a few builtins) are assumed to be mutated. The names bound inside
+    functions, classes, lambdas and comprehensions are local, but the names they use or
+    mutate are attributed to the code defining them. The code is opaque if the names it
+    defines or uses can not be found from its syntax (star imports, global statements, exec,
+    eval, magics other than the safe ones, ...). It has side effects if it executes a shell
+    command or a safe magic, or calls a function (except for a few builtins) as a statement,
+    i.e. for its effect (e.g. df.to_csv(path)). Otherwise the code calls functions if it calls
+    any function (except for a few builtins) or imports a module, which may read the state
+    outside the namespace (files, working directory, sys.path, random generators, ...).
+
+    Returns
+    -------
+    tuple
+        (set of defined names, set of mutated names, set of used names, set of imported
+        names, effect) where effect is None, 'call', 'side_effect' or 'opaque'.
+
+    >>> define, mutate, use, imported, effect = _def_use("b = a + 1\\nc.append(b)")
+    >>> sorted(define), sorted(mutate), sorted(use), effect
+    (['b'], ['b', 'c'], ['a', 'b', 'c'], 'side_effect')
+    >>> _def_use("b = len(a)")[4], _def_use("b = f(a)")[4]
+    (None, 'call')
+    >>> _def_use("from m import *")[4]
+    'opaque'
+    """
+    visitor = _DefUseVisitor()
+    visitor.visit(ast.parse(code))
+    return visitor.define, visitor.mutate, visitor.use, visitor.imported, visitor.effect
+
+
+def _string_value(node) -> Union[str, None]:
+    if sys.version_info < (3, 8):
+        # the strings are parsed as ast.Str
+        return node.s if isinstance(node, ast.Str) else None
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    return None
+
+
+class _DefUseVisitor(ast.NodeVisitor):
+
+    def __init__(self):
+        self.define, self.mutate, self.use, self.imported = set(), set(), set(), set()
+        self.effect = None
+        self._scope_depth = 0
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load):
+            self.use.add(node.id)
+        elif self._scope_depth == 0:
+            self.define.add(node.id)
+
+    def visit_FunctionDef(self, node):
+        if self._scope_depth == 0:
+            self.define.add(node.name)
+        self._visit_scope(node)
+
+    visit_AsyncFunctionDef = visit_ClassDef = visit_FunctionDef
+
+    def visit_Lambda(self, node):
+        self._visit_scope(node)
+
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = visit_Lambda
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            if alias.name == '*':
+                self._effect('opaque')
+            elif self._scope_depth == 0:
+                name = alias.asname or alias.name.split('.')[0]
+                self.define.add(name)
+                self.imported.add(name)
+        self._effect('call')
+
+    visit_ImportFrom = visit_Import
+
+    def visit_Global(self, node):
+        self._effect('opaque')
+
+    visit_Nonlocal = visit_Global
+
+    def visit_Attribute(self, node):
+        if not isinstance(node.ctx, ast.Load):
+            self._mutate(node)
+        self.generic_visit(node)
+
+    visit_Subscript = visit_Attribute
+
+    def visit_Expr(self, node):
+        func = node.value.func if isinstance(node.value, ast.Call) else None
+        if func is not None and not (isinstance(func, ast.Name) and func.id in _PURE_FUNCTIONS):
+            # called for its effect, which may be outside the namespace
+            self._effect('side_effect')
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        func = node.func
+        if isinstance(func, ast.Name) and func.id in _OPAQUE_FUNCTIONS:
+            self._effect('opaque')
+        elif (isinstance(func, ast.Attribute) and isinstance(func.value, ast.Call)
+                and isinstance(func.value.func, ast.Name) and func.value.func.id == 'get_ipython'):
+            magic = _string_value(node.args[0]) if node.args else None
+            if func.attr in ('system', 'getoutput') or \
+                    (func.attr == 'run_line_magic' and magic in _NAMESPACE_SAFE_MAGICS):
+                self._effect('side_effect')
+            else:
+                self._effect('opaque')
+            self.generic_visit(node)
+            return
+        if isinstance(func, ast.Attribute):
+            self._mutate(func.value)
+        if not (isinstance(func, ast.Name) and func.id in _PURE_FUNCTIONS):
+            self._effect('call')
+            for arg in node.args + [keyword.value for keyword in node.keywords]:
+                self._mutate(arg.value if isinstance(arg, ast.Starred) else arg)
+        self.generic_visit(node)
+
+    def _effect(self, effect):
+        if _EFFECTS.index(effect) > _EFFECTS.index(self.effect):
+            self.effect = effect
+
+    def _visit_scope(self, node):
+        self._scope_depth += 1
+        try:
+            self.generic_visit(node)
+        finally:
+            self._scope_depth -= 1
+
+    def _mutate(self, node):
+        while isinstance(node, (ast.Attribute, ast.Subscript)):
+            node = node.value
+        if isinstance(node, ast.Name):
+            self.mutate.add(node.id)
 
 
 def increment_name(name: str, start_marker: str = " (",
@@ -453,3 +746,188 @@ def increment_name(name: str, start_marker: str = " (",
     else:
         new_name = a+start_marker+'1'+end_marker
     return new_name
+
+
+_next_index = {}
+_next_index_lock = threading.Lock()
+
+
+def _reserve_path(path: str, start_marker: str = " (",
+                  end_marker: str = ")") -> str:
+    """
+    Reserve a free path by creating an empty file exclusively.
+
+    If the path exists, its name (without the extension) is incremented as by
+    increment_name. The folder is scanned for the highest index in use, then the next
+    index is given by a counter as long as the last path it reserved exists (otherwise
+    the files were removed and the folder is scanned again). The exclusive creation
+    makes the reservation safe when many processes write in the same folder.
+
+    Parameters
+    ----------
+    path : str
+        Preferred path.
+    start_marker : str
+        The marker used before the incremental
+    end_marker : str
+        The marker after the incremental
+
+    Returns
+    -------
+    str
+        The reserved path.
+    """
+    if _create_exclusive(path):
+        return path
+    dirname, basename = os.path.split(os.path.abspath(path))
+    root, ext = _split_ext(basename)
+    incremented = increment_name(root, start_marker, end_marker)
+    prefix = incremented[:incremented.rfind(start_marker)+len(start_marker)]
+    suffix = end_marker+ext
+    first_index = int(incremented[len(prefix):len(incremented)-len(end_marker)])
+
+    key = (dirname, prefix, suffix)
+    with _next_index_lock:
+        next_index = _next_index.get(key)
+        if next_index is not None and os.path.exists(os.path.join(dirname, prefix+str(next_index-1)+suffix)):
+            index = max(first_index, next_index)
+        else:
+            index = max(first_index, _max_index(dirname, prefix, suffix)+1)
+        while True:
+            new_path = os.path.join(dirname, prefix+str(index)+suffix)
+            index += 1
+            # a collision means that another process wrote in the folder
+            if _create_exclusive(new_path):
+                _next_index[key] = index
+                return new_path
+
+
+def _create_exclusive(path: str) -> bool:
+    try:
+        open(path, 'x').close()
+    except FileExistsError:
+        return False
+    return True
+
+
+def _max_index(dirname: str, prefix: str, suffix: str) -> int:
+    max_index = 0
+    with os.scandir(dirname) as entries:
+        for entry in entries:
+            name = entry.name
+            if name.startswith(prefix) and name.endswith(suffix) and len(name) > len(prefix)+len(suffix):
+                index = name[len(prefix):len(name)-len(suffix)]
+                if index.isdigit():
+                    max_index = max(max_index, int(index))
+    return max_index
+
+
+def _process_rss(pid) -> Union[int, None]:
+    """
+    Resident memory (in bytes) of a process or None if it is not available.
+    """
+    if pid is None:
+        return None
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    try:
+        if psutil is not None:
+            return psutil.Process(pid).memory_info().rss
+        with open('/proc/{}/status'.format(pid)) as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        return None
+    except Exception as e:
+        if psutil is not None and isinstance(e, psutil.Error):
+            return None
+        raise
+    return None
+
+
+def _process_pss(pid) -> Union[int, None]:
+    """
+    Proportional set size (in bytes) of a process, i.e. its resident memory with the pages
+    shared with other processes divided among them, or else its resident memory, or None
+    if it is not available.
+    """
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    try:
+        if psutil is not None:
+            return getattr(psutil.Process(pid).memory_full_info(), 'pss', None) or _process_rss(pid)
+        with open('/proc/{}/smaps_rollup'.format(pid)) as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    except Exception as e:
+        if psutil is None or not isinstance(e, psutil.Error):
+            raise
+    return _process_rss(pid)
+
+
+def _descendant_pids(pid, min_depth=1) -> list:
+    """
+    Process ids of the descendants (children, grandchildren, ...) of a process, starting
+    at the generation min_depth (1 for the children, 2 for the grandchildren, ...).
+    """
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        try:
+            parents = [psutil.Process(pid)]
+            for _ in range(min_depth - 1):
+                parents = [child for parent in parents for child in parent.children()]
+            return [p.pid for parent in parents for p in parent.children(recursive=True)]
+        except psutil.Error:
+            return []
+    if not os.path.isdir('/proc'):
+        return []
+    children = collections.defaultdict(list)
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/{}/stat'.format(name)) as f:
+                # the process name (in parentheses) can contain spaces
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children[ppid].append(int(name))
+    pids = []
+    stack = [(child, 1) for child in children[pid]]
+    while stack:
+        child, depth = stack.pop()
+        if depth >= min_depth:
+            pids.append(child)
+        stack.extend((grandchild, depth + 1) for grandchild in children[child])
+    return pids
+
+
+def _available_memory() -> Union[int, None]:
+    """
+    Memory (in bytes) available for new processes without swapping or None if it is not known.
+    """
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        return psutil.virtual_memory().available
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        return None
+    return None
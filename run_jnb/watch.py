@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import warnings
+
+from .core import _DEFAULT_TIMEOUT, _DEFAULT_KERNEL_NAME
+from .incremental import IncrementalSession
+
+
+def run_jnb_watch(input_path, output_path=r"///_run_jnb/*-output",
+                  execution_path=r'///input',
+                  return_mode='except',
+                  overwrite=False,
+                  timeout=_DEFAULT_TIMEOUT,
+                  kernel_name=_DEFAULT_KERNEL_NAME,
+                  ep_kwargs=None, jsonable_parameter=True, end_cell_index=None,
+                  arg=None, poll_interval=0.5, max_runs=None, kernel_pool=None,
+                  analysis_cache=None, timing=False):
+    """
+    Execute a jupyter notebook each time it (or its json argument file) changes.
+
+    The notebook is executed in an incremental session (see IncrementalSession): the
+    kernel stays alive and, after the first run, only the changed cells and the cells
+    depending on them are executed again. The analysis of the unchanged cells is cached
+    by their source, so an edit costs only the analysis of the edited cells. The files
+    are polled every poll_interval seconds and a run starts once a changed file kept the
+    same size and modification time during a poll interval (i.e. the save is finished).
+    A run failing before the execution (e.g. a notebook being saved or an unknown
+    parameter) is reported by a warning and retried at the next change.
+
+    Parameters
+    ----------
+    input_path, output_path, execution_path, return_mode, overwrite, timeout, kernel_name,
+    ep_kwargs, jsonable_parameter, end_cell_index, analysis_cache, timing :
+        See run_jnb. return_mode can not be "parametrised_only".
+    arg : str, optional
+        Path of a json file (it should end in ".json") or json formatted string used to
+        parametrise the jupyter notebook. The json file is also watched.
+    poll_interval : float, optional
+        Number of seconds between two checks of the files.
+    max_runs : int, optional
+        Stop after max_runs runs. By default the files are watched until the generator is closed.
+    kernel_pool : run_jnb.KernelPool, optional
+        See IncrementalSession.
+
+    Yields
+    ------
+    collections.namedtuple
+        Output of each run, see run_jnb.
+    """
+    paths = [input_path]
+    if isinstance(arg, str) and arg.endswith('.json'):
+        paths.append(arg)
+
+    runs = 0
+    with IncrementalSession(input_path, output_path=output_path, execution_path=execution_path,
+                            return_mode=return_mode, overwrite=overwrite, timeout=timeout,
+                            kernel_name=kernel_name, ep_kwargs=ep_kwargs,
+                            jsonable_parameter=jsonable_parameter, end_cell_index=end_cell_index,
+                            analysis_cache=analysis_cache, kernel_pool=kernel_pool,
+                            timing=timing) as session:
+        signature = _signature(paths)
+        while max_runs is None or runs < max_runs:
+            if runs > 0:
+                signature = _wait_change(paths, signature, poll_interval)
+            runs += 1
+            try:
+                res = session.run(arg=arg)
+            except Exception as e:
+                warnings.warn('The run of {} failed: {!r}'.format(input_path, e))
+                continue
+            yield res
+
+
+def _signature(paths):
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            signature.append(None)
+        else:
+            signature.append((stat.st_mtime_ns, stat.st_size))
+    return signature
+
+
+def _wait_change(paths, signature, poll_interval):
+    while True:
+        time.sleep(poll_interval)
+        current = _signature(paths)
+        if current == signature or None in current:
+            continue
+        # the editors may save a file in many writes
+        time.sleep(poll_interval)
+        if _signature(paths) == current:
+            return current
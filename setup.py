@@ -32,8 +32,8 @@ setup(
     url = 'https://github.com/hz-inova/run_jnb',
     license = 'BSD 3-clause "New" or "Revised" License',
     keywords = ['jupyter-notebook', 'execute', 'parametrise'],
-    python_requires = '>=3.5',
-    install_requires = ['nbconvert>=4.2,!=5.4'],
+    python_requires = '>=3.7',
+    install_requires = ['nbconvert>=6.0', 'nbclient>=0.5'],
     classifiers = ['Development Status :: 3 - Alpha',
                    'License :: OSI Approved :: BSD License',
                    ],